@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from stimpl.runtime import run_stimpl, run_stimpl_async
+from stimpl.test import counting_loop
+from stimpl.vm import lower
+
+"""
+Measures run_stimpl_async on a While loop for several values of
+yield_every: how much longer the run takes than a synchronous run on
+the vm engine, and the longest the event loop waited for the program
+to hand it back, which is what other tasks would wait. Both are the
+best of a few runs.
+
+Run from the stimpl directory with: python -m benchmarks.asynchronous
+"""
+
+ITERATIONS = 100000
+YIELD_EVERY = [1, 10, 100, 1000, 10000]
+REPEATS = 3
+
+
+async def run_alongside(program, yield_every):
+    start = time.perf_counter()
+    task = asyncio.ensure_future(run_stimpl_async(program, yield_every=yield_every))
+    longest = 0.0
+    last = time.perf_counter()
+    while not task.done():
+        await asyncio.sleep(0)
+        now = time.perf_counter()
+        longest = max(longest, now - last)
+        last = now
+    await task
+    return time.perf_counter() - start, longest
+
+
+if __name__ == '__main__':
+    program = lower(counting_loop(ITERATIONS))
+    synchronous = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run_stimpl(program)
+        elapsed = time.perf_counter() - start
+        synchronous = elapsed if synchronous is None else min(synchronous, elapsed)
+    print(f"synchronous: {synchronous:.4f}s, holding the event loop throughout")
+    print(f"{'yield_every':>11} {'time (s)':>9} {'overhead':>9} {'longest wait (ms)':>18}")
+    for yield_every in YIELD_EVERY:
+        runs = [asyncio.run(run_alongside(program, yield_every)) for _ in range(REPEATS)]
+        elapsed = min(elapsed for elapsed, _ in runs)
+        longest = min(longest for _, longest in runs)
+        print(f"{yield_every:>11} {elapsed:>9.4f} {elapsed / synchronous - 1:>8.1%} {longest * 1000:>18.3f}")
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+
+from stimpl.batch import run_stimpl_batch
+from stimpl.expression import *
+from stimpl.runtime import run_stimpl, EmptyState
+from stimpl.types import INTEGER
+
+"""
+Measures running one program over many inputs as a batch against
+running it once per input with the tree walker.
+
+Run from the stimpl directory with: python -m benchmarks.batch
+"""
+
+LANES = 20000
+
+
+def collatz_steps():
+    # Lanes finish after very different numbers of iterations.
+    n, steps = Variable("n"), Variable("steps")
+    return Program(
+        Assign(steps, IntLiteral(0)),
+        While(Gt(n, IntLiteral(1)), Sequence(
+            If(Eq(Subtract(n, Multiply(Divide(n, IntLiteral(2)), IntLiteral(2))), IntLiteral(0)),
+               Assign(n, Divide(n, IntLiteral(2))),
+               Assign(n, Add(Multiply(n, IntLiteral(3)), IntLiteral(1)))),
+            Assign(steps, Add(steps, IntLiteral(1))))),
+        steps)
+
+
+if __name__ == '__main__':
+    program = collatz_steps()
+    inputs = np.arange(1, LANES + 1)
+
+    start = time.perf_counter()
+    result = run_stimpl_batch(program, {"n": inputs})
+    batch_time = time.perf_counter() - start
+
+    sample = inputs[::100]
+    start = time.perf_counter()
+    for n in sample.tolist():
+        run_stimpl(program, state=EmptyState().set_value("n", n, INTEGER))
+    one_by_one = (time.perf_counter() - start) * (LANES / len(sample))
+
+    print(f"{LANES} lanes: batch {batch_time:.3f}s, one at a time ~{one_by_one:.3f}s"
+          f" (estimated from {len(sample)}), longest lane {int(result.value.max())} iterations")
@@ -0,0 +1,55 @@
+import time
+
+from stimpl.compiler import compile
+from stimpl.runtime import run_stimpl
+from stimpl.test import counting_loop
+from stimpl.transpile import transpiled
+from stimpl.vm import lower
+
+"""
+Measures what budgets cost every engine on a While loop: the run without
+a budget, with max_steps and with max_steps and max_state_bytes, and the
+overhead of each over the first. Budgets are generous enough never to
+run out, so the whole loop runs every time. The three runs take turns,
+so that a busy machine slows all of them alike.
+
+Run from the stimpl directory with: python -m benchmarks.budget
+"""
+
+ITERATIONS = 50000
+REPEATS = 10
+
+
+def best_of_each(repeat, runs):
+    best = [None] * len(runs)
+    for _ in range(repeat):
+        for index, run in enumerate(runs):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            best[index] = elapsed if best[index] is None else min(best[index], elapsed)
+    return best
+
+
+ENGINES = [
+    ("tree", lambda program: program, {}),
+    ("iterative", lambda program: program, {"engine": "iterative"}),
+    ("jit", lambda program: program, {"jit_threshold": 100}),
+    ("closure", compile, {}),
+    ("closure frame", compile, {"checked": True, "frame": True}),
+    ("vm", lower, {}),
+    ("python", transpiled, {}),
+]
+
+
+if __name__ == '__main__':
+    program = counting_loop(ITERATIONS)
+    print(f"{'engine':<14} {'none (s)':>9} {'steps (s)':>10} {'overhead':>9} {'bytes (s)':>10} {'overhead':>9}")
+    for name, prepare, options in ENGINES:
+        prepared = prepare(program)
+        plain, steps, size = best_of_each(REPEATS, [
+            lambda: run_stimpl(prepared, **options),
+            lambda: run_stimpl(prepared, max_steps=ITERATIONS, **options),
+            lambda: run_stimpl(prepared, max_steps=ITERATIONS, max_state_bytes=1 << 20, **options),
+        ])
+        print(f"{name:<14} {plain:>9.4f} {steps:>10.4f} {steps / plain - 1:>8.1%} {size:>10.4f} {size / plain - 1:>8.1%}")
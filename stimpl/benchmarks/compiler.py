@@ -0,0 +1,48 @@
+import time
+
+from stimpl.compiler import compile
+from stimpl.runtime import run_stimpl
+from stimpl.test import counting_loop
+from stimpl.vm import lower
+
+"""
+Compares the tree walker (recursive, iterative and with the tracing JIT)
+with closure-compiled programs (unchecked, checked, and checked on a slot
+frame) and the bytecode VM on a While loop. The JIT column includes
+compiling the loop only in the first of the runs it takes the best of.
+
+Run from the stimpl directory with: python -m benchmarks.compiler
+"""
+
+ITERATIONS = [1000, 10000, 50000]
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    print(f"{'iterations':>10} {'tree (s)':>10} {'iterative (s)':>14} {'jit (s)':>8} {'compile (s)':>12} {'compiled (s)':>13} {'speedup':>8} {'vm (s)':>8} {'checked (s)':>12} {'frame (s)':>10}")
+    for iterations in ITERATIONS:
+        program = counting_loop(iterations)
+        tree_time = best_of(3, lambda: run_stimpl(program))
+        iterative_time = best_of(
+            3, lambda: run_stimpl(program, engine="iterative"))
+        jit_time = best_of(
+            3, lambda: run_stimpl(program, jit_threshold=100))
+        compile_time = best_of(3, lambda: compile(program))
+        compiled = compile(program)
+        compiled_time = best_of(3, lambda: run_stimpl(compiled))
+        bytecode = lower(program)
+        vm_time = best_of(3, lambda: run_stimpl(bytecode))
+        checked_time = best_of(
+            3, lambda: run_stimpl(compiled, checked=True))
+        frame_time = best_of(
+            3, lambda: run_stimpl(compiled, checked=True, frame=True))
+        print(f"{iterations:>10} {tree_time:>10.4f} {iterative_time:>14.4f} {jit_time:>8.4f} {compile_time:>12.5f} {compiled_time:>13.4f} {tree_time / compiled_time:>7.1f}x {vm_time:>8.4f} {checked_time:>12.4f} {frame_time:>10.4f}")
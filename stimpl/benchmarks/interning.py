@@ -0,0 +1,60 @@
+import time
+import tracemalloc
+
+from stimpl.expression import *
+from stimpl.interning import Interner
+
+"""
+Measures what hash-consing saves on a large generated program with many
+repeated subtrees.
+
+Run from the stimpl directory with: python -m benchmarks.interning
+"""
+
+COPIES = 5000
+
+
+def generated_program(copies):
+    # The kind of output a program generator produces: the same few
+    # statement shapes over and over.
+    statements = []
+    for index in range(copies):
+        statements.append(Assign(Variable(f"v{index % 10}"),
+                                 Add(Multiply(Variable("x"), IntLiteral(2)), IntLiteral(index % 3))))
+        statements.append(If(Lt(Variable("x"), IntLiteral(100)),
+                             Assign(Variable("x"), Add(Variable("x"), IntLiteral(1))),
+                             Ren()))
+    return Program(Assign(Variable("x"), IntLiteral(0)), *statements)
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, memory
+
+
+if __name__ == '__main__':
+    program, plain_time, plain_memory = measure(
+        lambda: generated_program(COPIES))
+    interner = Interner()
+    interned, intern_time, _ = measure(lambda: interner.intern(program))
+    del program
+    _, _, interned_memory = measure(
+        lambda: Interner().intern(generated_program(COPIES)))
+
+    print(f"plain tree:    {plain_memory / 1024:>10.1f} KiB, built in {plain_time:.4f}s")
+    print(f"interned tree: {interned_memory / 1024:>10.1f} KiB, {len(interner)} distinct nodes, interned in {intern_time:.4f}s")
+
+    other = generated_program(COPIES)
+    start = time.perf_counter()
+    interned == other
+    structural_time = time.perf_counter() - start
+    other = interner.intern(other)
+    start = time.perf_counter()
+    interned == other
+    identity_time = time.perf_counter() - start
+    print(f"comparison:    structural {structural_time:.5f}s, interned {identity_time:.7f}s")
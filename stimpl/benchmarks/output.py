@@ -0,0 +1,47 @@
+import contextlib
+import os
+import time
+
+from stimpl.output import BufferedSink, ListSink, NullSink
+from stimpl.runtime import run_stimpl
+from stimpl.test_output import printing_loop
+
+"""
+Measures a loop that prints every iteration with each kind of output
+sink. stdout is a line-buffered file on os.devnull, like a terminal, so
+the unbuffered default makes a write system call per line.
+
+Run from the stimpl directory with: python -m benchmarks.output
+"""
+
+ITERATIONS = 20000
+REPEATS = 5
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    program = printing_loop(ITERATIONS)
+    sinks = [
+        ("stdout", lambda: None),
+        ("buffered", BufferedSink),
+        ("list", ListSink),
+        ("null", NullSink),
+    ]
+    results = []
+    with open(os.devnull, "w", buffering=1) as terminal, contextlib.redirect_stdout(terminal):
+        for name, sink in sinks:
+            for engine in ("tree", "closure"):
+                results.append((name, engine, best_of(
+                    REPEATS, lambda: run_stimpl(program, engine=engine, output=sink()))))
+    print(f"{'sink':<10} {'engine':<8} {'time (s)':>9}")
+    for name, engine, elapsed in results:
+        print(f"{name:<10} {engine:<8} {elapsed:>9.4f}")
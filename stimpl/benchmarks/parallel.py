@@ -0,0 +1,50 @@
+import os
+import pickle
+import time
+
+from stimpl.expression import *
+from stimpl.parallel import run_parallel
+from stimpl.runtime import EmptyState
+from stimpl.test import counting_loop
+from stimpl.types import INTEGER
+
+"""
+Measures how run_parallel scales with the number of workers, and what
+pickling a program and a long state costs now that neither recurses.
+
+Run from the stimpl directory with: python -m benchmarks.parallel
+"""
+
+PROGRAMS = 2000
+LOOP = 200
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    programs = [counting_loop(LOOP + index % 7) for index in range(PROGRAMS)]
+    _, serial = timed(lambda: list(run_parallel(programs, workers=1, keep_state=False)))
+    print(f"{PROGRAMS} programs, 1 worker: {serial:.3f}s")
+    workers = 2
+    while workers <= (os.cpu_count() or 1):
+        _, elapsed = timed(lambda: list(run_parallel(programs, workers=workers, keep_state=False)))
+        print(f"{PROGRAMS} programs, {workers} workers: {elapsed:.3f}s ({serial / elapsed:.2f}x)")
+        workers *= 2
+
+    state = EmptyState()
+    for index in range(100000):
+        state = state.set_value(f"v{index % 100}", index, INTEGER)
+    pickled, elapsed = timed(lambda: pickle.dumps(state))
+    _, load_time = timed(lambda: pickle.loads(pickled))
+    print(f"state of 100000 bindings: {len(pickled) / 1024:.0f} KiB, dumps {elapsed:.3f}s, loads {load_time:.3f}s")
+
+    program = counting_loop(10)
+    for _ in range(5000):
+        program = Sequence(program, Print(Add(Variable("total"), IntLiteral(1))))
+    pickled, elapsed = timed(lambda: pickle.dumps(program))
+    _, load_time = timed(lambda: pickle.loads(pickled))
+    print(f"program 5000 deep: {len(pickled) / 1024:.0f} KiB, dumps {elapsed:.3f}s, loads {load_time:.3f}s")
@@ -0,0 +1,64 @@
+import os
+import pickle
+import tempfile
+import time
+
+from stimpl.expression import *
+from stimpl.optimizer import count_nodes
+from stimpl.runtime import run_stimpl
+from stimpl.serialize import dumps, loads, load, save
+from benchmarks.interning import generated_program
+
+"""
+Measures saving and loading programs in the binary format against
+pickle: size, save and load throughput in nodes per second, and what
+lazy loading saves a run that only reaches a small part of a program.
+A lazy load only reads the pools, so its "throughput" is the time to
+open the program, not to decode it.
+
+Run from the stimpl directory with: python -m benchmarks.serialize
+"""
+
+COPIES = 5000
+REPEATS = 5
+
+
+def timed(function):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def report(name, nodes, size, save_time, load_time):
+    print(f"{name:<14} {size / 1024:>9.1f} KiB   save {nodes / save_time / 1000:>8.0f}k nodes/s"
+          f" ({save_time:.4f}s)   load {nodes / load_time / 1000:>8.0f}k nodes/s ({load_time:.4f}s)")
+
+
+if __name__ == '__main__':
+    program = generated_program(COPIES)
+    nodes = count_nodes(program)
+
+    pickled, save_time = timed(lambda: pickle.dumps(program, pickle.HIGHEST_PROTOCOL))
+    _, load_time = timed(lambda: pickle.loads(pickled))
+    report("pickle", nodes, len(pickled), save_time, load_time)
+
+    encoded, save_time = timed(lambda: dumps(program))
+    _, load_time = timed(lambda: loads(encoded))
+    report("binary", nodes, len(encoded), save_time, load_time)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.stpb")
+        _, save_time = timed(lambda: save(program, path))
+        _, lazy_time = timed(lambda: load(path))
+        report("binary (lazy)", nodes, os.path.getsize(path), save_time, lazy_time)
+
+        # The If never runs the generated program.
+        gated = Program(If(BooleanLiteral(False), program, Ren()))
+        save(gated, path)
+        _, eager_run = timed(lambda: run_stimpl(load(path, lazy=False)))
+        _, lazy_run = timed(lambda: run_stimpl(load(path)))
+        print(f"load and run, untaken branch: eager {eager_run:.4f}s, lazy {lazy_run:.5f}s")
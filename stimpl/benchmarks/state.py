@@ -0,0 +1,45 @@
+import time
+
+from stimpl.runtime import EmptyState, HashTrieState
+from stimpl.types import INTEGER
+
+"""
+Compares the linked-list State with the hash-trie State.
+
+Run from the stimpl directory with: python -m benchmarks.state
+"""
+
+SIZES = [10, 100, 1000, 5000]
+LOOKUPS = 20000
+
+
+def build(initial_state, size):
+    state = initial_state
+    for i in range(size):
+        state = state.set_value(f"v{i}", i, INTEGER)
+    return state
+
+
+def time_updates(initial_state, size):
+    start = time.perf_counter()
+    build(initial_state, size)
+    return time.perf_counter() - start
+
+
+def time_lookups(state, size):
+    # The oldest binding is the worst case for the linked list.
+    names = [f"v{i % size}" for i in range(LOOKUPS)]
+    start = time.perf_counter()
+    for name in names:
+        state.get_value(name)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(f"{'bindings':>10} {'state':>14} {'updates (s)':>12} {'lookups (s)':>12}")
+    for size in SIZES:
+        for label, initial_state in (("linked", EmptyState()), ("hash trie", HashTrieState())):
+            update_time = time_updates(initial_state, size)
+            lookup_time = time_lookups(build(initial_state, size), size)
+            print(
+                f"{size:>10} {label:>14} {update_time:>12.5f} {lookup_time:>12.5f}")
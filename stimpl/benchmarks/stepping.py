@@ -0,0 +1,48 @@
+import time
+
+from stimpl.runtime import run_stimpl
+from stimpl.stepping import Execution, loads
+from stimpl.test import counting_loop
+
+"""
+Measures stepping a While loop through Execution: how much longer the
+run takes for several values of pause_every than a synchronous run on
+the vm engine, and the size of a snapshot taken halfway through, with
+the time to write and to restore it. Times are the best of a few runs.
+
+Run from the stimpl directory with: python -m benchmarks.stepping
+"""
+
+ITERATIONS = 100000
+PAUSE_EVERY = [10, 100, 1000, 10000]
+REPEATS = 3
+
+
+def best(function):
+    elapsed = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        took = time.perf_counter() - start
+        elapsed = took if elapsed is None else min(elapsed, took)
+    return elapsed
+
+
+if __name__ == '__main__':
+    program = counting_loop(ITERATIONS)
+    synchronous = best(lambda: run_stimpl(program, engine="vm"))
+    print(f"synchronous: {synchronous:.4f}s")
+    print(f"{'pause_every':>11} {'time (s)':>9} {'overhead':>9}")
+    for pause_every in PAUSE_EVERY:
+        elapsed = best(lambda: sum(1 for _ in Execution(program).steps(pause_every)))
+        print(f"{pause_every:>11} {elapsed:>9.4f} {elapsed / synchronous - 1:>8.1%}")
+
+    for compact_every in (None, 100):
+        execution = Execution(program, compact_every=compact_every)
+        for _ in execution.steps(ITERATIONS // 2):
+            break
+        snapshot = execution.dumps()
+        writing = best(execution.dumps)
+        restoring = best(lambda: loads(snapshot))
+        print(f"snapshot halfway, compact_every={compact_every}: {len(snapshot)} bytes, "
+              f"written in {writing * 1000:.3f}ms, restored in {restoring * 1000:.3f}ms")
@@ -0,0 +1,58 @@
+import sys
+import time
+
+import stimpl.rope
+from stimpl.runtime import run_stimpl
+from stimpl.test_rope import building_loop
+
+"""
+Measures loops that build a string 10 characters at a time: 100000
+iterations appending and prepending on every engine, and then ropes
+against flat strings on the tree walker as the loop grows. Flat strings
+are what every engine used before ropes; the flat runs compact the
+state every 100 iterations, since without that every intermediate
+string stays alive and the largest of them do not fit in memory.
+
+Run from the stimpl directory with: python -m benchmarks.strings
+"""
+
+ITERATIONS = 100000
+SIZES = [10000, 20000, 40000]
+PIECE = "abcdefghij"
+
+ENGINES = [
+    ("tree", {}),
+    ("jit", {"jit_threshold": 100}),
+    ("iterative", {"engine": "iterative"}),
+    ("closure", {"engine": "closure"}),
+    ("vm", {"engine": "vm"}),
+    ("python", {"engine": "python"}),
+    ("python checked", {"engine": "python", "checked": True}),
+]
+
+
+def timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(f"{'engine':<15} {'append (s)':>11} {'prepend (s)':>12}")
+    for name, options in ENGINES:
+        append = timed(lambda: run_stimpl(building_loop(ITERATIONS, PIECE), **options))
+        prepend = timed(lambda: run_stimpl(building_loop(ITERATIONS, PIECE, prepend=True), **options))
+        print(f"{name:<15} {append:>11.3f} {prepend:>12.3f}")
+
+    print()
+    print(f"{'iterations':>10} {'ropes (s)':>10} {'flat (s)':>9}")
+    for size in SIZES:
+        program = building_loop(size, PIECE)
+        ropes = timed(lambda: run_stimpl(program, compact_every=100))
+        threshold = stimpl.rope.ROPE_THRESHOLD
+        stimpl.rope.ROPE_THRESHOLD = sys.maxsize
+        try:
+            flat = timed(lambda: run_stimpl(program, compact_every=100))
+        finally:
+            stimpl.rope.ROPE_THRESHOLD = threshold
+        print(f"{size:>10} {ropes:>10.3f} {flat:>9.3f}")
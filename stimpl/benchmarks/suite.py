@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from stimpl.compiler import compile
+from stimpl.expression import *
+from stimpl.runtime import run_stimpl, HOOKS
+from stimpl.test import counting_loop
+from stimpl.transpile import transpiled
+from stimpl.vm import lower
+
+"""
+Runs a fixed set of representative programs and reports, for each, its
+throughput in nodes per second and the peak memory a run allocates,
+then compares both with a stored baseline and flags regressions.
+
+A workload's node count is the number of nodes the tree walker evaluates
+running it (counted once, with an enter hook), so nodes per second is
+comparable across engines: it is how fast an engine gets through the
+same work. Time is the best of --repeat runs after a first, untimed
+one, in which the transpiler compiles its code; peak memory is measured in
+a separate run under tracemalloc, which would otherwise slow the timed
+ones down.
+
+The baseline is a JSON file with the figures of an earlier run for each
+engine. A workload regresses when its throughput drops, or its peak
+memory grows, by more than --tolerance (a fraction) against it; the
+command then exits with status 1. Timings are only comparable on the
+machine the baseline was saved on, so save your own before changing
+anything:
+
+    python -m benchmarks.suite --save
+    python -m benchmarks.suite
+
+Run from the stimpl directory with: python -m benchmarks.suite
+"""
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+REPEATS = 5
+TOLERANCE = 0.25
+
+
+def while_loop():
+    # Sums the integers below a limit.
+    return counting_loop(20000)
+
+
+def if_chain():
+    # Classifies i mod 32 by falling through a chain of 32 Ifs.
+    i, k, hits = Variable("i"), Variable("k"), Variable("hits")
+    chain = Assign(hits, Add(hits, IntLiteral(32)))
+    for bound in reversed(range(32)):
+        chain = If(Lt(k, IntLiteral(bound)), Assign(hits, Add(hits, IntLiteral(bound))), chain)
+    return Program(
+        Assign(i, IntLiteral(0)),
+        Assign(hits, IntLiteral(0)),
+        While(Lt(i, IntLiteral(1000)), Sequence(
+            Assign(k, Subtract(i, Multiply(Divide(i, IntLiteral(32)), IntLiteral(32)))),
+            chain,
+            Assign(i, Add(i, IntLiteral(1))))),
+        hits)
+
+
+def long_sequence():
+    # Straight-line code: one Sequence of 4000 small statements.
+    x = Variable("x")
+    statements = []
+    for index in range(2000):
+        statements.append(Assign(x, Add(Multiply(x, IntLiteral(3)), IntLiteral(index % 7))))
+        statements.append(Assign(x, Subtract(x, Multiply(Divide(x, IntLiteral(1000)), IntLiteral(1000)))))
+    return Program(Assign(x, IntLiteral(1)), Sequence(*statements), x)
+
+
+def string_building():
+    # Appends to a string one character at a time.
+    i, text = Variable("i"), Variable("text")
+    return Program(
+        Assign(i, IntLiteral(0)),
+        Assign(text, StringLiteral("")),
+        While(Lt(i, IntLiteral(5000)), Sequence(
+            Assign(text, Add(text, StringLiteral("x"))),
+            Assign(i, Add(i, IntLiteral(1))))),
+        text)
+
+
+def float_arithmetic():
+    # Iterates x <- 3.7 * x * (1 - x), the logistic map. The rate is a
+    # literal: a variable bound before the loop would be looked up behind
+    # every binding the loop makes, which many_variables measures.
+    i, x = Variable("i"), Variable("x")
+    return Program(
+        Assign(i, IntLiteral(0)),
+        Assign(x, FloatingPointLiteral(0.5)),
+        While(Lt(i, IntLiteral(10000)), Sequence(
+            Assign(x, Multiply(Multiply(FloatingPointLiteral(3.7), x), Subtract(FloatingPointLiteral(1.0), x))),
+            Assign(i, Add(i, IntLiteral(1))))),
+        x)
+
+
+def many_variables():
+    # Binds 2000 variables, then adds them all up, oldest first: the
+    # lookups a long state makes slow.
+    count = 2000
+    total = Variable("total")
+    statements = [Assign(Variable(f"v{index}"), IntLiteral(index)) for index in range(count)]
+    statements.append(Assign(total, IntLiteral(0)))
+    statements += [Assign(total, Add(total, Variable(f"v{index}"))) for index in range(count)]
+    return Program(*statements, total)
+
+
+WORKLOADS = {
+    "while_loop": while_loop,
+    "if_chain": if_chain,
+    "long_sequence": long_sequence,
+    "string_building": string_building,
+    "float_arithmetic": float_arithmetic,
+    "many_variables": many_variables,
+}
+
+PREPARE = {
+    "tree": lambda program: program,
+    "iterative": lambda program: program,
+    "closure": compile,
+    "vm": lower,
+    "python": transpiled,
+}
+
+
+def count_nodes(program):
+    nodes = [0]
+
+    def entered(node, state):
+        nodes[0] += 1
+    with HOOKS.installed("enter", entered):
+        run_stimpl(program)
+    return nodes[0]
+
+
+def measure(program, engine, repeat):
+    """
+    The throughput (nodes per second) and peak memory (bytes) of running
+    program with engine.
+    """
+    nodes = count_nodes(program)
+    prepared = PREPARE[engine](program)
+    engine_option = {"engine": "iterative"} if engine == "iterative" else {}
+    run_stimpl(prepared, **engine_option)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_stimpl(prepared, **engine_option)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    run_stimpl(prepared, **engine_option)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"nodes": nodes, "seconds": best, "nodes_per_sec": nodes / best, "peak_bytes": peak}
+
+
+def regressions(result, baseline, tolerance):
+    """
+    What got worse than baseline by more than tolerance, as a list of
+    descriptions.
+    """
+    found = []
+    if result["nodes_per_sec"] < baseline["nodes_per_sec"] * (1 - tolerance):
+        found.append(f"throughput {result['nodes_per_sec'] / baseline['nodes_per_sec'] - 1:+.1%}")
+    if result["peak_bytes"] > baseline["peak_bytes"] * (1 + tolerance):
+        found.append(f"peak memory {result['peak_bytes'] / baseline['peak_bytes'] - 1:+.1%}")
+    return found
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, baseline):
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite",
+                                     description="Benchmarks the interpreter against a stored baseline.")
+    parser.add_argument("workloads", nargs="*", metavar="workload",
+                        help=f"workloads to run (default: all of {', '.join(WORKLOADS)})")
+    parser.add_argument("--engine", choices=list(PREPARE), default="tree")
+    parser.add_argument("--repeat", type=int, default=REPEATS)
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="fraction a figure may get worse by before it is flagged (default: %(default)s)")
+    parser.add_argument("--save", action="store_true", help="store this run's figures as the baseline")
+    options = parser.parse_args(arguments)
+    for name in options.workloads:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload {name!r}; expected one of {', '.join(WORKLOADS)}")
+
+    # The if chain nests 32 deep; leave the tree walker room to spare.
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    baseline = load_baseline(options.baseline)
+    engine_baseline = baseline.get(options.engine, {})
+    results = {}
+    regressed = []
+    print(f"{'workload':<18} {'nodes':>9} {'time (s)':>9} {'nodes/s':>11} {'vs base':>8} {'peak KiB':>10} {'vs base':>8}")
+    for name in options.workloads or WORKLOADS:
+        result = measure(WORKLOADS[name](), options.engine, options.repeat)
+        previous = engine_baseline.get(name)
+        speed_change = memory_change = ""
+        if previous is not None:
+            speed_change = f"{result['nodes_per_sec'] / previous['nodes_per_sec'] - 1:+.1%}"
+            memory_change = f"{result['peak_bytes'] / previous['peak_bytes'] - 1:+.1%}" if previous["peak_bytes"] else ""
+            for regression in regressions(result, previous, options.tolerance):
+                regressed.append(f"{name}: {regression}")
+        print(f"{name:<18} {result['nodes']:>9} {result['seconds']:>9.4f} {result['nodes_per_sec']:>11.0f} "
+              f"{speed_change:>8} {result['peak_bytes'] / 1024:>10.1f} {memory_change:>8}")
+        results[name] = result
+
+    if options.save:
+        baseline[options.engine] = {**engine_baseline, **results}
+        save_baseline(options.baseline, baseline)
+        print(f"\nSaved the baseline for the {options.engine} engine to {options.baseline}.")
+        return 0
+    if not engine_baseline:
+        print(f"\nNo baseline for the {options.engine} engine in {options.baseline}; store one with --save.")
+        return 0
+    if regressed:
+        print(f"\nRegressions beyond {options.tolerance:.0%} against {options.baseline}:")
+        for regression in regressed:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNo regressions beyond {options.tolerance:.0%}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
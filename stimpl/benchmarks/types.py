@@ -0,0 +1,70 @@
+import time
+
+from stimpl.expression import *
+from stimpl.runtime import run_stimpl
+from stimpl.types import INTEGER
+
+"""
+Measures what singleton types save on arithmetic.
+
+Before types were singletons every operator allocated a fresh Integer()
+for its result and compared operand types with an __eq__ that ran a
+match statement. The first half reproduces that comparison next to the
+identity comparison the types use now; the second half times the tree
+walker on an arithmetic-heavy loop.
+
+Run from the stimpl directory with: python -m benchmarks.types
+"""
+
+OPERATIONS = 1000000
+ITERATIONS = 20000
+
+
+class MatchInteger(object):
+    """
+    A type as it used to be: a fresh object per use, compared by match.
+    """
+
+    def __eq__(self, other):
+        match other:
+            case MatchInteger():
+                return True
+            case _:
+                return False
+
+
+def time_comparisons():
+    start = time.perf_counter()
+    for _ in range(OPERATIONS):
+        MatchInteger() != MatchInteger()
+    allocating = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(OPERATIONS):
+        INTEGER != INTEGER
+    singleton = time.perf_counter() - start
+    return allocating, singleton
+
+
+def arithmetic_loop(iterations):
+    i, total = Variable("i"), Variable("total")
+    return Program(
+        Assign(i, IntLiteral(0)),
+        Assign(total, IntLiteral(0)),
+        While(Lt(i, IntLiteral(iterations)), Sequence(
+            Assign(total, Add(total, Divide(Multiply(i, IntLiteral(3)), IntLiteral(2)))),
+            Assign(total, Subtract(total, i)),
+            Assign(i, Add(i, IntLiteral(1))))),
+        total)
+
+
+if __name__ == '__main__':
+    allocating, singleton = time_comparisons()
+    print(f"{OPERATIONS} type comparisons:")
+    print(f"  allocate + match __eq__: {allocating:.4f}s")
+    print(f"  singleton identity:      {singleton:.4f}s ({allocating / singleton:.1f}x)")
+
+    program = arithmetic_loop(ITERATIONS)
+    start = time.perf_counter()
+    run_stimpl(program)
+    print(f"tree walker, {ITERATIONS} iterations of 7 operators: {time.perf_counter() - start:.4f}s")
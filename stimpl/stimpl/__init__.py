@@ -1,6 +1,14 @@
+from stimpl.compiler import *
 from stimpl.errors import *
 from stimpl.expression import *
+from stimpl.frame import *
+from stimpl.hamt import *
+from stimpl.interning import *
+from stimpl.operations import *
+from stimpl.optimizer import *
 from stimpl.runtime import *
 from stimpl.robustness import *
 from stimpl.test import *
-from stimpl.types import *
\ No newline at end of file
+from stimpl.typecheck import *
+from stimpl.types import *
+from stimpl.vm import *
\ No newline at end of file
@@ -0,0 +1,411 @@
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.runtime import Budget
+from stimpl.typecheck import check
+
+"""
+Running one program over many input states at once.
+
+run_stimpl_batch() evaluates a program over lanes: lane i starts from
+the bindings inputs[name][i], and ends exactly where run_stimpl would
+end starting from those bindings. Every value is a NumPy column with one
+entry per lane, so an operator is one array operation however many
+lanes there are.
+
+Control flow runs under a mask of the lanes that reach it. An If runs
+each branch for the lanes whose condition picks it (and not at all when
+no lane does) and merges the results; a While keeps running its body for
+the lanes whose condition still holds until none is left. Assignments
+only change the lanes that make them.
+
+Types are per column, not per lane: a program whose lanes would give
+one variable (or the value of one If that is used) different types
+raises InterpTypeError, which is the only way a batch can differ from
+running its lanes one by one.
+Integer columns are int64 and switch to exact Python ints (an object
+column) as soon as a result would overflow, so Integer arithmetic and
+floor division are exactly STIMPL's. Errors that only some lanes run
+into -- dividing by zero, reading a variable they never assigned --
+name those lanes in the message and in the error's lanes attribute.
+With max_steps each lane has a step budget of its own, charged for
+every run of a While body the lane takes, as run_stimpl's max_steps
+charges one run. With short_circuit an And or Or runs its right operand
+only for the lanes its left operand does not decide.
+
+Like the closure compiler, evaluation recurses on the depth of the
+program.
+"""
+
+_INT64 = np.iinfo(np.int64)
+# Products of int64s below this in magnitude cannot overflow.
+_SAFE_FACTOR = 3037000499
+_LANES_SHOWN = 10
+
+
+class BatchResult(object):
+    """
+    What a batch run computed. value is the program's value in every
+    lane and type its type; variables maps every variable a lane bound
+    to (column, type, bound), where bound masks the lanes that bound it;
+    outputs holds one (column, type, lanes) entry per Print that ran,
+    with lanes masking the lanes that printed.
+    """
+
+    def __init__(self, value: np.ndarray, value_type: Type,
+                 variables: Dict[str, Tuple[np.ndarray, Type, np.ndarray]],
+                 outputs: List[Tuple[np.ndarray, Type, np.ndarray]]) -> None:
+        self.value = value
+        self.type = value_type
+        self.variables = variables
+        self.outputs = outputs
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def lane(self, index: int) -> Tuple[Any, Type, Dict[str, Tuple[Any, Type]]]:
+        """
+        The value, type and final bindings of one lane, as Python values.
+        """
+        bindings = {name: (_python(column[index]), column_type)
+                    for name, (column, column_type, bound) in self.variables.items()
+                    if bound[index]}
+        return (_python(self.value[index]), self.type, bindings)
+
+    def output(self, index: int) -> str:
+        """
+        Everything one lane printed, as run_stimpl would print it.
+        """
+        lines = []
+        for column, column_type, lanes in self.outputs:
+            if lanes[index]:
+                lines.append("Unit\n" if column_type is UNIT
+                             else f"{_python(column[index])}\n")
+        return "".join(lines)
+
+
+def run_stimpl_batch(program: Expr, inputs: Mapping[str, Any],
+                     lanes: Optional[int] = None, max_steps: Optional[int] = None,
+                     short_circuit: bool = False) -> BatchResult:
+    """
+    Runs program once per lane. inputs maps variable names to columns
+    (anything np.asarray accepts) of equal length; lanes gives the
+    number of lanes when there are no inputs. A column's type comes from
+    its dtype: integers, floats, bools, and strings (a str dtype or an
+    object column of str) are Integer, FloatingPoint, Boolean and String.
+    A lane that would take more than max_steps steps raises
+    InterpResourceError. short_circuit is run_stimpl's option of that
+    name.
+    """
+    if max_steps is not None and max_steps < 0:
+        raise ValueError("max_steps must not be negative.")
+    if short_circuit:
+        check(program).verify()
+    variables: Dict[str, list] = {}
+    for name, column in inputs.items():
+        column, column_type = _input_column(name, column)
+        if lanes is None:
+            lanes = len(column)
+        elif len(column) != lanes:
+            raise ValueError(
+                f"Input {name!r} has {len(column)} lanes; expected {lanes}.")
+        variables[name] = [column, column_type, np.ones(lanes, dtype=bool)]
+    if lanes is None:
+        raise ValueError("Give the number of lanes when there are no inputs.")
+    if lanes < 1:
+        raise ValueError("A batch needs at least one lane.")
+
+    batch = _Batch(lanes, variables, max_steps, short_circuit)
+    with np.errstate(all="ignore"):
+        value, value_type = batch.evaluate(program, np.ones(lanes, dtype=bool))
+    temporaries = temporary_names(program)
+    return BatchResult(value, value_type,
+                       {name: tuple(binding) for name, binding in batch.variables.items()
+                        if name not in temporaries},
+                       batch.outputs)
+
+
+def _input_column(name: str, column: Any) -> Tuple[np.ndarray, Type]:
+    column = np.asarray(column)
+    if column.ndim != 1:
+        raise ValueError(f"Input {name!r} must be one-dimensional.")
+    match column.dtype.kind:
+        case "b":
+            return (column, BOOLEAN)
+        case "i":
+            return (column.astype(np.int64), INTEGER)
+        case "u":
+            if len(column) and column.max() > _INT64.max:
+                return (column.astype(object), INTEGER)
+            return (column.astype(np.int64), INTEGER)
+        case "f":
+            return (column.astype(np.float64), FLOATING_POINT)
+        case "U":
+            return (column.astype(object), STRING)
+        case "O":
+            kinds = {type(value) for value in column}
+            if kinds == {int}:
+                return (column, INTEGER)
+            if kinds <= {str}:
+                return (column, STRING)
+    raise ValueError(f"Input {name!r} has no STIMPL type ({column.dtype}).")
+
+
+def _python(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _in_lanes(error: InterpError, lanes: np.ndarray) -> InterpError:
+    """
+    error, saying which lanes raised it.
+    """
+    indices = np.flatnonzero(lanes).tolist()
+    shown = ", ".join(str(index) for index in indices[:_LANES_SHOWN])
+    if len(indices) > _LANES_SHOWN:
+        shown += f" and {len(indices) - _LANES_SHOWN} more"
+    lane_error = type(error)(f"{error} (lanes {shown})")
+    lane_error.lanes = indices
+    return lane_error
+
+
+def _mixed_types(what: str, first: Type, second: Type) -> InterpTypeError:
+    return InterpTypeError(
+        f"Lanes disagree on the type of {what} ({first} and {second}); a batch needs one type per value.")
+
+
+class _Mixed(object):
+    """
+    The type of an If whose lanes took branches of different types. It is
+    fine as long as nothing uses the value, as with an If that is not the
+    last statement of a Sequence.
+    """
+
+    def __init__(self, first: Any, second: Any) -> None:
+        self.first = first
+        self.second = second
+
+    def __repr__(self) -> str:
+        return f"{self.first}/{self.second}"
+
+
+def _overflows(expression_class: type, left: np.ndarray, right: np.ndarray,
+               result: np.ndarray) -> np.ndarray:
+    if expression_class is Add:
+        return ((left ^ result) & (right ^ result)) < 0
+    if expression_class is Subtract:
+        return ((left ^ right) & (left ^ result)) < 0
+    if expression_class is Multiply:
+        return ((left > _SAFE_FACTOR) | (left < -_SAFE_FACTOR)
+                | (right > _SAFE_FACTOR) | (right < -_SAFE_FACTOR))
+    # Divide: the one quotient that does not fit.
+    return (left == _INT64.min) & (right == -1)
+
+
+_FUNCTIONS = {
+    Add: np.add, Subtract: np.subtract, Multiply: np.multiply,
+    And: np.logical_and, Or: np.logical_or,
+    Lt: np.less, Lte: np.less_equal, Gt: np.greater, Gte: np.greater_equal,
+    Eq: np.equal, Ne: np.not_equal,
+}
+
+
+class _Batch(object):
+    def __init__(self, lanes: int, variables: Dict[str, list], max_steps: Optional[int] = None,
+                 short_circuit: bool = False) -> None:
+        self.lanes = lanes
+        # name -> [column, type, mask of the lanes that bound it]
+        self.variables = variables
+        self.outputs: List[Tuple[np.ndarray, Type, np.ndarray]] = []
+        self.max_steps = max_steps
+        # The steps each lane has left, when there is a budget.
+        self.steps = self.constant(max_steps, np.int64) if max_steps is not None else None
+        self.short_circuit = short_circuit
+
+    def step(self, running: np.ndarray) -> None:
+        """
+        Charges one step to every running lane, before it runs a While
+        body.
+        """
+        if self.steps is None:
+            return
+        exhausted = running & (self.steps <= 0)
+        if exhausted.any():
+            raise _in_lanes(Budget(self.max_steps).out_of_steps(), exhausted)
+        self.steps -= running
+
+    def constant(self, value: Any, dtype: Any) -> np.ndarray:
+        return np.full(self.lanes, value, dtype=dtype)
+
+    def evaluate(self, expression: Expr, active: np.ndarray) -> Tuple[np.ndarray, Type]:
+        """
+        The value of expression in every lane; only the entries of the
+        active lanes mean anything.
+        """
+        value, value_type = self.statement(expression, active)
+        if type(value_type) is _Mixed:
+            raise _mixed_types("an If", value_type.first, value_type.second)
+        return (value, value_type)
+
+    def statement(self, expression: Expr, active: np.ndarray) -> Tuple[np.ndarray, Any]:
+        """
+        Like evaluate, for an expression whose value may go unused: the
+        type is a _Mixed when the lanes do not agree on it.
+        """
+        match expression:
+            case Ren():
+                return (self.constant(None, object), UNIT)
+
+            case IntLiteral(literal=l):
+                fits = _INT64.min <= l <= _INT64.max
+                return (self.constant(l, np.int64 if fits else object), INTEGER)
+
+            case FloatingPointLiteral(literal=l):
+                return (self.constant(l, np.float64), FLOATING_POINT)
+
+            case StringLiteral(literal=l):
+                return (self.constant(l, object), STRING)
+
+            case BooleanLiteral(literal=l):
+                return (self.constant(l, bool), BOOLEAN)
+
+            case Print(to_print=to_print):
+                value, value_type = self.evaluate(to_print, active)
+                self.outputs.append((value, value_type, active))
+                return (value, value_type)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                result = (self.constant(None, object), UNIT)
+                for expr in exprs:
+                    result = self.statement(expr, active)
+                return result
+
+            case Variable(variable_name=variable_name):
+                binding = self.variables.get(variable_name)
+                unbound = active if binding is None else active & ~binding[2]
+                if unbound.any():
+                    raise _in_lanes(unassigned_error(variable_name), unbound)
+                return (binding[0], binding[1])
+
+            case Assign(variable=variable, value=value):
+                value, value_type = self.evaluate(value, active)
+                self.assign(variable.variable_name, value, value_type, active)
+                return (value, value_type)
+
+            case Not(expr=expr):
+                value, value_type = self.evaluate(expr, active)
+                if value_type is not BOOLEAN:
+                    raise InterpTypeError(
+                        "Cannot perform logical not on non-boolean operand.")
+                return (~value, BOOLEAN)
+
+            case And(left=left, right=right) | Or(left=left, right=right) if self.short_circuit:
+                left_value, left_type = self.evaluate(left, active)
+                if left_type is not BOOLEAN:
+                    right_value, right_type = self.evaluate(right, active)
+                    return self.apply(type(expression), left_value, left_type,
+                                      right_value, right_type, active)
+                # The lanes whose left operand is False for And, True for Or.
+                decided = active & (left_value if type(expression) is Or else ~left_value)
+                undecided = active & ~decided
+                if not undecided.any():
+                    return (left_value, BOOLEAN)
+                right_value, right_type = self.evaluate(right, undecided)
+                value, value_type = self.apply(type(expression), left_value, left_type,
+                                               right_value, right_type, undecided)
+                return (np.where(decided, left_value, value), value_type)
+
+            case BinaryOperator(left=left, right=right) if type(expression) in BINARY_OPERATIONS:
+                left_value, left_type = self.evaluate(left, active)
+                right_value, right_type = self.evaluate(right, active)
+                return self.apply(type(expression), left_value, left_type,
+                                  right_value, right_type, active)
+
+            case If(condition=condition, true=true, false=false):
+                value, value_type = self.evaluate(condition, active)
+                if value_type is not BOOLEAN:
+                    raise condition_error("if")
+                true_lanes = active & value
+                false_lanes = active & ~value
+                if not false_lanes.any():
+                    return self.statement(true, true_lanes)
+                if not true_lanes.any():
+                    return self.statement(false, false_lanes)
+                true_value, true_type = self.statement(true, true_lanes)
+                false_value, false_type = self.statement(false, false_lanes)
+                if true_type is not false_type:
+                    return (true_value, _Mixed(true_type, false_type))
+                return (np.where(value, true_value, false_value), true_type)
+
+            case While(condition=condition, body=body):
+                value, value_type = self.evaluate(condition, active)
+                if value_type is not BOOLEAN:
+                    raise condition_error("while")
+                running = active & value
+                while running.any():
+                    self.step(running)
+                    self.statement(body, running)
+                    value, _ = self.evaluate(condition, running)
+                    running = running & value
+                return (self.constant(False, bool), BOOLEAN)
+
+            case _:
+                raise InterpSyntaxError("Unhandled!")
+
+    def assign(self, variable_name: str, value: np.ndarray, value_type: Type,
+               active: np.ndarray) -> None:
+        binding = self.variables.get(variable_name)
+        if binding is None:
+            self.variables[variable_name] = [value, value_type, active]
+            return
+        column, column_type, bound = binding
+        if column_type is not value_type:
+            if (active & bound).any():
+                raise assignment_error(value_type, column_type)
+            raise _mixed_types(variable_name, column_type, value_type)
+        if active.all():
+            self.variables[variable_name] = [value, value_type, active]
+        else:
+            self.variables[variable_name] = [
+                np.where(active, value, column), value_type, bound | active]
+
+    def apply(self, expression_class: type, left: np.ndarray, left_type: Type,
+              right: np.ndarray, right_type: Type, active: np.ndarray) -> Tuple[np.ndarray, Type]:
+        operation = BINARY_OPERATIONS[expression_class]
+        if left_type is not right_type:
+            raise operation.mismatch_error(left_type, right_type)
+
+        if expression_class is Divide:
+            # As in the tree walker, the zero check comes first.
+            if left_type is not STRING and left_type is not UNIT:
+                zero = active & (right == 0)
+                if zero.any():
+                    raise _in_lanes(InterpMathError("Division by zero."), zero)
+            if left_type is FLOATING_POINT:
+                return (left / np.where(right == 0, 1.0, right), left_type)
+            if left_type is not INTEGER:
+                raise operation.unsupported_error(left_type)
+            right = np.where(right == 0, 1, right)
+            function = np.floor_divide
+        else:
+            if operation.is_comparison and left_type is UNIT:
+                return (self.constant(operation.unit_result, bool), BOOLEAN)
+            if type(left_type) not in operation.types:
+                raise operation.unsupported_error(left_type)
+            function = _FUNCTIONS[expression_class]
+
+        if left_type is INTEGER and not operation.is_comparison \
+                and left.dtype != object and right.dtype != object:
+            result = function(left, right)
+            if not (_overflows(expression_class, left, right, result) & active).any():
+                return (result, left_type)
+            left = left.astype(object)
+            right = right.astype(object)
+        result = function(left, right)
+        if operation.is_comparison and result.dtype != bool:
+            result = result.astype(bool)
+        return (result, operation.result_type(left_type))
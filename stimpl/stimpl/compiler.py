@@ -0,0 +1,530 @@
+import copy
+from itertools import repeat
+from operator import length_hint
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.runtime import State, RunOptions, DEFAULT_OPTIONS, Budget
+from stimpl.typecheck import TypeReport, check
+from stimpl.frame import Frame, resolve_slots, load_frame, store_frame
+from stimpl.rope import concat
+
+"""
+Closure compilation.
+
+compile() walks an Expr tree once and turns every node into a Python
+closure that already knows its children and its operator, so running
+the program no longer re-dispatches on the node class (or on operand
+types it has already looked up) every time a node is evaluated.
+
+A compiled node is a function from a State to a (value, type, State)
+triple, exactly like evaluate(node, state).
+
+With the checked option the program is type checked first, and every
+node whose operand types the checker proved gets a closure without any
+type comparisons. With the short_circuit option And and Or compile to
+closures that only run their right operand when they have to. With the frame option the closures thread a
+slot-indexed Frame (see stimpl.frame) instead of a State. A run with a
+budget (see stimpl.runtime.Budget) gets closures of its own whose While
+loops charge it.
+"""
+
+# compile is left out so that the package's star import does not hide
+# the builtin of that name; it is stimpl.compiler.compile.
+__all__ = ['Code', 'CompiledProgram']
+
+Code = Callable[[State], Tuple[Any, Type, State]]
+
+
+class CompiledProgram(object):
+    """
+    A program compiled to closures. Execution options are baked into the
+    closures, so one closure tree is built (lazily) per distinct set of
+    options and then reused by every run with those options.
+    """
+
+    def __init__(self, program: Expr) -> None:
+        self.program = program
+        self.type_report: Optional[TypeReport] = None
+        self.slots = resolve_slots(program)
+        self.temporaries = temporary_names(program)
+        self._variants: Dict[tuple, Code] = {}
+        self.code = self.variant(DEFAULT_OPTIONS)
+
+    def variant(self, options: RunOptions) -> Code:
+        key = _options_key(options)
+        # A budget belongs to one run, and so do closures charging it.
+        code = self._variants.get(key) if options.budget is None else None
+        if code is None:
+            types = None
+            if options.checked or options.short_circuit:
+                if self.type_report is None:
+                    self.type_report = check(self.program)
+                if options.short_circuit:
+                    self.type_report.verify()
+                if options.checked:
+                    types = self.type_report
+            slots = self.slots if options.frame else None
+            code = _Compiler(options, types, slots).compile(self.program)
+            if options.budget is None:
+                self._variants[key] = code
+        return code
+
+    def execute(self, state: State, options: RunOptions = DEFAULT_OPTIONS) -> Tuple[Any, Type, State]:
+        if options.checked:
+            if self.type_report is None:
+                self.type_report = check(self.program)
+            if not self.type_report.fits(state):
+                # What the checker proved does not hold from this state.
+                options = copy.copy(options)
+                options.checked = False
+        code = self.variant(options)
+        if options.frame:
+            value, value_type, frame = code(load_frame(self.slots, state))
+            return (value, value_type, store_frame(self.slots, frame, state))
+        return code(state)
+
+    def __repr__(self) -> str:
+        return f"compiled {self.program}"
+
+
+def compile(program: Expr) -> CompiledProgram:
+    """
+    Compiles program once so that run_stimpl can execute it many times.
+    """
+    return CompiledProgram(program)
+
+
+def _options_key(options: RunOptions) -> tuple:
+    if options.frame:
+        # Frames never grow, so there is nothing to compact.
+        return (None, options.checked, True, options.short_circuit)
+    return (options.compact_every, options.checked, False, options.short_circuit)
+
+
+class _Compiler(object):
+    def __init__(self, options: RunOptions, types: Optional[TypeReport] = None,
+                 slots: Optional[Dict[str, int]] = None) -> None:
+        self.options = options
+        self.types = types
+        self.slots = slots
+        # While loops compiled so far.
+        self.loops = 0
+
+    def static_type(self, expression: Expr) -> Optional[Type]:
+        """
+        The type the checker proved expression has, if any.
+        """
+        if self.types is None:
+            return None
+        return self.types.type_of(expression)
+
+    def compile(self, expression: Expr) -> Code:
+        match expression:
+            case Ren():
+                return _constant(None, UNIT)
+
+            case IntLiteral(literal=l):
+                return _constant(l, INTEGER)
+
+            case FloatingPointLiteral(literal=l):
+                return _constant(l, FLOATING_POINT)
+
+            case StringLiteral(literal=l):
+                return _constant(l, STRING)
+
+            case BooleanLiteral(literal=l):
+                return _constant(l, BOOLEAN)
+
+            case Print(to_print=to_print):
+                return _print(self.compile(to_print))
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                return _sequence(tuple(self.compile(expr) for expr in exprs))
+
+            case Variable(variable_name=variable_name):
+                if self.slots is not None:
+                    return _frame_variable(variable_name, self.slots[variable_name])
+                return _variable(variable_name)
+
+            case Assign(variable=variable, value=value):
+                variable_name = variable.variable_name
+                # Every assignment to a proved variable assigns its type.
+                proved = self.types is not None and self.types.variable_type(
+                    variable_name) is not None
+                if self.slots is not None:
+                    slot = self.slots[variable_name]
+                    if proved:
+                        return _unchecked_frame_assign(slot, self.compile(value))
+                    return _frame_assign(slot, self.compile(value))
+                if proved:
+                    return _unchecked_assign(variable_name, self.compile(value))
+                return _assign(variable_name, self.compile(value))
+
+            case Divide(left=left, right=right):
+                operand_type = self.static_type(left)
+                if BINARY_OPERATIONS[Divide].proves(operand_type, self.static_type(right)):
+                    return _unchecked_divide(operand_type, self.compile(left), self.compile(right))
+                return _divide(BINARY_OPERATIONS[Divide], self.compile(left), self.compile(right))
+
+            case And(left=left, right=right) | Or(left=left, right=right) if self.options.short_circuit:
+                proved = self.static_type(left) is BOOLEAN and self.static_type(right) is BOOLEAN
+                return _short_circuit(BINARY_OPERATIONS[type(expression)], isinstance(expression, Or),
+                                      self.compile(left), self.compile(right), not proved)
+
+            case BinaryOperator(left=left, right=right) if type(expression) in BINARY_OPERATIONS:
+                operation = BINARY_OPERATIONS[type(expression)]
+                operand_type = self.static_type(left)
+                if operation.proves(operand_type, self.static_type(right)):
+                    if operation.is_comparison and type(operand_type) is Unit:
+                        return _unit_comparison(operation.unit_result, self.compile(left), self.compile(right))
+                    function = concat if type(expression) is Add and type(operand_type) is String \
+                        else operation.function
+                    return _unchecked_binary(function, operation.result_type(operand_type),
+                                             self.compile(left), self.compile(right))
+                if type(expression) is Add:
+                    return _add(operation, self.compile(left), self.compile(right))
+                return _binary(operation, self.compile(left), self.compile(right))
+
+            case Not(expr=expr):
+                if self.static_type(expr) is BOOLEAN:
+                    return _unchecked_not(self.compile(expr))
+                return _not(self.compile(expr))
+
+            case If(condition=condition, true=true, false=false):
+                return _if(self.compile(condition), self.compile(true), self.compile(false),
+                           self.static_type(condition) is not BOOLEAN)
+
+            case While(condition=condition, body=body):
+                compact_every = None if self.slots is not None else self.options.compact_every
+                budget = self.options.budget
+                loops = self.loops
+                condition_code, body_code = self.compile(condition), self.compile(body)
+                innermost = self.loops == loops
+                self.loops += 1
+                check_condition = self.static_type(condition) is not BOOLEAN
+                if budget is not None:
+                    if innermost and budget.max_state_bytes is None and not compact_every:
+                        return _counted_while(condition_code, body_code, budget, check_condition)
+                    return _budgeted_while(condition_code, body_code, compact_every, budget, check_condition)
+                return _while(condition_code, body_code, compact_every, check_condition)
+
+            case _:
+                return _unhandled()
+
+
+def _constant(value: Any, value_type: Type) -> Code:
+    def constant(state):
+        return (value, value_type, state)
+    return constant
+
+
+def _unhandled() -> Code:
+    # The tree walker only complains once it reaches the node.
+    def unhandled(state):
+        raise InterpSyntaxError("Unhandled!")
+    return unhandled
+
+
+def _print(to_print: Code) -> Code:
+    def print_(state):
+        value, value_type, state = to_print(state)
+        print_value(value, value_type)
+        return (value, value_type, state)
+    return print_
+
+
+def _sequence(exprs: Tuple[Code, ...]) -> Code:
+    if len(exprs) == 0:
+        return _constant(None, UNIT)
+    if len(exprs) == 1:
+        return exprs[0]
+
+    def sequence(state):
+        for expr in exprs:
+            value, value_type, state = expr(state)
+        return (value, value_type, state)
+    return sequence
+
+
+def _variable(variable_name: str) -> Code:
+    def variable(state):
+        value = state.get_value(variable_name)
+        if value is None:
+            raise unassigned_error(variable_name)
+        return (value[0], value[1], state)
+    return variable
+
+
+def _assign(variable_name: str, value: Code) -> Code:
+    def assign(state):
+        value_result, value_type, state = value(state)
+        existing = state.get_value(variable_name)
+        if existing is not None and type(existing[1]) is not type(value_type):
+            raise assignment_error(value_type, existing[1])
+        return (value_result, value_type, state.set_value(variable_name, value_result, value_type))
+    return assign
+
+
+def _unchecked_assign(variable_name: str, value: Code) -> Code:
+    def assign(state):
+        value_result, value_type, state = value(state)
+        return (value_result, value_type, state.set_value(variable_name, value_result, value_type))
+    return assign
+
+
+def _frame_variable(variable_name: str, slot: int) -> Code:
+    def variable(frame):
+        value = frame[slot]
+        if value is None:
+            raise unassigned_error(variable_name)
+        return (value[0], value[1], frame)
+    return variable
+
+
+def _frame_assign(slot: int, value: Code) -> Code:
+    def assign(frame):
+        value_result, value_type, frame = value(frame)
+        existing = frame[slot]
+        if existing is not None and type(existing[1]) is not type(value_type):
+            raise assignment_error(value_type, existing[1])
+        frame[slot] = (value_result, value_type)
+        return (value_result, value_type, frame)
+    return assign
+
+
+def _unchecked_frame_assign(slot: int, value: Code) -> Code:
+    def assign(frame):
+        value_result, value_type, frame = value(frame)
+        frame[slot] = (value_result, value_type)
+        return (value_result, value_type, frame)
+    return assign
+
+
+def _binary(operation: BinaryOperation, left: Code, right: Code) -> Code:
+    function = operation.function
+    types = operation.types
+    unit_result = operation.unit_result
+
+    if operation.is_comparison:
+        def comparison(state):
+            left_value, left_type, state = left(state)
+            right_value, right_type, state = right(state)
+            if type(left_type) is not type(right_type):
+                raise operation.mismatch_error(left_type, right_type)
+            if type(left_type) in types:
+                return (function(left_value, right_value), BOOLEAN, state)
+            if type(left_type) is Unit:
+                return (unit_result, BOOLEAN, state)
+            raise operation.unsupported_error(left_type)
+        return comparison
+
+    def binary(state):
+        left_value, left_type, state = left(state)
+        right_value, right_type, state = right(state)
+        if type(left_type) is not type(right_type):
+            raise operation.mismatch_error(left_type, right_type)
+        if type(left_type) not in types:
+            raise operation.unsupported_error(left_type)
+        return (function(left_value, right_value), left_type, state)
+    return binary
+
+
+def _add(operation: BinaryOperation, left: Code, right: Code) -> Code:
+    types = operation.types
+
+    def add(state):
+        left_value, left_type, state = left(state)
+        right_value, right_type, state = right(state)
+        if type(left_type) is not type(right_type):
+            raise operation.mismatch_error(left_type, right_type)
+        if type(left_type) is String:
+            return (concat(left_value, right_value), left_type, state)
+        if type(left_type) not in types:
+            raise operation.unsupported_error(left_type)
+        return (left_value + right_value, left_type, state)
+    return add
+
+
+def _unchecked_binary(function: Callable[[Any, Any], Any], result_type: Type, left: Code, right: Code) -> Code:
+    def binary(state):
+        left_value, _, state = left(state)
+        right_value, _, state = right(state)
+        return (function(left_value, right_value), result_type, state)
+    return binary
+
+
+def _unit_comparison(result: bool, left: Code, right: Code) -> Code:
+    def comparison(state):
+        _, _, state = left(state)
+        _, _, state = right(state)
+        return (result, BOOLEAN, state)
+    return comparison
+
+
+def _divide(operation: BinaryOperation, left: Code, right: Code) -> Code:
+    def divide(state):
+        left_value, left_type, state = left(state)
+        right_value, right_type, state = right(state)
+        value, value_type = operation.apply(
+            left_value, left_type, right_value, right_type)
+        return (value, value_type, state)
+    return divide
+
+
+def _unchecked_divide(operand_type: Type, left: Code, right: Code) -> Code:
+    if type(operand_type) is Integer:
+        def integer_divide(state):
+            left_value, _, state = left(state)
+            right_value, _, state = right(state)
+            if right_value == 0:
+                raise InterpMathError("Division by zero.")
+            return (left_value // right_value, operand_type, state)
+        return integer_divide
+
+    def divide(state):
+        left_value, _, state = left(state)
+        right_value, _, state = right(state)
+        if right_value == 0:
+            raise InterpMathError("Division by zero.")
+        return (left_value / right_value, operand_type, state)
+    return divide
+
+
+def _short_circuit(operation: BinaryOperation, decisive: bool, left: Code, right: Code,
+                   check_operands: bool = True) -> Code:
+    # decisive is the left value that decides the operator by itself:
+    # False for And, True for Or.
+    if not check_operands:
+        if decisive:
+            def unchecked_or(state):
+                value, value_type, state = left(state)
+                if value:
+                    return (value, value_type, state)
+                return right(state)
+            return unchecked_or
+
+        def unchecked_and(state):
+            value, value_type, state = left(state)
+            if not value:
+                return (value, value_type, state)
+            return right(state)
+        return unchecked_and
+
+    def short_circuit(state):
+        left_value, left_type, state = left(state)
+        if left_type is BOOLEAN and bool(left_value) is decisive:
+            return (left_value, left_type, state)
+        right_value, right_type, state = right(state)
+        value, value_type = operation.apply(
+            left_value, left_type, right_value, right_type)
+        return (value, value_type, state)
+    return short_circuit
+
+
+def _not(expr: Code) -> Code:
+    def not_(state):
+        value, value_type, state = expr(state)
+        value, value_type = not_value(value, value_type)
+        return (value, value_type, state)
+    return not_
+
+
+def _unchecked_not(expr: Code) -> Code:
+    def not_(state):
+        value, value_type, state = expr(state)
+        return (not value, value_type, state)
+    return not_
+
+
+def _if(condition: Code, true: Code, false: Code, check_condition: bool = True) -> Code:
+    if not check_condition:
+        def unchecked_if(state):
+            value, _, state = condition(state)
+            if value:
+                return true(state)
+            return false(state)
+        return unchecked_if
+
+    def if_(state):
+        value, value_type, state = condition(state)
+        if type(value_type) is not Boolean:
+            raise condition_error("if")
+        if value:
+            return true(state)
+        return false(state)
+    return if_
+
+
+def _while(condition: Code, body: Code, compact_every: Optional[int], check_condition: bool = True) -> Code:
+    # The condition's type is only checked on entry, like the tree walker
+    # does, so checking it is not on the per-iteration path anyway.
+    if compact_every:
+        def compacting_while(state):
+            value, value_type, state = condition(state)
+            if check_condition and type(value_type) is not Boolean:
+                raise condition_error("while")
+            loop_state = state
+            iterations = 0
+            while value:
+                _, _, state = body(state)
+                value, value_type, state = condition(state)
+                iterations += 1
+                if iterations % compact_every == 0:
+                    state = state.compact(loop_state)
+            return (False, BOOLEAN, state)
+        return compacting_while
+
+    def while_(state):
+        value, value_type, state = condition(state)
+        if check_condition and type(value_type) is not Boolean:
+            raise condition_error("while")
+        while value:
+            _, _, state = body(state)
+            value, value_type, state = condition(state)
+        return (False, BOOLEAN, state)
+    return while_
+
+
+def _counted_while(condition: Code, body: Code, budget: Budget, check_condition: bool = True) -> Code:
+    # Nothing else charges the budget while an innermost loop runs, so it
+    # can take its steps from an itertools.repeat, which allocates nothing
+    # per iteration, and settle up with what is left of it when it ends.
+    def counted_while(state):
+        value, value_type, state = condition(state)
+        if check_condition and type(value_type) is not Boolean:
+            raise condition_error("while")
+        if value:
+            ticks = repeat(None, budget.steps)
+            for _ in ticks:
+                _, _, state = body(state)
+                value, value_type, state = condition(state)
+                if not value:
+                    break
+            else:
+                raise budget.out_of_steps()
+            budget.steps = length_hint(ticks)
+        return (False, BOOLEAN, state)
+    return counted_while
+
+
+def _budgeted_while(condition: Code, body: Code, compact_every: Optional[int], budget: Budget,
+                    check_condition: bool = True) -> Code:
+    def budgeted_while(state):
+        value, value_type, state = condition(state)
+        if check_condition and type(value_type) is not Boolean:
+            raise condition_error("while")
+        loop_state = state
+        iterations = 0
+        while value:
+            budget.step(state)
+            _, _, state = body(state)
+            value, value_type, state = condition(state)
+            iterations += 1
+            if compact_every and iterations % compact_every == 0:
+                state = state.compact(loop_state)
+        return (False, BOOLEAN, state)
+    return budgeted_while
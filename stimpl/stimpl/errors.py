@@ -25,5 +25,17 @@ class InterpMathError(InterpError):
       error_msg = "InterpMathError"
     super().__init__(error_msg)
 
+class InterpResourceError(InterpError):
+  def __init__(self, error_msg = None):
+    if error_msg == None:
+      error_msg = "InterpResourceError"
+    super().__init__(error_msg)
+
+class InterpTimeoutError(InterpResourceError):
+  def __init__(self, error_msg = None):
+    if error_msg == None:
+      error_msg = "InterpTimeoutError"
+    super().__init__(error_msg)
+
 def pretty_type(value):
   return f"{str(type(value).__name__)}"
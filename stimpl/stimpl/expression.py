@@ -5,9 +5,104 @@ Expressions
 
 
 class Expr(object):
+    """
+    Expressions compare and hash structurally: two trees are equal when
+    they have the same shape, the same operators, the same variable names
+    and the same literals. Both walk the tree without recursing, and the
+    hash is computed once per node and then cached, so expressions must
+    not be mutated after they are built.
+    """
+    __slots__ = ('_hash', '_temporaries')
+
     def __init__(self):
         pass
 
+    def _fields(self):
+        """
+        The arguments this expression was constructed from.
+        """
+        return ()
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Expr):
+            return NotImplemented
+        pending = [(self, other)]
+        while pending:
+            left, right = pending.pop()
+            if left is right:
+                continue
+            if type(left) is not type(right) or hash(left) != hash(right):
+                return False
+            left_fields = left._fields()
+            right_fields = right._fields()
+            if len(left_fields) != len(right_fields):
+                return False
+            for left_field, right_field in zip(left_fields, right_fields):
+                if isinstance(left_field, Expr):
+                    if not isinstance(right_field, Expr):
+                        return False
+                    pending.append((left_field, right_field))
+                elif literal_key(left_field) != literal_key(right_field):
+                    return False
+        return True
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        # Hash the subtree bottom up so that no node recurses into its
+        # children's hashes.
+        pending = [self]
+        while pending:
+            expression = pending[-1]
+            unhashed = [field for field in expression._fields()
+                        if isinstance(field, Expr) and not hasattr(field, '_hash')]
+            if unhashed:
+                pending.extend(unhashed)
+                continue
+            pending.pop()
+            expression._hash = hash((type(expression),) + tuple(
+                field if isinstance(field, Expr) else literal_key(field)
+                for field in expression._fields()))
+        return self._hash
+
+
+    def __reduce_ex__(self, protocol):
+        # Pickled in the binary format of stimpl.serialize: compact, and
+        # neither pickling nor unpickling recurses on the depth of the
+        # tree. A tree holding a node the format has no tag for (a bare
+        # Expr, or a subclass defined elsewhere) pickles field by field,
+        # the default way.
+        from stimpl.serialize import dumps, loads
+        try:
+            return (loads, (dumps(self),))
+        except InterpSyntaxError:
+            return super().__reduce_ex__(protocol)
+
+    def __getstate__(self):
+        # The cached hash is only valid in the process that computed it,
+        # so it is left behind.
+        state = super().__getstate__()
+        if type(state) is tuple and '_hash' in state[1]:
+            slots = dict(state[1])
+            del slots['_hash']
+            state = (state[0], slots) if slots else state[0]
+        return state
+
+
+def literal_key(value):
+    """
+    What two literal values must share to be the same literal. Python
+    considers 1, 1.0 and True equal, and 0.0 equal to -0.0; STIMPL does
+    not.
+    """
+    if type(value) is float:
+        return (float, value.hex())
+    return (type(value), value)
+
 
 """
 Unit expression.
@@ -15,6 +110,8 @@ Unit expression.
 
 
 class Ren(Expr):
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -28,14 +125,21 @@ Literal expressions.
 
 
 class Literal(Expr):
+    __slots__ = ('literal',)
+
     def __init__(self, literal):
         self.literal = literal
 
+    def _fields(self):
+        return (self.literal,)
+
     def __repr__(self):
         return f"literal value: {self.literal}"
 
 
 class IntLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
         if type(literal) != int:
             raise InterpTypeError(
@@ -44,6 +148,8 @@ class IntLiteral(Literal):
 
 
 class FloatingPointLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
         if type(literal) != float:
             raise InterpTypeError(
@@ -52,6 +158,8 @@ class FloatingPointLiteral(Literal):
 
 
 class StringLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
         if type(literal) != str:
             raise InterpTypeError(
@@ -60,6 +168,8 @@ class StringLiteral(Literal):
 
 
 class BooleanLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, literal):
         if type(literal) != bool:
             raise InterpTypeError(
@@ -73,9 +183,14 @@ Variable Expression
 
 
 class Variable(Expr):
+    __slots__ = ('variable_name',)
+
     def __init__(self, variable_name):
         self.variable_name = variable_name
 
+    def _fields(self):
+        return (self.variable_name,)
+
     def __repr__(self):
         return f"Variable {self.variable_name}"
 
@@ -83,53 +198,89 @@ class Variable(Expr):
         return (state.get_value(self.variable_name), state)
 
 
+class Temporary(Variable):
+    """
+    A variable the optimizer introduced (see stimpl.optimizer.hoist). It
+    is read and assigned like any other, but run_stimpl leaves it out of
+    the state it returns.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"Temporary {self.variable_name}"
+
+
 """
 Operators
 """
 
 
 class Assign(Expr):
+    __slots__ = ('variable', 'value')
+
     def __init__(self, variable, value):
         if not isinstance(variable, Variable):
             raise InterpSyntaxError("Must assign to a variable.")
         self.variable = variable
         self.value = value
 
+    def _fields(self):
+        return (self.variable, self.value)
+
     def __repr__(self):
         return f"{self.variable} = {self.value}"
 
 
 class UnaryOperator(Expr):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class Print(UnaryOperator):
+    __slots__ = ('to_print',)
+
     def __init__(self, to_print):
         self.to_print = to_print
         super().__init__()
 
+    def _fields(self):
+        return (self.to_print,)
+
     def __repr__(self):
         return f"Print {self.to_print}"
 
 
 class Not(UnaryOperator):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
         super().__init__()
 
+    def _fields(self):
+        return (self.expr,)
+
     def __repr__(self):
         return f"Not {self.expr}"
 
 
 class BinaryOperator(Expr):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
         super().__init__()
 
+    def _fields(self):
+        return (self.left, self.right)
+
 
 class And(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -138,6 +289,8 @@ class And(BinaryOperator):
 
 
 class Or(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -146,6 +299,8 @@ class Or(BinaryOperator):
 
 
 class Lt(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -154,6 +309,8 @@ class Lt(BinaryOperator):
 
 
 class Lte(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -162,6 +319,8 @@ class Lte(BinaryOperator):
 
 
 class Gt(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -170,6 +329,8 @@ class Gt(BinaryOperator):
 
 
 class Gte(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -178,6 +339,8 @@ class Gte(BinaryOperator):
 
 
 class Eq(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -186,6 +349,8 @@ class Eq(BinaryOperator):
 
 
 class Ne(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -194,6 +359,8 @@ class Ne(BinaryOperator):
 
 
 class Add(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -202,6 +369,8 @@ class Add(BinaryOperator):
 
 
 class Subtract(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -210,6 +379,8 @@ class Subtract(BinaryOperator):
 
 
 class Multiply(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -218,6 +389,8 @@ class Multiply(BinaryOperator):
 
 
 class Divide(BinaryOperator):
+    __slots__ = ()
+
     def __init__(self, left, right):
         super().__init__(left, right)
 
@@ -231,9 +404,14 @@ Combining forms.
 
 
 class Program(Expr):
+    __slots__ = ('exprs',)
+
     def __init__(self, *exprs):
         self.exprs = exprs
 
+    def _fields(self):
+        return self.exprs
+
     def __repr__(self):
         exprs = self.exprs
         if len(exprs) == 0:
@@ -242,9 +420,14 @@ class Program(Expr):
 
 
 class Sequence(Expr):
+    __slots__ = ('exprs',)
+
     def __init__(self, *exprs):
         self.exprs = exprs
 
+    def _fields(self):
+        return self.exprs
+
     def __repr__(self):
         exprs = self.exprs
         if len(exprs) == 0:
@@ -253,19 +436,99 @@ class Sequence(Expr):
 
 
 class If(Expr):
+    __slots__ = ('condition', 'true', 'false')
+
     def __init__(self, condition, true, false):
         self.condition = condition
         self.true = true
         self.false = false
 
+    def _fields(self):
+        return (self.condition, self.true, self.false)
+
     def __repr__(self):
         return f"if ({self.condition}) then {{ {self.true} }} else {{ {self.false} }}"
 
 
 class While(Expr):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
 
+    def _fields(self):
+        return (self.condition, self.body)
+
     def __repr__(self):
         return f"while ({self.condition}) {{ {self.body} }}"
+
+
+"""
+Traversal.
+"""
+
+def children(expression):
+    """
+    Returns the direct subexpressions of an expression, in evaluation order.
+    """
+    match expression:
+        case Program(exprs=exprs) | Sequence(exprs=exprs):
+            return tuple(exprs)
+        case Assign(variable=variable, value=value):
+            return (value,)
+        case Print(to_print=to_print):
+            return (to_print,)
+        case Not(expr=expr):
+            return (expr,)
+        case BinaryOperator(left=left, right=right):
+            return (left, right)
+        case If(condition=condition, true=true, false=false):
+            return (condition, true, false)
+        case While(condition=condition, body=body):
+            return (condition, body)
+        case _:
+            return ()
+
+
+def map_children(expression, function):
+    """
+    Rebuilds an expression with function applied to each of its direct
+    subexpressions. The expression itself is returned when no child
+    changes.
+    """
+    old_children = children(expression)
+    new_children = tuple(function(child) for child in old_children)
+    if all(new is old for new, old in zip(new_children, old_children)):
+        return expression
+    if isinstance(expression, Assign):
+        return Assign(expression.variable, *new_children)
+    # Every other constructor takes its children in evaluation order.
+    return type(expression)(*new_children)
+
+
+def temporary_names(expression):
+    """
+    Returns the names of the Temporaries an expression assigns. The
+    set is cached on the expression, so a program run again is not
+    walked again.
+    """
+    try:
+        return expression._temporaries
+    except AttributeError:
+        pass
+    root = expression
+    names = set()
+    pending = [expression]
+    while pending:
+        expression = pending.pop()
+        if isinstance(expression, Assign) and isinstance(expression.variable, Temporary):
+            names.add(expression.variable.variable_name)
+        if isinstance(expression, (Program, Sequence)) and type(expression.exprs) is not tuple:
+            # Statements that are decoded on demand (see stimpl.serialize)
+            # know which temporaries they might assign without being read.
+            names.update(expression.exprs.temporary_names())
+            continue
+        pending.extend(children(expression))
+    root._temporaries = frozenset(names)
+    return root._temporaries
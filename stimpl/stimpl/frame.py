@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.runtime import State
+
+"""
+Slot-resolved frames.
+
+STIMPL has no scopes, so every variable name in a program can be given
+a fixed integer slot before the program runs. An engine can then keep
+the bindings in a flat list indexed by slot -- O(1) reads, and
+assignments overwrite in place instead of allocating a new State node.
+The frame is mutable, so this is only for runs that never need to look
+at an intermediate snapshot; the final State is rebuilt from it.
+"""
+
+__all__ = ['Frame', 'resolve_slots', 'load_frame', 'store_frame']
+
+Frame = List[Optional[Tuple[Any, Type]]]
+
+
+def resolve_slots(program: Expr) -> Dict[str, int]:
+    """
+    Gives every variable name in program a slot, in order of first
+    appearance.
+    """
+    slots: Dict[str, int] = {}
+    pending = [program]
+    while pending:
+        expression = pending.pop()
+        match expression:
+            case Variable(variable_name=variable_name) | Assign(variable=Variable(variable_name=variable_name)):
+                if variable_name not in slots:
+                    slots[variable_name] = len(slots)
+        pending.extend(reversed(children(expression)))
+    return slots
+
+
+def load_frame(slots: Dict[str, int], state: State) -> Frame:
+    """
+    A frame holding the bindings state has for the slotted variables.
+    """
+    frame: Frame = [None] * len(slots)
+    for variable_name, slot in slots.items():
+        frame[slot] = state.get_value(variable_name)
+    return frame
+
+
+def store_frame(slots: Dict[str, int], frame: Frame, state: State) -> State:
+    """
+    The state a run that started from state ends in, given its final
+    frame.
+    """
+    for variable_name, slot in slots.items():
+        binding = frame[slot]
+        if binding is not None and binding is not state.get_value(variable_name):
+            variable_value, variable_type = binding
+            state = state.set_value(
+                variable_name, variable_value, variable_type)
+    return state
@@ -0,0 +1,176 @@
+from typing import Any, Iterator, Optional, Tuple
+
+"""
+Persistent hash array mapped trie.
+
+Every update returns a new trie that shares all untouched nodes with the
+old one, so older versions stay valid and lookups/updates touch at most
+one node per level (O(log32 n)).
+"""
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+# Marks a slot in a bitmap node's array whose partner is a child node
+# rather than a value.
+_NODE = object()
+
+
+class _BitmapNode(object):
+    __slots__ = ('bitmap', 'array')
+
+    def __init__(self, bitmap: int, array: tuple) -> None:
+        self.bitmap = bitmap
+        # Flat (key, value, key, value, ...) tuple, one pair per set bit.
+        self.array = array
+
+
+class _CollisionNode(object):
+    __slots__ = ('hash', 'array')
+
+    def __init__(self, hash: int, array: tuple) -> None:
+        self.hash = hash
+        self.array = array
+
+
+def _hash(key: Any) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _pair_node(shift: int, hash1: int, key1: Any, value1: Any, hash2: int, key2: Any, value2: Any):
+    if shift >= _HASH_BITS:
+        return _CollisionNode(hash1, (key1, value1, key2, value2))
+    fragment1 = (hash1 >> shift) & _MASK
+    fragment2 = (hash2 >> shift) & _MASK
+    if fragment1 == fragment2:
+        child = _pair_node(shift + _BITS, hash1, key1,
+                           value1, hash2, key2, value2)
+        return _BitmapNode(1 << fragment1, (_NODE, child))
+    if fragment1 < fragment2:
+        array = (key1, value1, key2, value2)
+    else:
+        array = (key2, value2, key1, value1)
+    return _BitmapNode((1 << fragment1) | (1 << fragment2), array)
+
+
+def _assoc(node, shift: int, hash: int, key: Any, value: Any) -> Tuple[Any, bool]:
+    """
+    Returns the node with key bound to value and whether the key is new.
+    """
+    if type(node) is _CollisionNode:
+        array = node.array
+        for index in range(0, len(array), 2):
+            if array[index] == key:
+                return _CollisionNode(node.hash, array[:index + 1] + (value,) + array[index + 2:]), False
+        return _CollisionNode(node.hash, array + (key, value)), True
+
+    bit = 1 << ((hash >> shift) & _MASK)
+    bitmap = node.bitmap
+    array = node.array
+    index = 2 * (bitmap & (bit - 1)).bit_count()
+
+    if not bitmap & bit:
+        return _BitmapNode(bitmap | bit, array[:index] + (key, value) + array[index:]), True
+
+    existing_key = array[index]
+    existing_value = array[index + 1]
+    if existing_key is _NODE:
+        child, added = _assoc(existing_value, shift +
+                              _BITS, hash, key, value)
+        return _BitmapNode(bitmap, array[:index + 1] + (child,) + array[index + 2:]), added
+    if existing_key == key:
+        return _BitmapNode(bitmap, array[:index + 1] + (value,) + array[index + 2:]), False
+
+    child = _pair_node(shift + _BITS, _hash(existing_key), existing_key, existing_value,
+                       hash, key, value)
+    return _BitmapNode(bitmap, array[:index] + (_NODE, child) + array[index + 2:]), True
+
+
+def _iterate(node) -> Iterator[Tuple[Any, Any]]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        array = node.array
+        for index in range(0, len(array), 2):
+            if array[index] is _NODE:
+                stack.append(array[index + 1])
+            else:
+                yield (array[index], array[index + 1])
+
+
+class HashTrie(object):
+    __slots__ = ('root', 'size')
+
+    def __init__(self, root: Optional[_BitmapNode] = None, size: int = 0) -> None:
+        self.root = root
+        self.size = size
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Retrieves the value bound to key, or default if there is none.
+        """
+        node = self.root
+        if node is None:
+            return default
+        hash = _hash(key)
+        shift = 0
+        while True:
+            if type(node) is _CollisionNode:
+                array = node.array
+                for index in range(0, len(array), 2):
+                    if array[index] == key:
+                        return array[index + 1]
+                return default
+            bit = 1 << ((hash >> shift) & _MASK)
+            bitmap = node.bitmap
+            if not bitmap & bit:
+                return default
+            index = 2 * (bitmap & (bit - 1)).bit_count()
+            existing_key = node.array[index]
+            if existing_key is _NODE:
+                node = node.array[index + 1]
+                shift += _BITS
+                continue
+            if existing_key == key:
+                return node.array[index + 1]
+            return default
+
+    def set(self, key: Any, value: Any) -> 'HashTrie':
+        """
+        Returns a new trie with key bound to value. This trie is unchanged.
+        """
+        hash = _hash(key)
+        if self.root is None:
+            bit = 1 << (hash & _MASK)
+            return HashTrie(_BitmapNode(bit, (key, value)), 1)
+        root, added = _assoc(self.root, 0, hash, key, value)
+        return HashTrie(root, self.size + 1 if added else self.size)
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        if self.root is None:
+            return iter(())
+        return _iterate(self.root)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key, _NODE) is not _NODE
+
+    def __reduce__(self):
+        # Pickled as its items and rebuilt on load: the node layout depends
+        # on string hashes, which differ between processes.
+        return (_from_items, (list(self.items()),))
+
+    def __repr__(self) -> str:
+        return "HashTrie(" + ", ".join(f"{key!r}: {value!r}" for key, value in self.items()) + ")"
+
+
+def _from_items(items: list) -> HashTrie:
+    trie = HashTrie()
+    for key, value in items:
+        trie = trie.set(key, value)
+    return trie
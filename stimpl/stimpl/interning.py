@@ -0,0 +1,67 @@
+from typing import Any, Dict
+
+from stimpl.expression import *
+
+"""
+Hash-consing for Expr trees.
+
+An Interner hands out exactly one node per distinct structure, so a
+generated program that repeats a subtree a thousand times stores it
+once, and two interned programs are structurally equal exactly when they
+are the same object.
+"""
+
+
+class Interner(object):
+    def __init__(self) -> None:
+        # Children of interned nodes are interned too, so a node is
+        # identified by its class, its children's identities and its
+        # literal fields.
+        self._table: Dict[tuple, Expr] = {}
+
+    def make(self, expression_class: type, *args: Any) -> Expr:
+        """
+        The interned expression_class(*args). Expression arguments must
+        already be interned; when an equal node exists it is returned and
+        nothing new is allocated.
+        """
+        key = _key(expression_class, args)
+        expression = self._table.get(key)
+        if expression is None:
+            expression = expression_class(*args)
+            self._table[key] = expression
+        return expression
+
+    def intern(self, expression: Expr) -> Expr:
+        """
+        The interned equivalent of a whole tree, built bottom up without
+        recursing.
+        """
+        interned: Dict[int, Expr] = {}
+        pending = [expression]
+        while pending:
+            node = pending[-1]
+            if id(node) in interned:
+                pending.pop()
+                continue
+            fields = node._fields()
+            missing = [field for field in fields
+                       if isinstance(field, Expr) and id(field) not in interned]
+            if missing:
+                pending.extend(missing)
+                continue
+            pending.pop()
+            interned[id(node)] = self.make(type(node), *[
+                interned[id(field)] if isinstance(field, Expr) else field for field in fields])
+        return interned[id(expression)]
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __contains__(self, expression: Expr) -> bool:
+        return self._table.get(_key(type(expression), expression._fields())) is expression
+
+
+def _key(expression_class: type, args: tuple) -> tuple:
+    return (expression_class,) + tuple(
+        id(arg) if isinstance(arg, Expr) else literal_key(arg) for arg in args)
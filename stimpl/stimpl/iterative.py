@@ -0,0 +1,240 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.runtime import State, RunOptions, DEFAULT_OPTIONS
+
+"""
+A non-recursive tree walker.
+
+evaluate_iteratively() computes exactly what stimpl.runtime.evaluate
+computes, but instead of a Python call per node it keeps an explicit
+work stack of expressions still to evaluate and continuations ("what to
+do with the value once it is there"), plus a stack of the values
+computed so far. Nesting depth is only limited by memory, and a node
+costs a few list operations instead of a Python frame.
+"""
+
+# Node kinds, so that the main loop dispatches on one dict lookup.
+_LITERAL = 0
+_REN = 1
+_VARIABLE = 2
+_ASSIGN = 3
+_BINARY = 4
+_NOT = 5
+_PRINT = 6
+_SEQUENCE = 7
+_IF = 8
+_WHILE = 9
+_LOGICAL = 10
+_UNHANDLED = 11
+
+# Continuation kinds. Continuations are tuples whose first item is one of
+# these; a running While is a list, so it can be updated in place.
+_POP = 0
+_STORE = 1
+_APPLY = 2
+_NEGATE = 3
+_SHOW = 4
+_BRANCH = 5
+_ENTER_LOOP = 6
+_DECIDE = 7
+
+_POP_VALUE = (_POP,)
+_NEGATE_VALUE = (_NEGATE,)
+_SHOW_VALUE = (_SHOW,)
+
+
+# (class, kind, extra): the extra item is a literal's type, or for a
+# binary operator the continuation that applies it (And and Or also
+# carry the left value that decides them when short-circuiting).
+_KIND_CLASSES = [
+    (IntLiteral, _LITERAL, INTEGER),
+    (FloatingPointLiteral, _LITERAL, FLOATING_POINT),
+    (StringLiteral, _LITERAL, STRING),
+    (BooleanLiteral, _LITERAL, BOOLEAN),
+    (Ren, _REN, None),
+    (Variable, _VARIABLE, None),
+    (Assign, _ASSIGN, None),
+    (Not, _NOT, None),
+    (Print, _PRINT, None),
+    (Sequence, _SEQUENCE, None),
+    (Program, _SEQUENCE, None),
+    (If, _IF, None),
+    (While, _WHILE, None),
+    (And, _LOGICAL, ((_APPLY, BINARY_OPERATIONS[And]), False)),
+    (Or, _LOGICAL, ((_APPLY, BINARY_OPERATIONS[Or]), True)),
+] + [(operation_class, _BINARY, (_APPLY, operation))
+     for operation_class, operation in BINARY_OPERATIONS.items()]
+
+_dispatch: Dict[type, Tuple[int, Any]] = {}
+
+
+def _resolve(expression_class: type) -> Tuple[int, Any]:
+    # Subclasses of node classes behave like them, as they do under match.
+    entry = (_UNHANDLED, None)
+    for kind_class, kind, extra in _KIND_CLASSES:
+        if issubclass(expression_class, kind_class):
+            entry = (kind, extra)
+            break
+    _dispatch[expression_class] = entry
+    return entry
+
+
+def evaluate_iteratively(expression: Expr, state: State,
+                         options: RunOptions = DEFAULT_OPTIONS) -> Tuple[Optional[Any], Type, State]:
+    compact_every = options.compact_every
+    short_circuit = options.short_circuit
+    budget = options.budget
+    values: List[Tuple[Any, Type]] = []
+    work: List[Any] = [expression]
+    push = work.append
+    pop = work.pop
+
+    while work:
+        item = pop()
+        item_class = type(item)
+
+        if item_class is tuple:
+            continuation = item[0]
+            if continuation == _POP:
+                values.pop()
+
+            elif continuation == _STORE:
+                variable_name = item[1]
+                value_result, value_type = values[-1]
+                existing = state.get_value(variable_name)
+                if existing is not None and existing[1] is not value_type:
+                    raise assignment_error(value_type, existing[1])
+                state = state.set_value(variable_name, value_result, value_type)
+
+            elif continuation == _APPLY:
+                right_value, right_type = values.pop()
+                left_value, left_type = values.pop()
+                values.append(item[1].apply(
+                    left_value, left_type, right_value, right_type))
+
+            elif continuation == _NEGATE:
+                values.append(not_value(*values.pop()))
+
+            elif continuation == _SHOW:
+                print_value(*values[-1])
+
+            elif continuation == _BRANCH:
+                value, value_type = values.pop()
+                if value_type is not BOOLEAN:
+                    raise condition_error("if")
+                push(item[1] if value else item[2])
+
+            elif continuation == _DECIDE:
+                # The left operand of a short-circuiting And or Or is on
+                # top; it is the result if it decides the operator.
+                value, value_type = values[-1]
+                if value_type is not BOOLEAN or bool(value) is not item[3]:
+                    push(item[2])
+                    push(item[1])
+
+            else:
+                # _ENTER_LOOP: the first test of a While's condition.
+                value, value_type = values.pop()
+                if value_type is not BOOLEAN:
+                    raise condition_error("while")
+                if value:
+                    if budget is not None:
+                        budget.step(state)
+                    loop = item[1]
+                    # [body, condition, state on entry, iterations]
+                    record = [loop.body, loop.condition, state, 0]
+                    push(record)
+                    push(loop.condition)
+                    push(_POP_VALUE)
+                    push(loop.body)
+                else:
+                    values.append((False, BOOLEAN))
+            continue
+
+        if item_class is list:
+            # A While whose condition was just evaluated again. Like the
+            # tree walker, only the first test checks the type.
+            value, _ = values.pop()
+            if compact_every:
+                item[3] += 1
+                if item[3] % compact_every == 0:
+                    state = state.compact(item[2])
+            if value:
+                if budget is not None:
+                    budget.step(state)
+                push(item)
+                push(item[1])
+                push(_POP_VALUE)
+                push(item[0])
+            else:
+                values.append((False, BOOLEAN))
+            continue
+
+        kind, extra = _dispatch.get(item_class) or _resolve(item_class)
+
+        if kind == _LITERAL:
+            values.append((item.literal, extra))
+
+        elif kind == _VARIABLE:
+            value = state.get_value(item.variable_name)
+            if value is None:
+                raise unassigned_error(item.variable_name)
+            values.append(value)
+
+        elif kind == _BINARY:
+            push(extra)
+            push(item.right)
+            push(item.left)
+
+        elif kind == _LOGICAL:
+            apply, decisive = extra
+            if short_circuit:
+                push((_DECIDE, item.right, apply, decisive))
+            else:
+                push(apply)
+                push(item.right)
+            push(item.left)
+
+        elif kind == _ASSIGN:
+            push((_STORE, item.variable.variable_name))
+            push(item.value)
+
+        elif kind == _SEQUENCE:
+            exprs = item.exprs
+            if len(exprs) == 0:
+                values.append((None, UNIT))
+                continue
+            # Every value but the last one is dropped.
+            push(exprs[-1])
+            for expr in reversed(exprs[:-1]):
+                push(_POP_VALUE)
+                push(expr)
+
+        elif kind == _IF:
+            push((_BRANCH, item.true, item.false))
+            push(item.condition)
+
+        elif kind == _WHILE:
+            push((_ENTER_LOOP, item))
+            push(item.condition)
+
+        elif kind == _NOT:
+            push(_NEGATE_VALUE)
+            push(item.expr)
+
+        elif kind == _PRINT:
+            push(_SHOW_VALUE)
+            push(item.to_print)
+
+        elif kind == _REN:
+            values.append((None, UNIT))
+
+        else:
+            raise InterpSyntaxError("Unhandled!")
+
+    value, value_type = values.pop()
+    return (value, value_type, state)
@@ -0,0 +1,383 @@
+from itertools import repeat
+from operator import length_hint
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.runtime import State, RunOptions, Budget
+from stimpl.rope import concat
+
+"""
+A tracing JIT for the tree walker's While loops.
+
+With the jit_threshold option the tree walker counts the iterations of
+every While it runs, on the loop's record (see loop_record), so a loop
+entered many times adds up the iterations of every entry. Once a loop
+has run jit_threshold iterations it records the types its variables
+have in the current state and generates
+Python source for the rest of the loop specialised on those types:
+variables become Python locals, operators become Python operators, and
+no type is looked at while the loop runs. The source is compiled with
+compile()/exec() once per loop and set of types and reused whenever the
+loop is entered again with the same types.
+
+The types are the guard: a loop entered with other types (or with a
+variable unbound) has no code and the tree walker runs it, and a loop
+that would raise a type error somewhere is never compiled at all. A
+variable's type cannot change once it is bound, so the guard is only
+checked on entry. The only errors compiled code raises itself are
+division by zero and, when the run has a budget, running out of steps.
+
+Like frame mode, compiled code writes each variable it assigned back to
+the state once, when the loop ends.
+"""
+
+
+class _Untraceable(Exception):
+    pass
+
+
+class _Loop(object):
+    def __init__(self, loop: While) -> None:
+        self.loop = loop
+        # Iterations the tree walker has run, over every entry.
+        self.iterations = 0
+        self.variables: List[str] = []
+        seen = set()
+        pending = [loop]
+        while pending:
+            expression = pending.pop()
+            match expression:
+                case Variable(variable_name=variable_name) | Assign(variable=Variable(variable_name=variable_name)):
+                    if variable_name not in seen:
+                        seen.add(variable_name)
+                        self.variables.append(variable_name)
+            pending.extend(reversed(children(expression)))
+        # Compiled code (or None if the loop cannot be compiled) by the
+        # types of self.variables, the short_circuit option and whether a
+        # budget is charged.
+        self.variants: Dict[tuple, Optional[Callable[[State, Optional[Budget]], State]]] = {}
+
+
+# Loops are keyed structurally, so equal loops share their code.
+_loops: Dict[While, _Loop] = {}
+_MAX_LOOPS = 256
+
+
+def loop_record(loop: While) -> _Loop:
+    """
+    The record of loop (and of every loop equal to it): its iteration
+    count and compiled code. It is made the first time the loop runs.
+    """
+    traced = _loops.get(loop)
+    if traced is None:
+        if len(_loops) >= _MAX_LOOPS:
+            _loops.clear()
+        traced = _loops[loop] = _Loop(loop)
+    return traced
+
+
+def run_hot_loop(traced: _Loop, state: State, options: RunOptions, record: bool) -> Optional[State]:
+    """
+    Runs the rest of the loop traced is the record of, whose condition
+    has just evaluated to True in state, with compiled code. Returns the
+    state after the loop, or None when the caller has to run it: there
+    is no code for the current types yet (and record is False) or the
+    loop cannot be compiled. Compiled code keeps variables in locals, so
+    a run whose state size is budgeted is left to the caller.
+    """
+    budget = options.budget
+    if budget is not None and budget.max_state_bytes is not None:
+        return None
+
+    bindings = [state.get_value(variable_name)
+                for variable_name in traced.variables]
+    signature = tuple(None if binding is None else binding[1] for binding in bindings) \
+        + (options.short_circuit, budget is not None)
+    if signature in traced.variants:
+        code = traced.variants[signature]
+    elif record:
+        code = traced.variants[signature] = _compile_loop(
+            traced.loop, traced.variables, signature[:-2], options.short_circuit, budget is not None)
+    else:
+        return None
+    if code is None:
+        return None
+    return code(state, budget)
+
+
+def loop_source(loop: While, state: State, short_circuit: bool = False, budgeted: bool = False) -> str:
+    """
+    The Python source run_hot_loop would compile for loop given the
+    types in state, for looking at.
+    """
+    variables = _Loop(loop).variables
+    bindings = [state.get_value(variable_name) for variable_name in variables]
+    types = tuple(None if binding is None else binding[1]
+                  for binding in bindings)
+    return _Generator(variables, types, short_circuit, budgeted).loop(loop)[0]
+
+
+def _compile_loop(loop: While, variables: List[str], types: tuple, short_circuit: bool,
+                  budgeted: bool) -> Optional[Callable[[State, Optional[Budget]], State]]:
+    try:
+        source, namespace = _Generator(
+            variables, types, short_circuit, budgeted).loop(loop)
+        exec(compile(source, "<stimpl loop>", "exec"), namespace)
+    except (_Untraceable, SyntaxError, RecursionError, MemoryError):
+        # SyntaxError: Python limits how deeply blocks can nest.
+        return None
+    return namespace["loop"]
+
+
+class _Generator(object):
+    def __init__(self, variables: List[str], types: tuple, short_circuit: bool,
+                 budgeted: bool = False) -> None:
+        if None in types:
+            # Some variable has no value (and so no type) yet.
+            raise _Untraceable()
+        self.locals = {variable_name: f"v{index}" for index,
+                       variable_name in enumerate(variables)}
+        self.types = dict(zip(variables, types))
+        self.short_circuit = short_circuit
+        self.budgeted = budgeted
+        self.assigned: List[str] = []
+        self.namespace: Dict[str, Any] = {
+            "InterpMathError": InterpMathError,
+            "print_value": print_value,
+            "concat": concat,
+            "repeat": repeat,
+            "length_hint": length_hint,
+        }
+        self.constants: Dict[tuple, str] = {}
+        self.lines: List[str] = []
+        self.indent = 1
+        self.temporaries = 0
+        # While loops generated so far.
+        self.loops = 0
+
+    def loop(self, loop: While) -> Tuple[str, Dict[str, Any]]:
+        opened = self.open_loop()
+        self.expression(loop.body)
+        condition = self.condition(loop.condition, "while")
+        self.emit(f"if not {condition}:")
+        self.emit("    break")
+        self.close_loop(opened)
+
+        header = ["def loop(state, budget):"]
+        if self.budgeted:
+            header.append("    steps = budget.steps")
+        for variable_name, local in self.locals.items():
+            header.append(
+                f"    {local} = state.get_value({variable_name!r})[0]")
+        footer = ["    budget.steps = steps"] if self.budgeted else []
+        for variable_name in self.assigned:
+            local = self.locals[variable_name]
+            type_name = self.constant(self.types[variable_name])
+            footer.append(
+                f"    state = state.set_value({variable_name!r}, {local}, {type_name})")
+        footer.append("    return state")
+        return ("\n".join(header + self.lines + footer) + "\n", self.namespace)
+
+    def emit(self, line: str) -> None:
+        self.lines.append("    " * self.indent + line)
+
+    def open_loop(self) -> Tuple[int, int]:
+        self.emit("while True:")
+        self.indent += 1
+        return (len(self.lines) - 1, self.loops)
+
+    def close_loop(self, opened: Tuple[int, int]) -> None:
+        # Every iteration is a step, counted in the steps local; no state
+        # is measured here. A loop with no loop inside takes its steps
+        # from an itertools.repeat, which allocates nothing per
+        # iteration, and what is left of it is its length_hint; the
+        # others count by hand, since their inner loops count on the
+        # same local.
+        self.indent -= 1
+        line, loops = opened
+        innermost = self.loops == loops
+        self.loops += 1
+        if not self.budgeted:
+            return
+        indent = "    " * self.indent
+        if innermost:
+            self.lines[line:line + 1] = [f"{indent}ticks = repeat(None, steps)",
+                                         f"{indent}for _ in ticks:"]
+            self.emit("else:")
+            self.emit("    raise budget.out_of_steps()")
+            self.emit("steps = length_hint(ticks)")
+        else:
+            self.lines[line + 1:line + 1] = [f"{indent}    if not steps:",
+                                             f"{indent}        raise budget.out_of_steps()",
+                                             f"{indent}    steps -= 1"]
+
+    def temporary(self) -> str:
+        self.temporaries += 1
+        return f"t{self.temporaries}"
+
+    def constant(self, value: Any) -> str:
+        # Pool by type too: 1 == 1.0 == True in Python.
+        key = literal_key(value) if not isinstance(value, Type) else (Type, id(value))
+        if key not in self.constants:
+            name = f"k{len(self.constants)}"
+            self.constants[key] = name
+            self.namespace[name] = value
+        return self.constants[key]
+
+    def condition(self, condition: Expr, construct: str) -> str:
+        code, code_type = self.expression(condition)
+        if code_type is not BOOLEAN:
+            # The tree walker raises condition_error(construct) here.
+            raise _Untraceable(construct)
+        return code
+
+    def expression(self, expression: Expr) -> Tuple[str, Type]:
+        """
+        Emits the statements expression needs and returns a Python
+        expression for its value -- one that neither raises nor has
+        effects, so it can be used later or not at all -- and its type.
+        """
+        match expression:
+            case Ren():
+                return ("None", UNIT)
+
+            case IntLiteral(literal=l):
+                return (self.constant(l), INTEGER)
+
+            case FloatingPointLiteral(literal=l):
+                return (self.constant(l), FLOATING_POINT)
+
+            case StringLiteral(literal=l):
+                return (self.constant(l), STRING)
+
+            case BooleanLiteral(literal=l):
+                return (self.constant(l), BOOLEAN)
+
+            case Print(to_print=to_print):
+                code, code_type = self.materialize(*self.expression(to_print))
+                self.emit(f"print_value({code}, {self.constant(code_type)})")
+                return (code, code_type)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                result = ("None", UNIT)
+                for expr in exprs:
+                    result = self.expression(expr)
+                return result
+
+            case Variable(variable_name=variable_name):
+                return (self.locals[variable_name], self.types[variable_name])
+
+            case Assign(variable=variable, value=value):
+                code, code_type = self.expression(value)
+                variable_name = variable.variable_name
+                if code_type is not self.types[variable_name]:
+                    raise _Untraceable("assignment")
+                local = self.locals[variable_name]
+                self.emit(f"{local} = {code}")
+                if variable_name not in self.assigned:
+                    self.assigned.append(variable_name)
+                return (local, code_type)
+
+            case And(left=left, right=right) | Or(left=left, right=right) if self.short_circuit:
+                left_code, left_type = self.expression(left)
+                if left_type is not BOOLEAN:
+                    # Both operands run, and then it raises.
+                    raise _Untraceable("operand")
+                result = self.temporary()
+                self.emit(f"{result} = {left_code}")
+                self.emit(f"if {'not ' if isinstance(expression, Or) else ''}{result}:")
+                self.indent += 1
+                right_code, right_type = self.expression(right)
+                if right_type is not BOOLEAN:
+                    raise _Untraceable("operand")
+                self.emit(f"{result} = {right_code}")
+                self.indent -= 1
+                return (result, BOOLEAN)
+
+            case BinaryOperator(left=left, right=right) if type(expression) in BINARY_OPERATIONS:
+                operation = BINARY_OPERATIONS[type(expression)]
+                left_code, left_type = self.expression(left)
+                mark = len(self.lines)
+                right_code, right_type = self.expression(right)
+                if len(self.lines) > mark and left_code not in self.namespace:
+                    # The right operand's statements could change what
+                    # left_code reads, so take its value first.
+                    left_temporary = self.temporary()
+                    self.lines.insert(mark, "    " * self.indent +
+                                      f"{left_temporary} = {left_code}")
+                    left_code = left_temporary
+                if left_type is not right_type:
+                    raise _Untraceable("mismatch")
+                if operation.is_comparison and left_type is UNIT:
+                    return (repr(operation.unit_result), BOOLEAN)
+                if type(left_type) not in operation.types:
+                    raise _Untraceable("unsupported")
+                if isinstance(expression, Divide):
+                    divisor = self.temporary()
+                    dividend = self.temporary()
+                    self.emit(f"{dividend} = {left_code}")
+                    self.emit(f"{divisor} = {right_code}")
+                    self.emit(f"if {divisor} == 0:")
+                    self.emit("    raise InterpMathError('Division by zero.')")
+                    symbol = "//" if left_type is INTEGER else "/"
+                    return self.materialize(f"({dividend} {symbol} {divisor})", left_type)
+                if isinstance(expression, Add) and left_type is STRING:
+                    return (f"concat({left_code}, {right_code})", STRING)
+                return (f"({left_code} {_SYMBOLS[type(expression)]} {right_code})",
+                        operation.result_type(left_type))
+
+            case Not(expr=expr):
+                code, code_type = self.expression(expr)
+                if code_type is not BOOLEAN:
+                    raise _Untraceable("not")
+                return (f"(not {code})", BOOLEAN)
+
+            case If(condition=condition, true=true, false=false):
+                condition_code = self.condition(condition, "if")
+                result = self.temporary()
+                self.emit(f"if {condition_code}:")
+                self.indent += 1
+                true_code, true_type = self.expression(true)
+                self.emit(f"{result} = {true_code}")
+                self.indent -= 1
+                self.emit("else:")
+                self.indent += 1
+                false_code, false_type = self.expression(false)
+                self.emit(f"{result} = {false_code}")
+                self.indent -= 1
+                if true_type is not false_type:
+                    raise _Untraceable("if")
+                return (result, true_type)
+
+            case While(condition=condition, body=body):
+                # Only the first test's type matters, and all of them have
+                # the same type here.
+                self.emit(f"if {self.condition(condition, 'while')}:")
+                self.indent += 1
+                opened = self.open_loop()
+                self.expression(body)
+                self.emit(f"if not {self.condition(condition, 'while')}:")
+                self.emit("    break")
+                self.close_loop(opened)
+                self.indent -= 1
+                return ("False", BOOLEAN)
+
+            case _:
+                raise _Untraceable("unhandled")
+
+    def materialize(self, code: str, code_type: Type) -> Tuple[str, Type]:
+        if code in self.namespace:
+            return (code, code_type)
+        temporary = self.temporary()
+        self.emit(f"{temporary} = {code}")
+        return (temporary, code_type)
+
+
+_SYMBOLS = {
+    Add: "+", Subtract: "-", Multiply: "*",
+    And: "and", Or: "or",
+    Lt: "<", Lte: "<=", Gt: ">", Gte: ">=", Eq: "==", Ne: "!=",
+}
@@ -0,0 +1,150 @@
+import operator
+from typing import Any, Callable, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.output import OUTPUT
+from stimpl.rope import concat
+
+"""
+Operator semantics shared by the execution engines.
+
+The tree walker in stimpl.runtime spells every operator out by hand; the
+other engines look the same rules (which operand types are allowed, how
+Unit compares, what each error says) up here so they all behave exactly
+like it.
+"""
+
+__all__ = ['BinaryOperation', 'AddOperation', 'DivideOperation', 'BINARY_OPERATIONS',
+           'not_value', 'condition_error', 'assignment_error', 'unassigned_error', 'print_value']
+
+
+class BinaryOperation(object):
+    def __init__(self, name: str, function: Callable[[Any, Any], Any], types: Tuple[type, ...],
+                 mismatch: str, unsupported: str, unit_result: Optional[bool] = None) -> None:
+        self.name = name
+        self.function = function
+        # Operand types the operation is defined on.
+        self.types = types
+        # Message templates; {left} and {right} are the operand types.
+        self.mismatch = mismatch
+        self.unsupported = unsupported
+        # Comparisons of two Units do not look at the values at all.
+        self.unit_result = unit_result
+        self.is_comparison = unit_result is not None
+
+    def mismatch_error(self, left_type: Type, right_type: Type) -> InterpTypeError:
+        return InterpTypeError(self.mismatch.format(left=left_type, right=right_type))
+
+    def unsupported_error(self, left_type: Type) -> InterpTypeError:
+        return InterpTypeError(self.unsupported.format(left=left_type))
+
+    def proves(self, left_type: Optional[Type], right_type: Optional[Type]) -> bool:
+        """
+        Whether operands of these static types (None where unknown)
+        cannot make the operation raise a type error.
+        """
+        if left_type is None or left_type is not right_type:
+            return False
+        return type(left_type) in self.types or (self.is_comparison and type(left_type) is Unit)
+
+    def result_type(self, left_type: Type) -> Type:
+        return BOOLEAN if self.is_comparison else left_type
+
+    def apply(self, left_value: Any, left_type: Type, right_value: Any, right_type: Type) -> Tuple[Any, Type]:
+        if type(left_type) is not type(right_type):
+            raise self.mismatch_error(left_type, right_type)
+        if self.is_comparison and type(left_type) is Unit:
+            return (self.unit_result, BOOLEAN)
+        if type(left_type) not in self.types:
+            raise self.unsupported_error(left_type)
+        return (self.function(left_value, right_value), self.result_type(left_type))
+
+
+class AddOperation(BinaryOperation):
+    def apply(self, left_value: Any, left_type: Type, right_value: Any, right_type: Type) -> Tuple[Any, Type]:
+        # Strings are added as ropes (see stimpl.rope).
+        if type(left_type) is String and type(right_type) is String:
+            return (concat(left_value, right_value), left_type)
+        return super().apply(left_value, left_type, right_value, right_type)
+
+
+class DivideOperation(BinaryOperation):
+    def apply(self, left_value: Any, left_type: Type, right_value: Any, right_type: Type) -> Tuple[Any, Type]:
+        if type(left_type) is not type(right_type):
+            raise self.mismatch_error(left_type, right_type)
+        # The zero check comes before the operand type check, exactly as
+        # in the tree walker (so False is a zero divisor too).
+        if right_value == 0:
+            raise InterpMathError("Division by zero.")
+        if type(left_type) is Integer:
+            return (left_value // right_value, left_type)
+        if type(left_type) is FloatingPoint:
+            return (left_value / right_value, left_type)
+        raise self.unsupported_error(left_type)
+
+
+_COMPARABLE = (Integer, Boolean, String, FloatingPoint)
+
+BINARY_OPERATIONS = {
+    Add: AddOperation("Add", operator.add, (Integer, String, FloatingPoint),
+                         "Mismatched types for Add: Cannot add {left} to {right}",
+                         "Cannot add {left}s"),
+    Subtract: BinaryOperation("Subtract", operator.sub, (Integer, FloatingPoint),
+                              "Mismatched types for Subtract: Cannot subtract {left} from {right}",
+                              "Cannot subtract {left}s"),
+    Multiply: BinaryOperation("Multiply", operator.mul, (Integer, FloatingPoint),
+                              "Mismatched types for Multiply: Cannot multiply {left} by {right}",
+                              "Cannot multiply {left}s"),
+    Divide: DivideOperation("Divide", operator.truediv, (Integer, FloatingPoint),
+                            "Mismatched types for Divide: Cannot divide {left} by {right}",
+                            "Cannot divide {left}s"),
+    And: BinaryOperation("And", lambda left, right: left and right, (Boolean,),
+                         "Mismatched types for And: Cannot evaluate {left} and {right}",
+                         "Cannot perform logical and on non-boolean operands."),
+    Or: BinaryOperation("Or", lambda left, right: left or right, (Boolean,),
+                        "Mismatched types for Or: Cannot evaluate {left} or {right}",
+                        "Cannot perform logical or on non-boolean operands."),
+    Lt: BinaryOperation("Lt", operator.lt, _COMPARABLE,
+                        "Mismatched types for Lt: Cannot compare {left} and {right}",
+                        "Cannot perform < on {left} type.", unit_result=False),
+    Lte: BinaryOperation("Lte", operator.le, _COMPARABLE,
+                         "Mismatched types for Lte: Cannot compare {left} and {right}",
+                         "Cannot perform <= on {left} type.", unit_result=True),
+    Gt: BinaryOperation("Gt", operator.gt, _COMPARABLE,
+                        "Mismatched types for Gt: Cannot compare {left} and {right}",
+                        "Cannot perform > on {left} type.", unit_result=False),
+    Gte: BinaryOperation("Gte", operator.ge, _COMPARABLE,
+                         "Mismatched types for Gte: Cannot compare {left} and {right}",
+                         "Cannot perform >= on {left} type.", unit_result=True),
+    Eq: BinaryOperation("Eq", operator.eq, _COMPARABLE,
+                        "Mismatched types for Eq: Cannot compare {left} and {right}",
+                        "Cannot perform == on {left} type.", unit_result=True),
+    Ne: BinaryOperation("Ne", operator.ne, _COMPARABLE,
+                        "Mismatched types for Ne: Cannot compare {left} and {right}",
+                        "Cannot perform != on {left} type.", unit_result=False),
+}
+
+
+def not_value(value: Any, value_type: Type) -> Tuple[Any, Type]:
+    if type(value_type) is not Boolean:
+        raise InterpTypeError(
+            "Cannot perform logical not on non-boolean operand.")
+    return (not value, value_type)
+
+
+def condition_error(construct: str) -> InterpTypeError:
+    return InterpTypeError(f"Cannot perform {construct} on non-boolean condition.")
+
+
+def assignment_error(value_type: Type, variable_type: Type) -> InterpTypeError:
+    return InterpTypeError(f"Mismatched types for Assignment: Cannot assign {value_type} to {variable_type}")
+
+
+def unassigned_error(variable_name: str) -> InterpSyntaxError:
+    return InterpSyntaxError(f"Cannot read from {variable_name} before assignment.")
+
+
+def print_value(value: Any, value_type: Type) -> None:
+    OUTPUT.get().write("Unit" if type(value_type) is Unit else f"{value}")
@@ -0,0 +1,398 @@
+from typing import Callable, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.typecheck import check
+from stimpl.rope import flatten
+
+"""
+Expr-to-Expr optimization passes.
+
+Every pass returns a program that behaves exactly like its input: same
+value, type, final state and output, and the same error at the same
+point. In particular nothing that raises is ever folded away -- a
+mismatched or unsupported operation, or a division by a literal zero,
+is left in place for the runtime to raise.
+
+  fold      evaluates operators whose operands are all literals
+  simplify  removes algebraic identities (x * 1, x + 0, s + "", b && true,
+            !!b, ...) where the type checker proved x's type
+  prune     drops constant If branches, never-entered While bodies,
+            literals whose value a Sequence discards and one-element
+            Sequences
+  hoist     moves loop-invariant subexpressions out of While loops into
+            temporaries assigned just before the loop
+"""
+
+__all__ = ['PassReport', 'OptimizationReport', 'count_nodes', 'literal', 'literal_value',
+           'fold', 'simplify', 'prune', 'hoist', 'PASSES', 'optimize']
+
+
+class PassReport(object):
+    def __init__(self, name: str, nodes_before: int, nodes_after: int) -> None:
+        self.name = name
+        self.nodes_before = nodes_before
+        self.nodes_after = nodes_after
+        self.removed = nodes_before - nodes_after
+
+    def __repr__(self) -> str:
+        return f"{self.name}: {self.nodes_before} -> {self.nodes_after} nodes ({self.removed} removed)"
+
+
+class OptimizationReport(object):
+    def __init__(self) -> None:
+        self.passes: List[PassReport] = []
+
+    @property
+    def removed(self) -> int:
+        return sum(report.removed for report in self.passes)
+
+    def __repr__(self) -> str:
+        return "\n".join(repr(report) for report in self.passes)
+
+
+def count_nodes(expression: Expr) -> int:
+    count = 0
+    pending = [expression]
+    while pending:
+        expression = pending.pop()
+        count += 1
+        pending.extend(children(expression))
+    return count
+
+
+def literal(value, value_type: Type) -> Expr:
+    """
+    The literal expression that evaluates to value.
+    """
+    match value_type:
+        case Unit():
+            return Ren()
+        case Integer():
+            return IntLiteral(value)
+        case FloatingPoint():
+            return FloatingPointLiteral(value)
+        case String():
+            return StringLiteral(flatten(value))
+        case Boolean():
+            return BooleanLiteral(value)
+
+
+def literal_value(expression: Expr) -> Optional[Tuple]:
+    """
+    The (value, type) of a literal expression, or None for anything else.
+    """
+    match expression:
+        case Ren():
+            return (None, UNIT)
+        case IntLiteral(literal=l):
+            return (l, INTEGER)
+        case FloatingPointLiteral(literal=l):
+            return (l, FLOATING_POINT)
+        case StringLiteral(literal=l):
+            return (l, STRING)
+        case BooleanLiteral(literal=l):
+            return (l, BOOLEAN)
+        case _:
+            return None
+
+
+def fold(program: Expr) -> Expr:
+    def visit(expression):
+        expression = map_children(expression, visit)
+        match expression:
+            case BinaryOperator(left=left, right=right) if type(expression) in BINARY_OPERATIONS:
+                left_literal = literal_value(left)
+                right_literal = literal_value(right)
+                if left_literal is None or right_literal is None:
+                    return expression
+                try:
+                    value, value_type = BINARY_OPERATIONS[type(expression)].apply(
+                        *left_literal, *right_literal)
+                except InterpError:
+                    return expression
+                return literal(value, value_type)
+
+            case Not(expr=expr):
+                operand = literal_value(expr)
+                if operand is None or type(operand[1]) is not Boolean:
+                    return expression
+                return BooleanLiteral(not operand[0])
+
+            case _:
+                return expression
+    return visit(program)
+
+
+def simplify(program: Expr) -> Expr:
+    types = check(program)
+
+    # Types of the nodes this pass builds, which the report cannot know
+    # about: every node has the type of the node it replaces.
+    rebuilt_types = {}
+
+    def type_of(expression):
+        if id(expression) in rebuilt_types:
+            return rebuilt_types[id(expression)]
+        return types.type_of(expression)
+
+    def visit(expression):
+        result = rewrite(map_children(expression, visit))
+        if result is not expression:
+            rebuilt_types[id(result)] = types.type_of(expression)
+        return result
+
+    def rewrite(expression):
+        match expression:
+            case BinaryOperator(left=left, right=right):
+                for operand, other, identities in ((left, right, _RIGHT_IDENTITIES),
+                                                   (right, left, _LEFT_IDENTITIES)):
+                    literal = literal_value(other)
+                    if literal is None:
+                        continue
+                    for value, value_type in identities.get(type(expression), ()):
+                        # Compared like literals: 0.0 is an identity
+                        # where -0.0 is not.
+                        if type(type_of(operand)) is type(value_type) and literal[1] is value_type \
+                                and literal_key(literal[0]) == literal_key(value):
+                            return operand
+                return expression
+
+            case Not(expr=Not(expr=inner)) if type(type_of(inner)) is Boolean:
+                return inner
+
+            case _:
+                return expression
+    return visit(program)
+
+
+# (operator, identity literal) pairs for x op literal == x ...
+_RIGHT_IDENTITIES = {
+    Add: [(0, INTEGER), ("", STRING)],
+    Subtract: [(0, INTEGER), (0.0, FLOATING_POINT)],
+    Multiply: [(1, INTEGER), (1.0, FLOATING_POINT)],
+    Divide: [(1, INTEGER), (1.0, FLOATING_POINT)],
+    And: [(True, BOOLEAN)],
+    Or: [(False, BOOLEAN)],
+}
+# ... and for literal op x == x. Adding 0.0 is not an identity: -0.0 + 0.0
+# is 0.0.
+_LEFT_IDENTITIES = {
+    Add: [(0, INTEGER), ("", STRING)],
+    Multiply: [(1, INTEGER), (1.0, FLOATING_POINT)],
+    And: [(True, BOOLEAN)],
+    Or: [(False, BOOLEAN)],
+}
+
+
+def prune(program: Expr) -> Expr:
+    def visit(expression):
+        expression = map_children(expression, visit)
+        match expression:
+            case If(condition=BooleanLiteral(literal=condition), true=true, false=false):
+                return true if condition else false
+
+            case While(condition=BooleanLiteral(literal=False)):
+                return BooleanLiteral(False)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                # Literals cannot fail or have effects, so unless one is
+                # the value of the sequence it can go.
+                kept = [expr for expr in exprs[:-1]
+                        if literal_value(expr) is None] + list(exprs[-1:])
+                if len(kept) == 0:
+                    return Ren()
+                if len(kept) == 1:
+                    return kept[0]
+                if len(kept) == len(exprs):
+                    return expression
+                return type(expression)(*kept)
+
+            case _:
+                return expression
+    return visit(program)
+
+
+def hoist(program: Expr) -> Expr:
+    """
+    Loop-invariant code motion. A subexpression of a While loop is
+    hoisted when
+
+      - it is pure: only literals, variables and operators;
+      - it cannot raise: the checker proved every operand type, every
+        variable it reads is assigned before the loop is reached, and it
+        only divides by non-zero literals;
+      - it is invariant: the loop never assigns a variable it reads.
+
+    Such an expression has the same value every time the loop evaluates
+    it, and evaluating it once more (or once when the loop runs zero
+    times) is unobservable, so it is computed once into a Temporary
+    before the loop. Temporaries are named apart from every variable the
+    program uses.
+    """
+    types = check(program)
+    entry_assigned = _assigned_at_loop_entry(program)
+    used_names = set(_variable_names(program))
+    temporaries = []
+
+    def temporary():
+        while True:
+            name = f"${len(temporaries)}"
+            temporaries.append(name)
+            if name not in used_names:
+                return Temporary(name)
+
+    def hoistable(expression, written, assigned):
+        if not isinstance(expression, (BinaryOperator, Not)):
+            # Hoisting a literal or a variable read saves nothing.
+            return False
+        pending = [expression]
+        while pending:
+            node = pending.pop()
+            # Nodes this pass rebuilt have no verdict; the next round of
+            # optimize() gets to them.
+            if types.type_of(node) is None:
+                return False
+            match node:
+                case Variable(variable_name=variable_name):
+                    if variable_name in written or variable_name not in assigned:
+                        return False
+                case Divide(right=right):
+                    divisor = literal_value(right)
+                    if divisor is None or divisor[0] == 0:
+                        return False
+                    pending.append(node.left)
+                case BinaryOperator(left=left, right=right) if type(node) in BINARY_OPERATIONS:
+                    pending.extend((left, right))
+                case Not(expr=expr):
+                    pending.append(expr)
+                case Literal() | Ren():
+                    pass
+                case _:
+                    return False
+        return True
+
+    def visit(expression):
+        original = expression
+        expression = map_children(expression, visit)
+        if not isinstance(expression, While):
+            return expression
+        written = _assigned_names(expression)
+        assigned = entry_assigned[id(original)]
+        hoisted = {}
+
+        def replace(node):
+            if hoistable(node, written, assigned):
+                if node not in hoisted:
+                    hoisted[node] = temporary()
+                return hoisted[node]
+            return map_children(node, replace)
+
+        loop = map_children(expression, replace)
+        if not hoisted:
+            return expression
+        return Sequence(*[Assign(variable, value) for value, variable in hoisted.items()], loop)
+
+    return visit(program)
+
+
+def _variable_names(expression: Expr):
+    pending = [expression]
+    while pending:
+        expression = pending.pop()
+        match expression:
+            case Variable(variable_name=variable_name) | Assign(variable=Variable(variable_name=variable_name)):
+                yield variable_name
+        pending.extend(children(expression))
+
+
+def _assigned_names(expression: Expr) -> set:
+    names = set()
+    pending = [expression]
+    while pending:
+        expression = pending.pop()
+        if isinstance(expression, Assign):
+            names.add(expression.variable.variable_name)
+        pending.extend(children(expression))
+    return names
+
+
+def _assigned_at_loop_entry(program: Expr) -> dict:
+    """
+    For every While in program (by id), the variables that are certainly
+    assigned whenever the loop is reached. A While that occurs more than
+    once in the tree (reused, or shared by interning) gets the variables
+    assigned at every one of its occurrences.
+    """
+    entry = {}
+    assigned = frozenset()
+    # The sets put aside while a branch, a loop body or a right operand
+    # that may not run is walked.
+    saved = []
+    # Expressions still to walk, and (step, variable name) markers for
+    # what to do with assigned once the expressions above them are done.
+    pending = [program]
+    while pending:
+        expression = pending.pop()
+        if type(expression) is tuple:
+            step, variable_name = expression
+            if step == "assign":
+                assigned = assigned | {variable_name}
+            elif step == "save":
+                saved.append(assigned)
+            elif step == "restore":
+                assigned = saved.pop()
+            elif step == "else":
+                # The false branch starts from where the true one did.
+                assigned, saved[-1] = saved[-1], assigned
+            else:
+                assigned = assigned & saved.pop()
+            continue
+        match expression:
+            case Assign(variable=variable, value=value):
+                pending.extend((("assign", variable.variable_name), value))
+            case If(condition=condition, true=true, false=false):
+                pending.extend((("join", None), false, ("else", None), true, ("save", None), condition))
+            case While(condition=condition, body=body):
+                reached = entry.get(id(expression))
+                entry[id(expression)] = assigned if reached is None else reached & assigned
+                pending.extend((("restore", None), body, ("save", None), condition))
+            case And(left=left, right=right) | Or(left=left, right=right):
+                # The right operand is skipped when short-circuiting.
+                pending.extend((("restore", None), right, ("save", None), left))
+            case _:
+                pending.extend(reversed(children(expression)))
+    return entry
+
+
+PASSES: List[Tuple[str, Callable[[Expr], Expr]]] = [
+    ("fold", fold),
+    ("simplify", simplify),
+    ("prune", prune),
+    ("hoist", hoist),
+]
+
+
+def optimize(program: Expr, passes=PASSES, max_rounds: int = 10) -> Tuple[Expr, OptimizationReport]:
+    """
+    Runs the passes over program until none of them changes it any more
+    (or max_rounds is reached). Returns the optimized program and a
+    report of how many nodes each pass run removed.
+    """
+    report = OptimizationReport()
+    nodes = count_nodes(program)
+    for _ in range(max_rounds):
+        changed = False
+        for name, optimization_pass in passes:
+            optimized = optimization_pass(program)
+            if optimized is not program:
+                changed = True
+            program = optimized
+            optimized_nodes = count_nodes(program)
+            report.passes.append(PassReport(name, nodes, optimized_nodes))
+            nodes = optimized_nodes
+        if not changed:
+            break
+    return (program, report)
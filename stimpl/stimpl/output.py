@@ -0,0 +1,135 @@
+import contextlib
+import sys
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, TextIO
+
+"""
+Where Print sends its output.
+
+The tree walker's Print arm, and operations.print_value, which every
+other engine prints through, render the value the same way ("Unit" for
+Unit, f"{value}" for everything else) and hand the line to the sink of
+the run that is in progress. A run gets a sink with
+run_stimpl(..., output=sink); the sink is flushed when the run ends,
+whether or not it raises. Without one, lines go straight to sys.stdout,
+as builtin print() would send them (so contextlib.redirect_stdout still
+captures them).
+
+The sink of a run is held in a context variable rather than passed to
+every engine, so a compiled or transpiled program need not be compiled
+again for another sink, and runs in other threads or asyncio tasks keep
+their own sinks.
+"""
+
+# Characters a BufferedSink holds before writing them out.
+DEFAULT_FLUSH_AT = 64 * 1024
+
+
+class OutputSink(ABC):
+    """
+    Takes the lines a program prints. write() is called once per Print
+    with the rendered line, without its newline; flush() once when the
+    run ends.
+    """
+
+    @abstractmethod
+    def write(self, line: str) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+class StreamSink(OutputSink):
+    """
+    Writes every line to stream as it is printed; with no stream, to
+    whatever sys.stdout is at the time. This is what a run without a
+    sink does.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream
+
+    def write(self, line: str) -> None:
+        (sys.stdout if self.stream is None else self.stream).write(line + "\n")
+
+    def flush(self) -> None:
+        (sys.stdout if self.stream is None else self.stream).flush()
+
+
+class BufferedSink(OutputSink):
+    """
+    Collects lines and writes them to stream (or sys.stdout) in one go
+    once flush_at characters are waiting, and when flushed. A program
+    that prints every iteration makes one write per buffer instead of
+    one per line.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, flush_at: int = DEFAULT_FLUSH_AT) -> None:
+        if flush_at < 1:
+            raise ValueError("flush_at must be a positive integer.")
+        self.stream = stream
+        self.flush_at = flush_at
+        self.pending: List[str] = []
+        self.size = 0
+
+    def write(self, line: str) -> None:
+        self.pending.append(line)
+        self.size += len(line) + 1
+        if self.size >= self.flush_at:
+            self.flush()
+
+    def flush(self) -> None:
+        stream = sys.stdout if self.stream is None else self.stream
+        if self.pending:
+            self.pending.append("")
+            text = "\n".join(self.pending)
+            self.pending = []
+            self.size = 0
+            stream.write(text)
+        stream.flush()
+
+
+class ListSink(OutputSink):
+    """
+    Keeps the printed lines in memory, in lines.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+
+    def write(self, line: str) -> None:
+        self.lines.append(line)
+
+    def text(self) -> str:
+        """
+        The output as it would have appeared on stdout.
+        """
+        return "".join(line + "\n" for line in self.lines)
+
+
+class NullSink(OutputSink):
+    """
+    Throws the output away.
+    """
+
+    def write(self, line: str) -> None:
+        pass
+
+
+OUTPUT: ContextVar[OutputSink] = ContextVar("stimpl_output", default=StreamSink())
+
+
+@contextlib.contextmanager
+def writing_to(sink: OutputSink) -> Iterator[OutputSink]:
+    """
+    Sends what is printed inside the with block to sink, and flushes it
+    on the way out.
+    """
+    token = OUTPUT.set(sink)
+    try:
+        yield sink
+    finally:
+        OUTPUT.reset(token)
+        sink.flush()
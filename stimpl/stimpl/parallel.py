@@ -0,0 +1,180 @@
+import contextlib
+import io
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import State, RunOptions, ENGINES, run_stimpl
+
+"""
+Running many independent programs on all cores.
+
+run_parallel() hands programs to a process pool in chunks, so that a
+worker runs a whole chunk per round trip, and keeps only a few chunks
+per worker in flight, so that a million programs never sit in memory at
+once. Results come back as soon as their chunk finishes, in no
+particular order; each carries the index of its program.
+
+Every program runs as if by run_stimpl. What it prints is captured into
+its result, and whatever it raises is captured too: InterpErrors as
+they are, a program that runs out of time as InterpTimeoutError, and
+anything else (a RecursionError, say) as an InterpError naming it. A
+worker process that dies takes the programs of its chunks with it --
+they come back with an InterpError -- and the rest go to a fresh pool.
+
+Programs travel in the binary format of stimpl.serialize and States as
+flat lists of bindings (see Expr.__reduce__ and State.__reduce__), so
+neither pickling nor unpickling recurses.
+"""
+
+DEFAULT_CHUNK_SIZE = 64
+# Chunks in flight per worker: enough that no worker waits for the next
+# one to be pickled.
+_CHUNKS_PER_WORKER = 2
+
+
+class ProgramResult(object):
+    """
+    How one program ran: its value, type and final state, or the error
+    it raised (with value, type and state None), what it printed and how
+    long it took.
+    """
+
+    def __init__(self, index: int, value: Any, value_type: Optional[Type], state: Optional[State],
+                 output: str, error: Optional[InterpError], elapsed: float) -> None:
+        self.index = index
+        self.value = value
+        self.type = value_type
+        self.state = state
+        self.output = output
+        self.error = error
+        self.elapsed = elapsed
+
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return f"ProgramResult({self.index}: {type(self.error).__name__}: {self.error})"
+        return f"ProgramResult({self.index}: {self.value!r}, {self.type})"
+
+
+def run_parallel(programs: Iterable[Expr], workers: Optional[int] = None,
+                 timeout: Optional[float] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 keep_state: bool = True, engine: str = "tree",
+                 **options: Any) -> Iterator[ProgramResult]:
+    """
+    Runs every program in a pool of worker processes (by default one
+    per core) and yields their results as they finish. timeout bounds
+    each program's run in seconds; keep_state=False leaves final states
+    in the workers when only values and outputs matter. engine and the
+    other keyword arguments are run_stimpl's.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}.")
+    # Bad options fail here rather than once per program.
+    RunOptions(**options)
+    if timeout is not None:
+        if timeout <= 0:
+            raise ValueError("timeout must be positive.")
+        if not hasattr(signal, "setitimer"):
+            raise ValueError("Timeouts need signal.setitimer, which this platform lacks.")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+    workers = workers or os.cpu_count() or 1
+    settings = (engine, options, timeout, keep_state)
+
+    chunks = _chunks(programs, chunk_size)
+    executor = ProcessPoolExecutor(workers)
+    # future -> (the executor it was submitted to, its program indices)
+    pending: Dict[Any, Tuple[ProcessPoolExecutor, List[int]]] = {}
+    try:
+        while True:
+            while len(pending) < workers * _CHUNKS_PER_WORKER:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                future = executor.submit(_run_chunk, chunk, settings)
+                pending[future] = (executor, [index for index, _ in chunk])
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                submitted_to, indices = pending.pop(future)
+                try:
+                    results = future.result()
+                except BrokenProcessPool as e:
+                    if submitted_to is executor:
+                        executor.shutdown(wait=False)
+                        executor = ProcessPoolExecutor(workers)
+                    results = [ProgramResult(index, None, None, None, "",
+                                             InterpError(f"Worker process died: {e}"), 0.0)
+                               for index in indices]
+                yield from results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _chunks(programs: Iterable[Expr], chunk_size: int) -> Iterator[List[Tuple[int, Expr]]]:
+    chunk = []
+    for index, program in enumerate(programs):
+        chunk.append((index, program))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Timeout(BaseException):
+    # Not an Exception, so nothing between the alarm and _run_one can
+    # swallow it.
+    pass
+
+
+_armed = False
+
+
+def _alarm(signum: int, frame: Any) -> None:
+    if _armed:
+        raise _Timeout()
+
+
+def _run_chunk(chunk: List[Tuple[int, Expr]], settings: tuple) -> List[ProgramResult]:
+    engine, options, timeout, keep_state = settings
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _alarm)
+    return [_run_one(index, program, engine, options, timeout, keep_state)
+            for index, program in chunk]
+
+
+def _run_one(index: int, program: Expr, engine: str, options: Dict[str, Any],
+             timeout: Optional[float], keep_state: bool) -> ProgramResult:
+    global _armed
+    output = io.StringIO()
+    value, value_type, state, error = None, None, None, None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            if timeout is not None:
+                _armed = True
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            try:
+                value, value_type, state = run_stimpl(
+                    program, engine=engine, **options)
+            finally:
+                _armed = False
+                if timeout is not None:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Timeout:
+        error = InterpTimeoutError(f"Timed out after {timeout} seconds.")
+    except InterpError as e:
+        error = e
+    except Exception as e:
+        error = InterpError(f"{type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - start
+    return ProgramResult(index, value, value_type, state if keep_state else None,
+                         output.getvalue(), error, elapsed)
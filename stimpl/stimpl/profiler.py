@@ -0,0 +1,201 @@
+import sys
+import time
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.runtime import State, RunOptions, DEFAULT_OPTIONS, instrumented_evaluate
+
+"""
+A per-node profiler for the tree walker.
+
+Profile.run() evaluates a program with a copy of runtime.evaluate whose
+recursive calls go through a timing wrapper instead of straight back
+into evaluate (see runtime.instrumented_evaluate). evaluate itself is
+untouched: a run without a profile pays nothing for this module
+existing.
+
+Every node instance (every object in the tree; an interned subtree that
+appears twice is one instance) gets a label in the order it is first
+evaluated, like While#3. For each instance and each node type the
+profile counts evaluations and adds up self time (spent in the node
+itself) and total time (including its children); every While also
+counts its iterations. Self time is also kept per stack of labels from
+the root, which is what write_collapsed() exports for flamegraph.pl,
+speedscope and the like. Times include the wrapper's own overhead, so
+they are best read relative to each other.
+
+The wrapper adds a Python frame per node, so a profiled program hits
+the recursion limit at about half the depth an unprofiled one does.
+"""
+
+# Longest node description a report shows.
+_DESCRIPTION_WIDTH = 60
+
+
+class NodeStats(object):
+    """
+    What one node instance (or, in Profile.types, one node type) cost.
+    """
+
+    def __init__(self, label: str, node: Optional[Expr] = None) -> None:
+        self.label = label
+        self.node = node
+        self.count = 0
+        self.self_ns = 0
+        self.total_ns = 0
+        self.iterations = 0
+
+    def __repr__(self) -> str:
+        return (f"{self.label}: {self.count} evaluations, self {self.self_ns / 1e6:.3f} ms, "
+                f"total {self.total_ns / 1e6:.3f} ms")
+
+
+class Profile(object):
+    """
+    Collects what the runs it is passed to cost, node by node. Runs add
+    up: profiling a program twice into one Profile counts it twice.
+    """
+
+    def __init__(self) -> None:
+        # Instances by id(); each NodeStats keeps its node alive, so the
+        # ids stay unique.
+        self.nodes: Dict[int, NodeStats] = {}
+        self.types: Dict[str, NodeStats] = {}
+        # Stacks of labels are interned as integers: (parent, label) -> id,
+        # and self time by id.
+        self._stack_ids: Dict[Tuple[int, str], int] = {}
+        self._stack_parents: List[Tuple[int, str]] = [(-1, "")]
+        self._stack_self_ns: List[int] = [0]
+
+    def run(self, program: Expr, state: State, options: RunOptions = DEFAULT_OPTIONS) -> Tuple[Any, Type, State]:
+        """
+        Evaluates program like runtime.evaluate, recording what every
+        node costs.
+        """
+        nodes = self.nodes
+        node_types = self.types
+        stack_ids = self._stack_ids
+        stack_parents = self._stack_parents
+        stack_self_ns = self._stack_self_ns
+        clock = time.perf_counter_ns
+        # How many activations of each type are running, so that the total
+        # time of a type counts nested activations once.
+        active: Dict[str, int] = {}
+        # [stats, stack id, time spent in children] for every running node.
+        frames: List[list] = [[None, 0, 0]]
+
+        def wrap(evaluate):
+            def profiled(expression: Expr, state: State, options: RunOptions = DEFAULT_OPTIONS):
+                stats = nodes.get(id(expression))
+                type_name = type(expression).__name__
+                if stats is None:
+                    stats = nodes[id(expression)] = NodeStats(
+                        f"{type_name}#{len(nodes) + 1}", expression)
+                parent = frames[-1]
+                parent_stats = parent[0]
+                if parent_stats is not None and type(parent_stats.node) is While \
+                        and expression is parent_stats.node.body:
+                    parent_stats.iterations += 1
+                key = (parent[1], stats.label)
+                stack_id = stack_ids.get(key)
+                if stack_id is None:
+                    stack_id = stack_ids[key] = len(stack_parents)
+                    stack_parents.append(key)
+                    stack_self_ns.append(0)
+                frame = [stats, stack_id, 0]
+                frames.append(frame)
+                active[type_name] = active.get(type_name, 0) + 1
+                start = clock()
+                try:
+                    return evaluate(expression, state, options)
+                finally:
+                    elapsed = clock() - start
+                    frames.pop()
+                    self_ns = elapsed - frame[2]
+                    frames[-1][2] += elapsed
+                    stats.count += 1
+                    stats.self_ns += self_ns
+                    stats.total_ns += elapsed
+                    stack_self_ns[stack_id] += self_ns
+                    type_stats = node_types.get(type_name)
+                    if type_stats is None:
+                        type_stats = node_types[type_name] = NodeStats(type_name)
+                    type_stats.count += 1
+                    type_stats.self_ns += self_ns
+                    active[type_name] -= 1
+                    if not active[type_name]:
+                        type_stats.total_ns += elapsed
+            return profiled
+
+        return instrumented_evaluate(wrap)(program, state, options)
+
+    def hot_spots(self, limit: Optional[int] = None) -> List[NodeStats]:
+        """
+        Node instances by self time, most expensive first.
+        """
+        ranked = sorted(self.nodes.values(), key=lambda stats: (-stats.self_ns, stats.label))
+        return ranked if limit is None else ranked[:limit]
+
+    def report(self, limit: int = 20) -> str:
+        """
+        The limit most expensive node instances and every node type, by
+        self time.
+        """
+        total_ns = sum(stats.self_ns for stats in self.types.values())
+        evaluations = sum(stats.count for stats in self.types.values())
+        lines = [f"{evaluations} node evaluations in {total_ns / 1e6:.3f} ms", "",
+                 f"{'self ms':>10} {'self %':>7} {'total ms':>10} {'count':>9} {'iterations':>10}  node"]
+        for stats in self.hot_spots(limit):
+            iterations = str(stats.iterations) if type(stats.node) is While else ""
+            lines.append(f"{stats.self_ns / 1e6:>10.3f} {_share(stats.self_ns, total_ns):>7} "
+                         f"{stats.total_ns / 1e6:>10.3f} {stats.count:>9} {iterations:>10}  "
+                         f"{stats.label} {_describe(stats.node)}")
+        lines += ["", f"{'self ms':>10} {'self %':>7} {'total ms':>10} {'count':>9}  type"]
+        for stats in sorted(self.types.values(), key=lambda stats: (-stats.self_ns, stats.label)):
+            lines.append(f"{stats.self_ns / 1e6:>10.3f} {_share(stats.self_ns, total_ns):>7} "
+                         f"{stats.total_ns / 1e6:>10.3f} {stats.count:>9}  {stats.label}")
+        return "\n".join(lines)
+
+    def print_report(self, limit: int = 20, file: Optional[TextIO] = None) -> None:
+        print(self.report(limit), file=file if file is not None else sys.stdout)
+
+    def collapsed(self) -> str:
+        """
+        The self time of every stack of nodes, in nanoseconds, in the
+        collapsed-stack format flame graph tools read: one line per
+        stack, its labels joined by semicolons and then its time.
+        """
+        lines = []
+        for stack_id in range(1, len(self._stack_parents)):
+            self_ns = self._stack_self_ns[stack_id]
+            if self_ns:
+                lines.append(f"{';'.join(self._stack(stack_id))} {self_ns}")
+        return "".join(line + "\n" for line in lines)
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w") as collapsed_file:
+            collapsed_file.write(self.collapsed())
+
+    def _stack(self, stack_id: int) -> List[str]:
+        labels = []
+        while stack_id > 0:
+            stack_id, label = self._stack_parents[stack_id]
+            labels.append(label)
+        labels.reverse()
+        return labels
+
+    def __repr__(self) -> str:
+        return self.report()
+
+
+def _share(part: int, whole: int) -> str:
+    return f"{100 * part / whole:.1f}%" if whole else "-"
+
+
+def _describe(node: Optional[Expr]) -> str:
+    description = " ".join(str(node).split())
+    if len(description) > _DESCRIPTION_WIDTH:
+        description = description[:_DESCRIPTION_WIDTH - 3] + "..."
+    return f"({description})"
@@ -0,0 +1,154 @@
+import sys
+from typing import Any, List, Union
+
+"""
+Rope-backed String values.
+
+Adding two Python strings copies both, so a loop that keeps appending to
+a STIMPL string copies the whole string every iteration -- and, since a
+State keeps every binding it has ever made, keeps every copy alive too.
+Every engine adds String values with concat() instead, which returns a
+plain str while the result is short and a Rope once it is long. A Rope
+shares the values it was made from, so appending to one costs the
+length of the piece appended, not of the whole string; short pieces
+appended one after another are merged into leaves of up to CHUNK
+characters so that the tree stays small.
+
+A Rope is flattened (once: the flat string is kept, and the tree dropped)
+whenever its characters are needed. It compares, hashes, formats and
+prints exactly like the str it stands for, so Lt, Eq and the rest order
+String values exactly as they always have, and Print writes the same
+text. run_stimpl returns a flat str as the program's value; a Rope left
+in the final state still compares equal to its str, and pickles as one.
+"""
+
+# Results shorter than this stay plain strs.
+ROPE_THRESHOLD = 512
+# Appended (or prepended) pieces are merged into one leaf while it stays
+# this short.
+CHUNK = 256
+
+_EMPTY_SIZE = sys.getsizeof("")
+
+
+class Rope(object):
+    __slots__ = ('left', 'right', 'length', '_flat')
+
+    def __init__(self, left: Union[str, 'Rope'], right: Union[str, 'Rope']) -> None:
+        self.left = left
+        self.right = right
+        self.length = len(left) + len(right)
+        self._flat = None
+
+    def flatten(self) -> str:
+        flat = self._flat
+        if flat is None:
+            # Iteratively: a rope built by appending is as deep as it has
+            # leaves.
+            parts: List[str] = []
+            stack: List[Union[str, Rope]] = [self]
+            while stack:
+                node = stack.pop()
+                if type(node) is str:
+                    parts.append(node)
+                elif node._flat is not None:
+                    parts.append(node._flat)
+                else:
+                    stack.append(node.right)
+                    stack.append(node.left)
+            flat = self._flat = "".join(parts)
+            self.left = self.right = None
+        return flat
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    def __str__(self) -> str:
+        return self.flatten()
+
+    def __format__(self, format_spec: str) -> str:
+        return format(self.flatten(), format_spec)
+
+    def __repr__(self) -> str:
+        return repr(self.flatten())
+
+    def __hash__(self) -> int:
+        return hash(self.flatten())
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return len(other) == self.length and self.flatten() == flatten(other)
+
+    def __ne__(self, other: Any) -> bool:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return len(other) != self.length or self.flatten() != flatten(other)
+
+    def __lt__(self, other: Any) -> bool:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return self.flatten() < flatten(other)
+
+    def __le__(self, other: Any) -> bool:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return self.flatten() <= flatten(other)
+
+    def __gt__(self, other: Any) -> bool:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return self.flatten() > flatten(other)
+
+    def __ge__(self, other: Any) -> bool:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return self.flatten() >= flatten(other)
+
+    def __add__(self, other: Any) -> Union[str, 'Rope']:
+        if type(other) is not str and type(other) is not Rope:
+            return NotImplemented
+        return concat(self, other)
+
+    def __radd__(self, other: Any) -> Union[str, 'Rope']:
+        if type(other) is not str:
+            return NotImplemented
+        return concat(other, self)
+
+    def __sizeof__(self) -> int:
+        # About what the string takes flat (counting one byte a
+        # character), so that a budget on the state size does not see a
+        # long string shrink when it becomes a rope.
+        return _EMPTY_SIZE + self.length
+
+    def __reduce__(self):
+        return (str, (self.flatten(),))
+
+
+def concat(left: Union[str, Rope], right: Union[str, Rope]) -> Union[str, Rope]:
+    """
+    left + right, for String values.
+    """
+    if type(left) is str and type(right) is str and len(left) + len(right) < ROPE_THRESHOLD:
+        return left + right
+    if not right:
+        return left
+    if not left:
+        return right
+    if type(right) is str and type(left) is Rope and type(left.right) is str \
+            and len(left.right) + len(right) <= CHUNK:
+        return Rope(left.left, left.right + right)
+    if type(left) is str and type(right) is Rope and type(right.left) is str \
+            and len(left) + len(right.left) <= CHUNK:
+        return Rope(left + right.left, right.right)
+    return Rope(left, right)
+
+
+def flatten(value: Any) -> Any:
+    """
+    value, with a Rope replaced by its str.
+    """
+    return value.flatten() if type(value) is Rope else value
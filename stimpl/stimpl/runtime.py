@@ -1,8 +1,14 @@
-from typing import Any, Tuple, Optional
+from contextlib import contextmanager as _contextmanager, nullcontext as _nullcontext
+from sys import getsizeof as _getsizeof
+from types import FunctionType as _FunctionType
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Optional
 
 from stimpl.expression import *
 from stimpl.types import *
 from stimpl.errors import *
+from stimpl.hamt import HashTrie
+from stimpl.output import OUTPUT, writing_to
+from stimpl.rope import Rope, concat
 
 """
 Interpreter State
@@ -25,12 +31,91 @@ class State(object):
         """
         Retrives the value and type of a variable in the state.
         """
-        if variable_name == self.variable_name:
-            return self.value
-        return self.next_state.get_value(variable_name)
+        state = self
+        while type(state) is State:
+            if variable_name == state.variable_name:
+                return state.value
+            state = state.next_state
+        return state.get_value(variable_name)
+
+    def compact(self, base: 'State') -> 'State':
+        """
+        Returns an equivalent state in which the bindings made on top of
+        base are collapsed to the latest binding of each variable. Nothing
+        is mutated: base and any other snapshot stay valid, and shadowed
+        bindings are freed once no snapshot refers to them.
+        """
+        latest = []
+        seen = set()
+        depth = 0
+        state = self
+        while state is not base and type(state) is State:
+            depth += 1
+            if state.variable_name not in seen:
+                seen.add(state.variable_name)
+                latest.append(state)
+            state = state.next_state
+        if state is not base or len(latest) == depth:
+            # Either base is not below us or there is nothing to drop.
+            return self
+        for binding in reversed(latest):
+            variable_value, variable_type = binding.value
+            state = State(binding.variable_name,
+                          variable_value, variable_type, state)
+        return state
+
+    def forget(self, variable_names, base: 'State') -> 'State':
+        """
+        Returns an equivalent state in which the variables in
+        variable_names have the bindings they had in base: the bindings
+        made to them on top of base are left out.
+        """
+        kept = []
+        depth = 0
+        state = self
+        while state is not base and type(state) is State:
+            depth += 1
+            if state.variable_name not in variable_names:
+                kept.append(state)
+            state = state.next_state
+        if len(kept) == depth:
+            return self
+        for binding in reversed(kept):
+            variable_value, variable_type = binding.value
+            state = State(binding.variable_name,
+                          variable_value, variable_type, state)
+        return state
+
+    def depth(self, base: Optional['State'] = None) -> int:
+        """
+        Counts the bindings between this state and base (or the end of the
+        chain).
+        """
+        depth = 0
+        state = self
+        while state is not base and type(state) is State:
+            depth += 1
+            state = state.next_state
+        return depth
+
+    def __reduce__(self):
+        # The chain is pickled as a flat list of bindings (newest first)
+        # and whatever state it ends in, so deep states neither recurse
+        # nor hit the recursion limit.
+        bindings = []
+        state = self
+        while type(state) is State:
+            bindings.append((state.variable_name,) + state.value)
+            state = state.next_state
+        return (_rebuild_chain, (bindings, state))
 
     def __repr__(self) -> str:
-        return f"{self.variable_name}: {self.value}, " + repr(self.next_state)
+        bindings = []
+        state = self
+        while type(state) is State:
+            bindings.append(f"{state.variable_name}: {state.value}, ")
+            state = state.next_state
+        return "".join(bindings) + repr(state)
 
 
 class EmptyState(State):
@@ -43,41 +128,267 @@ class EmptyState(State):
     def get_value(self, variable_name) -> None:
         return None
 
+    def compact(self, base: State) -> 'EmptyState':
+        return self
+
+    def forget(self, variable_names, base: State) -> 'EmptyState':
+        return self
+
+    def __reduce__(self):
+        return (EmptyState, ())
+
     def __repr__(self) -> str:
         return ""
 
 
+class HashTrieState(State):
+    """
+    A persistent state backed by a hash array mapped trie. Like the linked
+    State, every set_value returns a new state and leaves the old one
+    intact, but lookups and updates are O(log n) instead of O(n) in the
+    number of assignments made so far.
+    """
+
+    def __init__(self, trie: Optional[HashTrie] = None) -> None:
+        self.trie = trie if trie is not None else HashTrie()
+
+    def copy(self) -> 'HashTrieState':
+        return HashTrieState(self.trie)
+
+    def set_value(self, variable_name, variable_value, variable_type):
+        return HashTrieState(self.trie.set(variable_name, (variable_value, variable_type)))
+
+    def get_value(self, variable_name) -> Any:
+        return self.trie.get(variable_name)
+
+    def compact(self, base: State) -> 'HashTrieState':
+        # Rebinding a variable already replaces its entry.
+        return self
+
+    def forget(self, variable_names, base: State) -> 'HashTrieState':
+        changed = [variable_name for variable_name in variable_names
+                   if self.trie.get(variable_name) is not base.get_value(variable_name)]
+        if not changed:
+            return self
+        # The trie cannot delete, so rebuild it without them.
+        trie = HashTrie()
+        for variable_name, value in self.trie.items():
+            if variable_name not in variable_names:
+                trie = trie.set(variable_name, value)
+        for variable_name in variable_names:
+            value = base.get_value(variable_name)
+            if value is not None:
+                trie = trie.set(variable_name, value)
+        return HashTrieState(trie)
+
+    def __reduce__(self):
+        return (HashTrieState, (self.trie,))
+
+    def __repr__(self) -> str:
+        return "".join(f"{variable_name}: {value}, " for variable_name, value in self.trie.items())
+
+
+def _rebuild_chain(bindings, state: State) -> State:
+    for variable_name, variable_value, variable_type in reversed(bindings):
+        state = State(variable_name, variable_value, variable_type, state)
+    return state
+
+
+"""
+Budgets
+"""
+
+# What a binding costs besides its value: the (value, type) pair every
+# engine keeps for it.
+_BINDING_BYTES = _getsizeof((None, None))
+
+
+class Budget(object):
+    """
+    The resources left to one run: how many more steps it may take and
+    how large its state may grow. A step is one run of a While body, so
+    it is the same in every engine, and every engine charges it before
+    running the body. The size of a state is the size of its live
+    bindings -- the latest value of each variable plus a fixed cost per
+    binding -- so shadowed bindings a State still holds do not count,
+    and a frame measures the same as the State it stands for. It is
+    checked at every step and once more at the end of the run.
+    """
+
+    def __init__(self, max_steps: Optional[int] = None, max_state_bytes: Optional[int] = None) -> None:
+        self.max_steps = max_steps
+        self.steps = max_steps
+        self.max_state_bytes = max_state_bytes
+        # The last state measured, and the sizes of its bindings by name.
+        self._measured: Any = None
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+
+    def step(self, state: Any) -> None:
+        """
+        Charges one step taken in state (a State or a frame).
+        """
+        steps = self.steps
+        if steps is not None:
+            if steps <= 0:
+                raise self.out_of_steps()
+            self.steps = steps - 1
+        if self.max_state_bytes is not None and self.state_bytes(state) > self.max_state_bytes:
+            raise self.too_large()
+
+    def check_state(self, state: Any) -> None:
+        """
+        Raises InterpResourceError if state is larger than the budget
+        allows.
+        """
+        if self.max_state_bytes is not None and self.state_bytes(state) > self.max_state_bytes:
+            raise self.too_large()
+
+    def out_of_steps(self) -> InterpResourceError:
+        return InterpResourceError(f"Ran out of steps: the budget allows {self.max_steps}.")
+
+    def too_large(self) -> InterpResourceError:
+        return InterpResourceError(
+            f"The state grew to {self._bytes} bytes; the budget allows {self.max_state_bytes}.")
+
+    def state_bytes(self, state: Any) -> int:
+        """
+        The size of state in bytes. A State that extends the one measured
+        last is measured by its new bindings alone.
+        """
+        if type(state) is list:
+            # A frame, with None for the variables still unassigned.
+            self._measured = None
+            total = 0
+            for binding in state:
+                if binding is not None:
+                    total += _getsizeof(binding[0]) + _BINDING_BYTES
+            self._bytes = total
+            return total
+        measured = self._measured
+        if state is measured:
+            return self._bytes
+        fresh: Dict[str, int] = {}
+        node = state
+        while type(node) is State and node is not measured:
+            if node.variable_name not in fresh:
+                fresh[node.variable_name] = _getsizeof(node.value[0]) + _BINDING_BYTES
+            node = node.next_state
+        if node is not measured:
+            # Not an extension (a compacted or unrelated state): start over.
+            if isinstance(node, HashTrieState):
+                for variable_name, binding in node.trie.items():
+                    if variable_name not in fresh:
+                        fresh[variable_name] = _getsizeof(binding[0]) + _BINDING_BYTES
+            self._sizes = fresh
+            self._bytes = sum(fresh.values())
+        else:
+            sizes = self._sizes
+            total = self._bytes
+            for variable_name, size in fresh.items():
+                total += size - sizes.get(variable_name, 0)
+                sizes[variable_name] = size
+            self._bytes = total
+        self._measured = state
+        return self._bytes
+
+
+"""
+Run options
+"""
+
+
+class RunOptions(object):
+    """
+    Knobs that change how a program is executed without changing what it
+    computes.
+
+    compact_every: when set, every While collapses the bindings its body
+    made to the latest binding of each variable once every compact_every
+    iterations, so a long loop keeps memory proportional to the number of
+    distinct variables instead of the number of iterations.
+
+    checked: type check the program statically (see stimpl.typecheck)
+    before running it. Engines that can trust the verdict leave the
+    type checks it proves unnecessary out of the code they run; the rest
+    stay, so a checked run raises what an unchecked one does, where it
+    does. A run from a state that binds a variable to another type than
+    the checker inferred for it gets no checks left out.
+
+    frame: keep bindings in a flat, slot-indexed mutable frame (see
+    stimpl.frame) instead of threading a persistent State, and build the
+    final State once at the end. Supported by the closure and vm
+    engines; compaction is moot there.
+
+    jit_threshold: the tree walker compiles a While loop to specialised
+    Python code once it has run this many iterations (see stimpl.jit).
+
+    short_circuit: And skips its right operand when the left one is
+    False, and Or when it is True. This changes what a program means
+    (the right operand's effects and errors may not happen), so the
+    program is always type checked first: a right operand the checker
+    can prove is not Boolean is rejected even where it would be skipped
+    (see stimpl.typecheck.TypeReport.verify).
+
+    max_steps, max_state_bytes: a run that would take more steps or grow
+    a larger state raises InterpResourceError (see Budget). The budget is
+    spent as the program runs, so options with one are good for one run.
+    """
+
+    def __init__(self, compact_every: Optional[int] = None, checked: bool = False, frame: bool = False,
+                 short_circuit: bool = False, jit_threshold: Optional[int] = None,
+                 max_steps: Optional[int] = None, max_state_bytes: Optional[int] = None) -> None:
+        if compact_every is not None and compact_every < 1:
+            raise ValueError("compact_every must be a positive integer.")
+        if jit_threshold is not None and jit_threshold < 1:
+            raise ValueError("jit_threshold must be a positive integer.")
+        if max_steps is not None and max_steps < 0:
+            raise ValueError("max_steps must not be negative.")
+        if max_state_bytes is not None and max_state_bytes < 0:
+            raise ValueError("max_state_bytes must not be negative.")
+        self.compact_every = compact_every
+        self.checked = checked
+        self.frame = frame
+        self.short_circuit = short_circuit
+        self.jit_threshold = jit_threshold
+        self.budget = Budget(max_steps, max_state_bytes) \
+            if max_steps is not None or max_state_bytes is not None else None
+
+
+DEFAULT_OPTIONS = RunOptions()
+
+
 """
 Main evaluation logic!
 """
 
 
-def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
+def evaluate(expression: Expr, state: State, options: RunOptions = DEFAULT_OPTIONS) -> Tuple[Optional[Any], Type, State]:
     match expression:
         case Ren():
-            return (None, Unit(), state)
+            return (None, UNIT, state)
 
         case IntLiteral(literal=l):
-            return (l, Integer(), state)
+            return (l, INTEGER, state)
 
         case FloatingPointLiteral(literal=l):
-            return (l, FloatingPoint(), state)
+            return (l, FLOATING_POINT, state)
 
         case StringLiteral(literal=l):
-            return (l, String(), state)
+            return (l, STRING, state)
 
         case BooleanLiteral(literal=l):
-            return (l, Boolean(), state)
+            return (l, BOOLEAN, state)
 
         case Print(to_print=to_print):
             printable_value, printable_type, new_state = evaluate(
-                to_print, state)
+                to_print, state, options)
 
             match printable_type:
                 case Unit():
-                    print("Unit")
+                    OUTPUT.get().write("Unit")
                 case _:
-                    print(f"{printable_value}")
+                    OUTPUT.get().write(f"{printable_value}")
 
             return (printable_value, printable_type, new_state)
 
@@ -85,10 +396,10 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             """ TODO: Implement. """
             # Evaluate each expression in the sequence
             current_state = state
-            result_value, result_type = None, Unit()
+            result_value, result_type = None, UNIT
             for expr in exprs:
                 result_value, result_type, current_state = evaluate(
-                    expr, current_state)
+                    expr, current_state, options)
             return (result_value, result_type, current_state)
 
         case Variable(variable_name=variable_name):
@@ -101,7 +412,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
 
         case Assign(variable=variable, value=value):
 
-            value_result, value_type, new_state = evaluate(value, state)
+            value_result, value_type, new_state = evaluate(value, state, options)
 
             variable_from_state = new_state.get_value(variable.variable_name)
             _, variable_type = variable_from_state if variable_from_state else (
@@ -117,16 +428,18 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
 
         case Add(left=left, right=right):
             result = 0
-            left_result, left_type, new_state = evaluate(left, state)
-            right_result, right_type, new_state = evaluate(right, new_state)
+            left_result, left_type, new_state = evaluate(left, state, options)
+            right_result, right_type, new_state = evaluate(right, new_state, options)
 
             if left_type != right_type:
                 raise InterpTypeError(f"""Mismatched types for Add:
             Cannot add {left_type} to {right_type}""")
 
             match left_type:
-                case Integer() | String() | FloatingPoint():
+                case Integer() | FloatingPoint():
                     result = left_result + right_result
+                case String():
+                    result = concat(left_result, right_result)
                 case _:
                     raise InterpTypeError(f"""Cannot add {left_type}s""")
 
@@ -136,8 +449,8 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             """ TODO: Implement. """
             # Evaluate the left and right expression
             result = 0
-            left_result, left_type, new_state = evaluate(left, state)
-            right_result, right_type, new_state = evaluate(right, new_state)
+            left_result, left_type, new_state = evaluate(left, state, options)
+            right_result, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -157,8 +470,8 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             """ TODO: Implement. """
             # Evaluate the left and right expression
             result = 0
-            left_result, left_type, new_state = evaluate(left, state)
-            right_result, right_type, new_state = evaluate(right, new_state)
+            left_result, left_type, new_state = evaluate(left, state, options)
+            right_result, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -178,8 +491,8 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             # Evaluate the left and right expression
             """ TODO: Implement. """
             result = 0
-            left_result, left_type, new_state = evaluate(left, state)
-            right_result, right_type, new_state = evaluate(right, new_state)
+            left_result, left_type, new_state = evaluate(left, state, options)
+            right_result, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -202,8 +515,10 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
             return (result, left_type, new_state)
 
         case And(left=left, right=right):
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            if options.short_circuit and left_type is BOOLEAN and not left_value:
+                return (left_value, left_type, new_state)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             if left_type != right_type:
                 raise InterpTypeError(f"""Mismatched types for And:
@@ -220,8 +535,10 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
         case Or(left=left, right=right):
             """ TODO: Implement. """
             # Evaluate the left and right expression
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            if options.short_circuit and left_type is BOOLEAN and left_value:
+                return (left_value, left_type, new_state)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -241,7 +558,7 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
         case Not(expr=expr):
             """ TODO: Implement. """
             # Evaluate the expression
-            value, value_type, new_state = evaluate(expr, state)
+            value, value_type, new_state = evaluate(expr, state, options)
 
             # Perform logical NOT based on the type
             match value_type:
@@ -256,21 +573,21 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
         case If(condition=condition, true=true, false=false):
             """ TODO: Implement. """
             # Evaluate the expression
-            value, value_type, new_state = evaluate(condition, state)
+            value, value_type, new_state = evaluate(condition, state, options)
 
             # Perform IF condition based on the type
             match value_type:
                 case Boolean():
                     if value:
-                        return evaluate(true, new_state)
-                    return evaluate(false, new_state)
+                        return evaluate(true, new_state, options)
+                    return evaluate(false, new_state, options)
                 case _:
                     raise InterpTypeError(
                         "Cannot perform if on non-boolean condition.")
 
         case Lt(left=left, right=right):
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             result = None
 
@@ -287,12 +604,12 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform < on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
         case Lte(left=left, right=right):
             """ TODO: Implement. """
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -309,13 +626,13 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform <= on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
         case Gt(left=left, right=right):
             """ TODO: Implement. """
             # Evaluate the left and right expressions
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -332,13 +649,13 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform > on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
         case Gte(left=left, right=right):
             """ TODO: Implement. """
             # Evaluate the left and right expressions
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -355,13 +672,13 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform >= on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
         case Eq(left=left, right=right):
             """ TODO: Implement. """
             # Evaluate the left and right expressions
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -378,13 +695,13 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform == on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
         case Ne(left=left, right=right):
             """ TODO: Implement. """
             # Evaluate the left and right expressions
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
+            left_value, left_type, new_state = evaluate(left, state, options)
+            right_value, right_type, new_state = evaluate(right, new_state, options)
 
             # Check for type mismatch
             if left_type != right_type:
@@ -401,34 +718,258 @@ def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State
                     raise InterpTypeError(
                         f"Cannot perform != on {left_type} type.")
 
-            return (result, Boolean(), new_state)
+            return (result, BOOLEAN, new_state)
 
         case While(condition=condition, body=body):
             """ TODO: Implement. """
             # Evaluate the condition
-            value, value_type, new_state = evaluate(condition, state)
+            value, value_type, new_state = evaluate(condition, state, options)
 
             # Perform while loop based on the condition's type
             match value_type:
                 case Boolean():
+                    compact_every = options.compact_every
+                    jit_threshold = options.jit_threshold
+                    budget = options.budget
+                    if compact_every:
+                        # Only bindings made by this loop are collapsed;
+                        # the state it started from may be shared.
+                        loop_state = new_state
+                    iterations = 0
+                    traced = None
+                    if value and jit_threshold:
+                        # The loop's iterations are counted on its record,
+                        # across entries. Once it is hot, code is compiled
+                        # for the types it is entered with.
+                        from stimpl.jit import loop_record, run_hot_loop
+                        traced = loop_record(expression)
+                        looped_state = run_hot_loop(
+                            traced, new_state, options, record=traced.iterations >= jit_threshold)
+                        if looped_state is not None:
+                            return (False, BOOLEAN, looped_state)
                     while value:
-                        _, _, new_state = evaluate(body, new_state)
+                        if budget is not None:
+                            budget.step(new_state)
+                        _, _, new_state = evaluate(body, new_state, options)
                         value, value_type, new_state = evaluate(
-                            condition, new_state)
+                            condition, new_state, options)
+                        iterations += 1
+                        if compact_every:
+                            if iterations % compact_every == 0:
+                                new_state = new_state.compact(loop_state)
+                        if traced is not None:
+                            traced.iterations += 1
+                            if traced.iterations == jit_threshold and value:
+                                looped_state = run_hot_loop(
+                                    traced, new_state, options, record=True)
+                                if looped_state is not None:
+                                    new_state = looped_state
+                                    break
                 case _:
                     raise InterpTypeError(
                         "Cannot perform while on non-boolean condition.")
 
-            return (False, Boolean(), new_state)
+            return (False, BOOLEAN, new_state)
 
         case _:
             raise InterpSyntaxError("Unhandled!")
     pass
 
 
-def run_stimpl(program, debug=False):
-    state = EmptyState()
-    program_value, program_type, program_state = evaluate(program, state)
+"""
+Instrumentation
+"""
+
+
+def instrumented_evaluate(wrap: Callable[[Callable], Callable]) -> Callable:
+    """
+    Returns wrap(copy), where copy is a copy of evaluate whose recursive
+    calls go to what wrap returns instead of back into evaluate. The copy
+    shares evaluate's code and differs only in its globals, so it means
+    exactly what evaluate means, and evaluate itself stays as fast as it
+    is without instrumentation.
+    """
+    namespace = dict(globals())
+    copy = _FunctionType(evaluate.__code__, namespace, evaluate.__name__, evaluate.__defaults__)
+    wrapper = namespace["evaluate"] = wrap(copy)
+    return wrapper
+
+
+HOOK_EVENTS = ("enter", "exit", "assign", "print", "error")
+
+
+class Hooks(object):
+    """
+    A registry of callbacks for what happens while the tree walker runs
+    a program:
+
+      enter(node, state)            before a node is evaluated
+      exit(node, result)            after it, with its (value, type,
+                                    state), or None if it raised
+      assign(name, value, type)     after a variable is assigned
+      print(value, type)            after a value is printed
+      error(node, error)            when node raises error, once for the
+                                    node it is raised in and before that
+                                    node's exit
+
+    run_stimpl only looks at HOOKS when something is installed in it,
+    and then runs the tree engine on an instrumented copy of evaluate
+    (see instrumented_evaluate), so a run without hooks is as fast as
+    ever. Hooks see every node, so the JIT is off while they are
+    installed. The other engines run compiled code and do not call
+    hooks, and a profiled run reports to its profile instead.
+    """
+
+    def __init__(self) -> None:
+        self._callbacks: Dict[str, List[Callable]] = {event: [] for event in HOOK_EVENTS}
+
+    def add(self, event: str, callback: Callable) -> Callable:
+        self._event(event).append(callback)
+        return callback
+
+    def remove(self, event: str, callback: Callable) -> None:
+        self._event(event).remove(callback)
+
+    def clear(self) -> None:
+        for callbacks in self._callbacks.values():
+            callbacks.clear()
+
+    @_contextmanager
+    def installed(self, event: str, callback: Callable) -> Iterator[Callable]:
+        """
+        Installs callback for the duration of a with block.
+        """
+        self.add(event, callback)
+        try:
+            yield callback
+        finally:
+            self.remove(event, callback)
+
+    def callbacks(self, event: str) -> Tuple[Callable, ...]:
+        return tuple(self._event(event))
+
+    def evaluator(self) -> Callable:
+        """
+        An evaluate that calls the callbacks installed now.
+        """
+        enter, exit_, assign, print_, error = (self.callbacks(event) for event in HOOK_EVENTS)
+        # The error being raised, so that only the node it is raised in
+        # reports it.
+        raising = [None]
+
+        def wrap(evaluate):
+            def hooked(expression, state, options=DEFAULT_OPTIONS):
+                for callback in enter:
+                    callback(expression, state)
+                try:
+                    result = evaluate(expression, state, options)
+                except Exception as e:
+                    if e is not raising[0]:
+                        raising[0] = e
+                        for callback in error:
+                            callback(expression, e)
+                    for callback in exit_:
+                        callback(expression, None)
+                    raise
+                expression_class = type(expression)
+                if expression_class is Assign:
+                    for callback in assign:
+                        callback(expression.variable.variable_name, result[0], result[1])
+                elif expression_class is Print:
+                    for callback in print_:
+                        callback(result[0], result[1])
+                for callback in exit_:
+                    callback(expression, result)
+                return result
+            return hooked
+        return instrumented_evaluate(wrap)
+
+    def _event(self, event: str) -> List[Callable]:
+        callbacks = self._callbacks.get(event)
+        if callbacks is None:
+            raise ValueError(f"Unknown hook event {event!r}; expected one of {HOOK_EVENTS}.")
+        return callbacks
+
+    def __bool__(self) -> bool:
+        return any(self._callbacks.values())
+
+
+HOOKS = Hooks()
+
+
+ENGINES = ["tree", "iterative", "closure", "vm", "python"]
+
+
+def run_stimpl(program, debug=False, state=None, compact_every=None, engine="tree", checked=False, frame=False,
+               short_circuit=False, jit_threshold=None, max_steps=None, max_state_bytes=None, profile=None,
+               output=None):
+    if state is None:
+        state = EmptyState()
+    options = RunOptions(compact_every=compact_every, checked=checked, frame=frame,
+                         short_circuit=short_circuit, jit_threshold=jit_threshold,
+                         max_steps=max_steps, max_state_bytes=max_state_bytes)
+    if profile and (engine != "tree" or jit_threshold or not isinstance(program, Expr)):
+        raise ValueError(
+            "Profiling times the tree walker's nodes; profile an Expr with the tree engine and no jit_threshold.")
+
+    if isinstance(program, Expr) and engine not in ("tree", "iterative"):
+        # The other engines (and the type checker) import this module, so
+        # load them on demand.
+        match engine:
+            case "closure":
+                from stimpl.compiler import compile
+                program = compile(program)
+            case "vm":
+                from stimpl.vm import lower
+                program = lower(program)
+            case "python":
+                from stimpl.transpile import transpiled
+                program = transpiled(program)
+            case _:
+                raise ValueError(
+                    f"Unknown engine {engine!r}; expected one of {ENGINES}.")
+
+    # The optimizer's temporaries are an implementation detail of the
+    # program, so they never show up in the state it ends in.
+    temporaries = temporary_names(program) if isinstance(
+        program, Expr) else program.temporaries
+
+    # Whatever the engine prints goes to output, which is flushed when the
+    # run ends (see stimpl.output).
+    with writing_to(output) if output is not None else _nullcontext():
+        if isinstance(program, Expr):
+            if frame:
+                raise ValueError(
+                    "The tree engines always thread a State; use frame with the closure or vm engine.")
+            if short_circuit:
+                from stimpl.typecheck import check
+                check(program).verify()
+            if profile:
+                from stimpl.profiler import Profile
+                profiler = Profile() if profile is True else profile
+                program_value, program_type, program_state = profiler.run(
+                    program, state, options)
+            elif engine == "iterative":
+                from stimpl.iterative import evaluate_iteratively
+                program_value, program_type, program_state = evaluate_iteratively(
+                    program, state, options)
+            elif HOOKS:
+                # Hooks see every node, so no loop is handed to the JIT.
+                options.jit_threshold = None
+                program_value, program_type, program_state = HOOKS.evaluator()(
+                    program, state, options)
+            else:
+                program_value, program_type, program_state = evaluate(
+                    program, state, options)
+        else:
+            # Compiled programs (stimpl.compiler, stimpl.vm) run themselves,
+            # and type check themselves once when asked to.
+            program_value, program_type, program_state = program.execute(
+                state, options)
+    if profile is True:
+        profiler.print_report()
+
+    program_value, program_state = finish_run(program_value, program_state, state, temporaries, options)
 
     if debug:
         print(f"program: {program}")
@@ -436,3 +977,63 @@ def run_stimpl(program, debug=False):
         print(f"final_state: {program_state}")
 
     return program_value, program_type, program_state
+
+
+DEFAULT_YIELD_EVERY = 1000
+
+
+async def run_stimpl_async(program, yield_every=DEFAULT_YIELD_EVERY, state=None, compact_every=None, checked=False,
+                           frame=False, short_circuit=False, max_steps=None, max_state_bytes=None, output=None):
+    """
+    Runs program like run_stimpl(program, engine="vm", ...), handing the
+    event loop back every yield_every steps (While iterations), so that
+    a long loop does not hold up other tasks. Cancelling the task stops
+    the program at its next pause. Output goes to output, or to stdout;
+    either way it is written as the program runs.
+    """
+    import asyncio
+    from stimpl.vm import Bytecode, lower
+    if yield_every < 1:
+        raise ValueError("yield_every must be a positive integer.")
+    if state is None:
+        state = EmptyState()
+    options = RunOptions(compact_every=compact_every, checked=checked, frame=frame,
+                         short_circuit=short_circuit, max_steps=max_steps, max_state_bytes=max_state_bytes)
+    if isinstance(program, Expr):
+        program = lower(program)
+    elif not isinstance(program, Bytecode):
+        raise ValueError("run_stimpl_async runs an Expr or the Bytecode lower() makes of one.")
+
+    with writing_to(output) if output is not None else _nullcontext():
+        steps = program.steps(state, options, yield_every)
+        try:
+            while True:
+                try:
+                    next(steps)
+                except StopIteration as finished:
+                    program_value, program_type, program_state = finished.value
+                    break
+                await asyncio.sleep(0)
+        finally:
+            steps.close()
+
+    program_value, program_state = finish_run(
+        program_value, program_state, state, program.temporaries, options)
+    return program_value, program_type, program_state
+
+
+def finish_run(program_value, program_state, state, temporaries, options):
+    """
+    What a run that started from state hands back once its program has
+    ended: a flat value, and a final state without the optimizer's
+    temporaries that fits the budget.
+    """
+    if type(program_value) is Rope:
+        program_value = program_value.flatten()
+    if temporaries:
+        program_state = program_state.forget(temporaries, state)
+    if options.budget is not None:
+        # A program without loops takes no steps but can still build a
+        # large state.
+        options.budget.check_state(program_state)
+    return program_value, program_state
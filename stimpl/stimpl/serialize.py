@@ -0,0 +1,409 @@
+import mmap
+import os
+import struct
+from collections.abc import Sequence as _SequenceABC
+from typing import Any, Dict, List, Union
+
+from stimpl.expression import *
+from stimpl.errors import *
+
+"""
+A compact binary format for programs.
+
+A file is a header, a pool of the strings the program uses (variable
+names and string literals), a pool of its numeric literals, the pool
+indices of the names that are the optimizer's Temporaries, and the
+program itself as a tagged node stream in evaluation order: each node is
+one tag byte followed by its pool indices and then its children. Every
+count and index is a LEB128 varint, so a typical node takes two or three
+bytes. Strings and numbers are stored once however often they occur.
+
+Sequences and Programs also record the encoded size of each of their
+statements (as a four-byte integer, patched in once the statement is
+written), so a statement can be found without decoding the ones before
+it. load() maps the file with mmap and decodes lazily: the statements of
+a Sequence or Program are decoded the first time something reads them,
+so a statement the evaluator never reaches stays on disk. Laziness stops
+at statements: any other node is decoded whole, with all its children,
+so the branch an If does not take is only left on disk when it is itself
+a Sequence. A loaded program is an ordinary Expr tree and compares,
+hashes and pickles like one.
+
+Neither encoding nor decoding recurses, so the depth of a program is only
+limited by memory.
+"""
+
+MAGIC = b"STPB"
+VERSION = 2
+# Version 1 files have no pool of Temporaries.
+_READABLE_VERSIONS = (1, 2)
+_HEADER = struct.Struct("<4sH")
+_DOUBLE = struct.Struct("<d")
+_SIZE = struct.Struct("<I")
+
+# Tags, in the order of _CLASSES.
+_CLASSES = [
+    Ren, IntLiteral, FloatingPointLiteral, StringLiteral, BooleanLiteral,
+    Variable, Assign, Print, Not,
+    And, Or, Lt, Lte, Gt, Gte, Eq, Ne, Add, Subtract, Multiply, Divide,
+    If, While, Sequence, Program,
+]
+_TAGS: Dict[type, int] = {
+    expression_class: tag for tag, expression_class in enumerate(_CLASSES)}
+# A Temporary is written as a Variable whose name is in the pool of
+# Temporaries.
+_TAGS[Temporary] = _TAGS[Variable]
+
+(_REN, _INT, _FLOAT, _STRING, _BOOLEAN, _VARIABLE, _ASSIGN, _PRINT, _NOT) = range(9)
+_AND = _TAGS[And]
+_DIVIDE = _TAGS[Divide]
+_IF = _TAGS[If]
+_WHILE = _TAGS[While]
+_SEQUENCE = _TAGS[Sequence]
+_PROGRAM = _TAGS[Program]
+
+# Literal pool entry kinds.
+_POOL_INT = 0
+_POOL_FLOAT = 1
+
+
+def _write_varint(out: bytearray, number: int) -> None:
+    while number > 0x7f:
+        out.append((number & 0x7f) | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def _zigzag(number: int) -> int:
+    # Small negative numbers get small varints too; Python ints have no
+    # width, so the sign goes in the lowest bit.
+    return number * 2 if number >= 0 else -number * 2 - 1
+
+
+class _Writer(object):
+    def __init__(self) -> None:
+        self.strings: Dict[str, int] = {}
+        self.literals: Dict[tuple, int] = {}
+        self.literal_values: List[Union[int, float]] = []
+        self.temporaries: Dict[int, None] = {}
+
+    def string(self, text: str) -> int:
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def literal(self, value: Union[int, float]) -> int:
+        key = literal_key(value)
+        index = self.literals.get(key)
+        if index is None:
+            index = self.literals[key] = len(self.literal_values)
+            self.literal_values.append(value)
+        return index
+
+    def variable(self, variable: Variable) -> int:
+        index = self.string(variable.variable_name)
+        if type(variable) is Temporary:
+            self.temporaries[index] = None
+        return index
+
+    def nodes(self, out: bytearray, program: Expr) -> None:
+        # The work stack holds expressions still to write and, around each
+        # statement of a Sequence, a list [table slot, start offset] that
+        # records where the statement starts and patches its size in when
+        # it ends.
+        pending: List[Any] = [program]
+        while pending:
+            expression = pending.pop()
+            expression_class = type(expression)
+            if expression_class is list:
+                if expression[1] is None:
+                    expression[1] = len(out)
+                else:
+                    _SIZE.pack_into(out, expression[0], len(out) - expression[1])
+                continue
+            tag = _TAGS.get(expression_class)
+            if tag is None:
+                raise InterpSyntaxError(
+                    f"Cannot serialize {expression_class.__name__}.")
+            out.append(tag)
+
+            if tag >= _AND and tag <= _DIVIDE:
+                pending.append(expression.right)
+                pending.append(expression.left)
+            elif tag == _VARIABLE:
+                _write_varint(out, self.variable(expression))
+            elif tag == _INT or tag == _FLOAT:
+                _write_varint(out, self.literal(expression.literal))
+            elif tag == _ASSIGN:
+                _write_varint(out, self.variable(expression.variable))
+                pending.append(expression.value)
+            elif tag == _SEQUENCE or tag == _PROGRAM:
+                exprs = expression.exprs
+                _write_varint(out, len(exprs))
+                table = len(out)
+                out += bytes(_SIZE.size * len(exprs))
+                for index in reversed(range(len(exprs))):
+                    marker = [table + index * _SIZE.size, None]
+                    pending.append(marker)
+                    pending.append(exprs[index])
+                    pending.append(marker)
+            elif tag == _IF:
+                pending.append(expression.false)
+                pending.append(expression.true)
+                pending.append(expression.condition)
+            elif tag == _WHILE:
+                pending.append(expression.body)
+                pending.append(expression.condition)
+            elif tag == _PRINT:
+                pending.append(expression.to_print)
+            elif tag == _NOT:
+                pending.append(expression.expr)
+            elif tag == _STRING:
+                _write_varint(out, self.string(expression.literal))
+            elif tag == _BOOLEAN:
+                out.append(1 if expression.literal else 0)
+
+    def pools(self, out: bytearray) -> None:
+        _write_varint(out, len(self.strings))
+        for text in self.strings:
+            encoded = text.encode("utf-8", "surrogatepass")
+            _write_varint(out, len(encoded))
+            out += encoded
+        _write_varint(out, len(self.literal_values))
+        for value in self.literal_values:
+            if type(value) is float:
+                out.append(_POOL_FLOAT)
+                out += _DOUBLE.pack(value)
+            else:
+                out.append(_POOL_INT)
+                _write_varint(out, _zigzag(value))
+        _write_varint(out, len(self.temporaries))
+        for index in self.temporaries:
+            _write_varint(out, index)
+
+
+def dumps(program: Expr) -> bytes:
+    """
+    The binary encoding of program.
+    """
+    writer = _Writer()
+    nodes = bytearray()
+    writer.nodes(nodes, program)
+    out = bytearray(_HEADER.pack(MAGIC, VERSION))
+    writer.pools(out)
+    out += nodes
+    return bytes(out)
+
+
+def save(program: Expr, path: str) -> None:
+    """
+    Writes the binary encoding of program to path. The file is replaced
+    rather than rewritten, so programs already loaded from it (which may
+    still be reading it) are unaffected.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(dumps(program))
+    os.replace(temporary, path)
+
+
+class _Reader(object):
+    def __init__(self, data: Any) -> None:
+        self.data = data
+        if len(data) < _HEADER.size:
+            raise InterpSyntaxError("Not a serialized STIMPL program.")
+        magic, version = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise InterpSyntaxError("Not a serialized STIMPL program.")
+        if version not in _READABLE_VERSIONS:
+            raise InterpSyntaxError(
+                f"Unsupported serialized program version {version}.")
+        self.offset = _HEADER.size
+        try:
+            self.pools(version)
+        except (IndexError, struct.error):
+            raise InterpSyntaxError("Truncated serialized program.")
+        self.root = self.offset
+        self.temporaries = frozenset(
+            self.strings[index] for index in self.temporary_indices)
+
+    def pools(self, version: int) -> None:
+        data = self.data
+        self.strings: List[str] = []
+        for _ in range(self.varint()):
+            length = self.varint()
+            self.strings.append(
+                bytes(data[self.offset:self.offset + length]).decode("utf-8", "surrogatepass"))
+            self.offset += length
+        self.literals: List[Union[int, float]] = []
+        for _ in range(self.varint()):
+            kind = data[self.offset]
+            self.offset += 1
+            if kind == _POOL_FLOAT:
+                self.literals.append(_DOUBLE.unpack_from(data, self.offset)[0])
+                self.offset += _DOUBLE.size
+            else:
+                number = self.varint()
+                self.literals.append(
+                    number >> 1 if number & 1 == 0 else -((number + 1) >> 1))
+        self.temporary_indices = set()
+        if version >= 2:
+            for _ in range(self.varint()):
+                index = self.varint()
+                if index >= len(self.strings):
+                    raise InterpSyntaxError("Temporary name out of the string pool.")
+                self.temporary_indices.add(index)
+
+    def variable(self) -> Variable:
+        index = self.varint()
+        variable_class = Temporary if index in self.temporary_indices else Variable
+        return variable_class(self.strings[index])
+
+    def varint(self) -> int:
+        data = self.data
+        number = 0
+        shift = 0
+        while True:
+            byte = data[self.offset]
+            self.offset += 1
+            number |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return number
+            shift += 7
+
+    def node(self, offset: int, lazy: bool) -> Expr:
+        """
+        Decodes the node at offset. When lazy, the statements of
+        Sequences and Programs are left to _LazyExprs.
+        """
+        try:
+            return self._node(offset, lazy)
+        except (IndexError, struct.error):
+            raise InterpSyntaxError("Truncated serialized program.")
+
+    def _node(self, offset: int, lazy: bool) -> Expr:
+        self.offset = offset
+        data = self.data
+        # Nodes waiting for children: [class, operands, children].
+        pending: List[list] = []
+        while True:
+            tag = data[self.offset]
+            self.offset += 1
+            if tag >= len(_CLASSES):
+                raise InterpSyntaxError(f"Unknown node tag {tag}.")
+            expression_class = _CLASSES[tag]
+
+            if tag == _REN:
+                expression = Ren()
+            elif tag == _INT or tag == _FLOAT:
+                expression = expression_class(self.literals[self.varint()])
+            elif tag == _STRING:
+                expression = StringLiteral(self.strings[self.varint()])
+            elif tag == _BOOLEAN:
+                expression = BooleanLiteral(bool(self.varint()))
+            elif tag == _VARIABLE:
+                expression = self.variable()
+            elif tag == _SEQUENCE or tag == _PROGRAM:
+                count = self.varint()
+                sizes = struct.unpack_from(f"<{count}I", data, self.offset)
+                self.offset += count * _SIZE.size
+                if lazy or count == 0:
+                    offsets = []
+                    start = self.offset
+                    for size in sizes:
+                        offsets.append(start)
+                        start += size
+                    self.offset = start
+                    expression = expression_class.__new__(expression_class)
+                    expression.exprs = _LazyExprs(self, offsets) if count else ()
+                else:
+                    pending.append([expression_class, (), [], count])
+                    continue
+            else:
+                if tag == _ASSIGN:
+                    operands = (self.variable(),)
+                    count = 1
+                elif tag == _IF:
+                    operands = ()
+                    count = 3
+                elif tag == _PRINT or tag == _NOT:
+                    operands = ()
+                    count = 1
+                else:
+                    operands = ()
+                    count = 2
+                pending.append([expression_class, operands, [], count])
+                continue
+
+            # expression is complete; hand it to the nodes waiting for it.
+            while pending:
+                waiting = pending[-1]
+                waiting[2].append(expression)
+                if len(waiting[2]) < waiting[3]:
+                    break
+                pending.pop()
+                expression = waiting[0](*waiting[1], *waiting[2])
+            else:
+                return expression
+
+
+class _LazyExprs(_SequenceABC):
+    """
+    The statements of a loaded Sequence or Program, each decoded the
+    first time it is read.
+    """
+    __slots__ = ('_reader', '_offsets', '_exprs')
+
+    def __init__(self, reader: _Reader, offsets: List[int]) -> None:
+        self._reader = reader
+        self._offsets = offsets
+        self._exprs: List[Any] = [None] * len(offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[position] for position in range(*index.indices(len(self))))
+        expr = self._exprs[index]
+        if expr is None:
+            expr = self._exprs[index] = self._reader.node(
+                self._offsets[index], True)
+        return expr
+
+    def temporary_names(self) -> frozenset:
+        # Every Temporary the file names; naming one that is never
+        # assigned is harmless to the caller (run_stimpl).
+        return self._reader.temporaries
+
+    def __repr__(self) -> str:
+        return repr(tuple(self))
+
+
+def loads(data: Union[bytes, bytearray, memoryview]) -> Expr:
+    """
+    Decodes a whole program from its binary encoding.
+    """
+    reader = _Reader(data)
+    return reader.node(reader.root, False)
+
+
+def load(path: str, lazy: bool = True) -> Expr:
+    """
+    Reads a program saved with save(). The file is mapped rather than
+    read, and unless lazy is False statements are decoded only when they
+    are first reached; the mapping stays open until the program is
+    garbage collected.
+    """
+    with open(path, "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            raise InterpSyntaxError("Not a serialized STIMPL program.")
+    reader = _Reader(data)
+    program = reader.node(reader.root, lazy)
+    if not lazy:
+        data.close()
+    return program
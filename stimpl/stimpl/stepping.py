@@ -0,0 +1,279 @@
+import contextlib
+import marshal
+import os
+import struct
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from stimpl import serialize
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.output import OutputSink, writing_to
+from stimpl.rope import flatten
+from stimpl.runtime import State, EmptyState, HashTrieState, RunOptions, finish_run
+from stimpl.vm import Bytecode, Continuation, lower
+
+"""
+Runs that stop, and carry on later -- in another process if need be.
+
+An Execution runs a program on the vm engine a slice at a time: steps()
+pauses it every pause_every steps (While iterations, as a Budget counts
+them), and while it is paused dumps() or save() write a snapshot of it.
+loads() or load() turn the snapshot back into an Execution that carries
+on from the same instruction, with the same value stack, state, loop
+compaction counters and budget, and ends with what an uninterrupted run
+would have returned.
+
+The vm engine is the one whose paused run is plain data: an instruction
+index into code that lowering rebuilds identically from the program, a
+list of values and a state. A snapshot is a header, the program in
+stimpl.serialize's format, and the rest compressed with zlib over
+marshal: the options, the budget left, and every value as a Python
+scalar with a one-byte type tag. States keep only their live bindings
+(the latest of each variable), so a snapshot is as large as what the
+program can still see rather than everything a linked State has ever
+held; a restored state is a fresh chain (or trie, or frame) of them.
+
+What is printed is not part of a run's state: output written before a
+snapshot stays wherever it went, and a restored run prints to the sink
+it is given.
+"""
+
+MAGIC = b"STPS"
+VERSION = 1
+# Magic, version, and the size of the serialized program that follows.
+_HEADER = struct.Struct("<4sHI")
+
+# Steps between pauses unless steps() is told otherwise.
+DEFAULT_PAUSE_EVERY = 1000
+
+# Type tags, in the order of _TYPES.
+_TYPES = [UNIT, INTEGER, FLOATING_POINT, STRING, BOOLEAN]
+_TAGS = {value_type: tag for tag, value_type in enumerate(_TYPES)}
+
+# State kinds.
+_LINKED = 0
+_TRIE = 1
+_FRAME = 2
+
+
+class Execution(object):
+    """
+    One run of program (an Expr, or the Bytecode lower() makes of one)
+    on the vm engine, from state, with the options run_stimpl takes for
+    that engine. Output goes to output, or to stdout.
+    """
+
+    def __init__(self, program: Union[Expr, Bytecode], state: Optional[State] = None,
+                 compact_every: Optional[int] = None, checked: bool = False, frame: bool = False,
+                 short_circuit: bool = False, max_steps: Optional[int] = None,
+                 max_state_bytes: Optional[int] = None, output: Optional[OutputSink] = None) -> None:
+        if isinstance(program, Expr):
+            program = lower(program)
+        elif not isinstance(program, Bytecode):
+            raise ValueError("An Execution runs an Expr or the Bytecode lower() makes of one.")
+        self.bytecode = program
+        self.state = state if state is not None else EmptyState()
+        self.options = RunOptions(compact_every=compact_every, checked=checked, frame=frame,
+                                  short_circuit=short_circuit, max_steps=max_steps,
+                                  max_state_bytes=max_state_bytes)
+        self.output = output
+        # Where the run is paused; None before it starts and once it ends.
+        self.continuation: Optional[Continuation] = None
+        self.result: Optional[Tuple[Any, Type, State]] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.result is not None
+
+    def steps(self, pause_every: int = DEFAULT_PAUSE_EVERY) -> Iterator['Execution']:
+        """
+        Runs the program, yielding this Execution each time it pauses
+        (every pause_every steps) until the run ends. Stopping the
+        iteration leaves the run paused, and a later steps() picks it up
+        from there.
+        """
+        if pause_every < 1:
+            raise ValueError("pause_every must be a positive integer.")
+        self._check_runnable()
+        if self.result is not None:
+            return
+        run = self.bytecode.steps(self.state, self.options, pause_every, self.continuation)
+        try:
+            while True:
+                try:
+                    with writing_to(self.output) if self.output is not None else contextlib.nullcontext():
+                        self.continuation = next(run)
+                except StopIteration as finished:
+                    program_value, program_type, program_state = finished.value
+                    break
+                except BaseException as error:
+                    # The continuation no longer says where the run is.
+                    self.continuation = None
+                    self.error = error
+                    raise
+                yield self
+        finally:
+            run.close()
+
+        self.continuation = None
+        program_value, program_state = finish_run(
+            program_value, program_state, self.state, self.bytecode.temporaries, self.options)
+        self.result = (program_value, program_type, program_state)
+
+    def run(self) -> Tuple[Any, Type, State]:
+        """
+        Runs the program to the end (from wherever it is paused) and
+        returns its value, type and final state.
+        """
+        for _ in self.steps():
+            pass
+        return self.result
+
+    def dumps(self) -> bytes:
+        """
+        A snapshot of the run, which must not have ended.
+        """
+        self._check_runnable()
+        if self.result is not None:
+            raise ValueError("A finished run cannot be snapshotted.")
+        options = self.options
+        budget = options.budget
+        payload: Tuple[Any, ...] = (
+            _fingerprint(self.bytecode.variant_code(options)),
+            options.compact_every, options.checked, options.frame, options.short_circuit,
+            budget.max_steps if budget is not None else None,
+            budget.steps if budget is not None else None,
+            budget.max_state_bytes if budget is not None else None)
+        continuation = self.continuation
+        if continuation is None:
+            payload += (None, (), (), _encode_state(self.state), None)
+        else:
+            payload += (continuation.pc,
+                        _encode_values(continuation.stack),
+                        tuple(iterations for _, iterations in continuation.loops),
+                        _encode_state(continuation.state),
+                        _encode_state(continuation.base) if continuation.base is not None else None)
+        program = serialize.dumps(self.bytecode.program)
+        return _HEADER.pack(MAGIC, VERSION, len(program)) + program + \
+            zlib.compress(marshal.dumps(payload, 4))
+
+    def save(self, path: str) -> None:
+        """
+        Writes a snapshot of the run to path, replacing the file rather
+        than rewriting it, so an earlier snapshot there is never left
+        half written.
+        """
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(self.dumps())
+        os.replace(temporary, path)
+
+    def _check_runnable(self) -> None:
+        if self.error is not None:
+            raise ValueError(f"The run stopped with {type(self.error).__name__}; it cannot go on.")
+
+
+def loads(data: Union[bytes, bytearray, memoryview], output: Optional[OutputSink] = None) -> Execution:
+    """
+    The run a snapshot made by Execution.dumps() describes, paused where
+    it was. It prints to output, or to stdout.
+    """
+    data = memoryview(data)
+    if len(data) < _HEADER.size:
+        raise InterpSyntaxError("Not a STIMPL snapshot.")
+    magic, version, program_length = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise InterpSyntaxError("Not a STIMPL snapshot.")
+    if version != VERSION:
+        raise InterpSyntaxError(f"Unsupported snapshot version {version}.")
+    program = serialize.loads(data[_HEADER.size:_HEADER.size + program_length])
+    try:
+        payload = marshal.loads(zlib.decompress(data[_HEADER.size + program_length:]))
+        (code, compact_every, checked, frame, short_circuit, max_steps, steps_left, max_state_bytes,
+         pc, stack, loops, state, base) = payload
+    except (EOFError, ValueError, TypeError, zlib.error):
+        raise InterpSyntaxError("Truncated snapshot.")
+
+    execution = Execution(program, compact_every=compact_every, checked=checked, frame=frame,
+                          short_circuit=short_circuit, max_steps=max_steps,
+                          max_state_bytes=max_state_bytes, output=output)
+    if _fingerprint(execution.bytecode.variant_code(execution.options)) != code:
+        raise InterpSyntaxError("The snapshot's program does not lower to the code it was taken from.")
+    if execution.options.budget is not None:
+        execution.options.budget.steps = steps_left
+    if pc is None:
+        # Not started yet.
+        execution.state = _decode_state(state)
+        return execution
+    # The state the run started from is not kept, so the temporaries it
+    # ends with are forgotten down to an empty state (a program's
+    # starting state has none of them).
+    state = _decode_state(state, len(execution.bytecode.names))
+    base = _decode_state(base) if base is not None else None
+    # Loops entered before the snapshot collapse their bindings onto the
+    # restored state, which already holds only the latest ones.
+    execution.continuation = Continuation(
+        pc, _decode_values(stack), state, [(state, iterations) for iterations in loops], base)
+    return execution
+
+
+def load(path: str, output: Optional[OutputSink] = None) -> Execution:
+    """
+    Reads a snapshot written by Execution.save().
+    """
+    with open(path, "rb") as file:
+        return loads(file.read(), output)
+
+
+def _fingerprint(code: Any) -> Tuple[int, int]:
+    # Lowering is deterministic, so the same program gives the same code.
+    return (len(code), zlib.crc32(code.tobytes()))
+
+
+def _encode_values(values: List[Tuple[Any, Type]]) -> Tuple[tuple, bytes]:
+    return (tuple(flatten(value) for value, _ in values),
+            bytes(_TAGS[value_type] for _, value_type in values))
+
+
+def _decode_values(encoded: Tuple[tuple, bytes]) -> List[Tuple[Any, Type]]:
+    values, tags = encoded
+    return [(value, _TYPES[tag]) for value, tag in zip(values, tags)]
+
+
+def _encode_state(state: Any) -> tuple:
+    # (kind, names or slots, values) with the live bindings, oldest first.
+    if type(state) is list:
+        slots = tuple(slot for slot, binding in enumerate(state) if binding is not None)
+        return (_FRAME, slots, _encode_values([state[slot] for slot in slots]))
+    latest = {}
+    while type(state) is State:
+        if state.variable_name not in latest:
+            latest[state.variable_name] = state.value
+        state = state.next_state
+    if type(state) is HashTrieState:
+        for variable_name, binding in state.trie.items():
+            latest.setdefault(variable_name, binding)
+        kind = _TRIE
+    elif type(state) is EmptyState:
+        kind = _LINKED
+    else:
+        raise ValueError(f"Cannot snapshot a {type(state).__name__}.")
+    names = tuple(reversed(latest))
+    return (kind, names, _encode_values([latest[variable_name] for variable_name in names]))
+
+
+def _decode_state(encoded: tuple, frame_size: int = 0) -> Any:
+    kind, names, values = encoded
+    bindings = _decode_values(values)
+    if kind == _FRAME:
+        frame: List[Any] = [None] * frame_size
+        for slot, binding in zip(names, bindings):
+            frame[slot] = binding
+        return frame
+    state = EmptyState() if kind == _LINKED else HashTrieState()
+    for variable_name, (variable_value, variable_type) in zip(names, bindings):
+        state = state.set_value(variable_name, variable_value, variable_type)
+    return state
@@ -1,3 +1,6 @@
+from contextlib import redirect_stdout as _redirect_stdout
+from io import StringIO as _StringIO
+
 from stimpl.runtime import run_stimpl
 from stimpl.expression import *
 from stimpl.types import *
@@ -39,6 +42,14 @@ def check_program_raises(raise_type, program):
     raise TestingLiteralError(f"Should have raised {raise_type}")
 
 
+def check_raises(raise_type, function):
+    try:
+        function()
+    except raise_type:
+        return
+    raise TestingLiteralError(f"Should have raised {raise_type.__name__}")
+
+
 def check_run_result(expected, actual):
     expected_value, expected_type, _ = expected
     actual_value, actual_type, _ = actual
@@ -47,6 +58,146 @@ def check_run_result(expected, actual):
                            (actual_value, actual_type))
 
 
+def variable_names(expression):
+    """
+    Every variable name that appears in an expression.
+    """
+    names = set()
+    pending = [expression]
+    while pending:
+        expression = pending.pop()
+        match expression:
+            case Variable(variable_name=variable_name):
+                names.add(variable_name)
+            case Assign(variable=variable):
+                names.add(variable.variable_name)
+        pending.extend(children(expression))
+    return names
+
+
+def run_outcome(run, program, names):
+    """
+    Runs a program and summarises what happened: what it printed, its
+    value, its type and the final binding of every variable -- or the
+    error it raised.
+    """
+    output = _StringIO()
+    try:
+        with _redirect_stdout(output):
+            value, value_type, state = run(program)
+    except InterpError as e:
+        return (output.getvalue(), type(e), str(e))
+    return (output.getvalue(), value, value_type,
+            [(name, state.get_value(name)) for name in sorted(names)])
+
+
+def check_same_behavior(run, program, reference=run_stimpl):
+    """
+    Checks that run executes program exactly like reference does.
+    """
+    names = variable_names(program)
+    check_equal(run_outcome(reference, program, names),
+                run_outcome(run, program, names))
+
+
+def counting_loop(limit):
+    return Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        Assign(Variable("total"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(limit)),
+              Sequence(
+            Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+            Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+        Variable("total"))
+
+
+def sample_programs():
+    """
+    Programs that cover every expression form and every kind of error,
+    for checking that another way of running STIMPL agrees with evaluate.
+    """
+    literals = [Ren(), IntLiteral(3), FloatingPointLiteral(1.5),
+                StringLiteral("s"), BooleanLiteral(True)]
+    programs = [Program(), Sequence(), Program(Ren(), IntLiteral(1))]
+    programs.extend(literals)
+    for operator in [Add, Subtract, Multiply, Divide, And, Or, Lt, Lte, Gt, Gte, Eq, Ne]:
+        for left in literals:
+            for right in literals:
+                programs.append(operator(left, right))
+        programs.append(operator(IntLiteral(7), IntLiteral(2)))
+        programs.append(operator(FloatingPointLiteral(7.0), FloatingPointLiteral(2.0)))
+        programs.append(operator(StringLiteral("a"), StringLiteral("b")))
+        programs.append(operator(BooleanLiteral(False), BooleanLiteral(True)))
+        programs.append(operator(BooleanLiteral(False), BooleanLiteral(False)))
+    for literal in literals:
+        programs.append(Not(literal))
+        programs.append(If(literal, IntLiteral(1), IntLiteral(2)))
+        if not isinstance(literal, BooleanLiteral):
+            programs.append(While(literal, Ren()))
+    programs.append(While(BooleanLiteral(False), Ren()))
+    programs.extend([
+        Divide(IntLiteral(1), IntLiteral(0)),
+        Divide(IntLiteral(-7), IntLiteral(2)),
+        Divide(FloatingPointLiteral(1.0), FloatingPointLiteral(0.0)),
+        Divide(Ren(), Ren()),
+        Not(BooleanLiteral(False)),
+        If(BooleanLiteral(False), IntLiteral(1), StringLiteral("no")),
+        Variable("undefined"),
+        Assign(Variable("i"), Assign(Variable("j"), IntLiteral(10))),
+        Program(Assign(Variable("i"), IntLiteral(10)),
+                Assign(Variable("i"), FloatingPointLiteral(10.0))),
+        Program(Assign(Variable("i"), Ren()),
+                Assign(Variable("i"), Ren()), Variable("i")),
+        Add(Assign(Variable("i"), IntLiteral(10)),
+            Add(Variable("i"), Assign(Variable("j"), IntLiteral(11)))),
+        Assign(Variable("i"),
+               If(And(BooleanLiteral(False), BooleanLiteral(True)),
+                  Assign(Variable("j"), StringLiteral("Then")),
+                  Assign(Variable("j"), StringLiteral("Else")))),
+        Program(Assign(Variable("x"), IntLiteral(1)), Print(Variable("x")),
+                Print(Ren()), Print(Assign(Variable("y"), StringLiteral("p")))),
+        counting_loop(50),
+        Program(
+            Assign(Variable("s"), StringLiteral("")),
+            Assign(Variable("n"), IntLiteral(0)),
+            While(Lt(Variable("n"), IntLiteral(5)),
+                  Sequence(
+                Assign(Variable("s"), Add(Variable("s"), StringLiteral("ab"))),
+                Assign(Variable("n"), Add(Variable("n"), IntLiteral(1))),
+                If(Eq(Variable("n"), IntLiteral(3)),
+                   Assign(Variable("three"), BooleanLiteral(True)),
+                   Ren()))),
+            Variable("s")),
+        Program(
+            Assign(Variable("x"), FloatingPointLiteral(1.0)),
+            Assign(Variable("k"), IntLiteral(0)),
+            While(Not(Gte(Variable("k"), IntLiteral(4))),
+                  Sequence(
+                Assign(Variable("x"), Multiply(Variable("x"), FloatingPointLiteral(1.5))),
+                Assign(Variable("k"), Add(Variable("k"), IntLiteral(1))))),
+            Divide(Variable("x"), FloatingPointLiteral(2.0))),
+        Program(
+            Assign(Variable("i"), IntLiteral(0)),
+            While(Lt(Variable("i"), IntLiteral(3)),
+                  Sequence(
+                Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))),
+                Assign(Variable("i"), StringLiteral("oops"))))),
+        Program(
+            Assign(Variable("i"), IntLiteral(0)),
+            Assign(Variable("j"), IntLiteral(0)),
+            While(Lt(Variable("i"), IntLiteral(3)),
+                  Sequence(
+                Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))),
+                Assign(Variable("k"), IntLiteral(0)),
+                While(Lte(Variable("k"), Variable("i")),
+                      Sequence(
+                    Assign(Variable("j"), Add(Variable("j"), Variable("k"))),
+                    Assign(Variable("k"), Add(Variable("k"), IntLiteral(1))))))),
+            Subtract(Variable("j"), IntLiteral(1))),
+    ])
+    return programs
+
+
 def run_stimpl_sanity_tests():
     try:
         # Mathematical Expressions (5 pts)
@@ -0,0 +1,66 @@
+import asyncio
+
+from stimpl.compiler import compile
+from stimpl.output import ListSink, OUTPUT
+from stimpl.runtime import run_stimpl, run_stimpl_async
+from stimpl.vm import lower
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+from stimpl.test_output import printing_loop
+
+
+def forever():
+    x = Variable("x")
+    return Program(Assign(x, IntLiteral(0)),
+                   While(BooleanLiteral(True), Assign(x, Add(x, IntLiteral(1)))))
+
+
+def test_async():
+    for program in sample_programs():
+        check_same_behavior(lambda program: asyncio.run(run_stimpl_async(program, yield_every=1)), program)
+        check_same_behavior(lambda program: asyncio.run(run_stimpl_async(program, frame=True, checked=True)),
+                            program, lambda program: run_stimpl(program, engine="vm", frame=True, checked=True))
+    check_equal((45, INTEGER), asyncio.run(run_stimpl_async(lower(counting_loop(10)), yield_every=3))[:2])
+    check_equal((45, INTEGER), asyncio.run(run_stimpl_async(counting_loop(10), compact_every=2))[:2])
+
+    async def alongside(program, **options):
+        # How often another task got to run while program ran.
+        task = asyncio.ensure_future(run_stimpl_async(program, **options))
+        turns = 0
+        while not task.done():
+            turns += 1
+            await asyncio.sleep(0)
+        return (await task), turns
+
+    (value, _, _), turns = asyncio.run(alongside(counting_loop(1000), yield_every=10))
+    check_equal(499500, value)
+    check_equal(True, 90 <= turns <= 110)
+
+    # Programs running side by side keep their own output.
+    async def both():
+        first, second = ListSink(), ListSink()
+        await asyncio.gather(run_stimpl_async(printing_loop(50), yield_every=1, output=first),
+                             run_stimpl_async(printing_loop(30), yield_every=1, output=second))
+        return first.lines, second.lines
+    first, second = asyncio.run(both())
+    check_equal([str(i) for i in range(50)] + ["Unit"], first)
+    check_equal([str(i) for i in range(30)] + ["Unit"], second)
+
+    # Cancelling the task stops the program.
+    async def cancelled():
+        sink = ListSink()
+        task = asyncio.ensure_future(run_stimpl_async(forever(), yield_every=5, output=sink))
+        for _ in range(20):
+            await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return task.cancelled(), OUTPUT.get() is not sink
+    check_equal((True, True), asyncio.run(cancelled()))
+
+    check_raises(InterpResourceError, lambda: asyncio.run(run_stimpl_async(forever(), max_steps=100)))
+    check_raises(ValueError, lambda: asyncio.run(run_stimpl_async(counting_loop(1), yield_every=0)))
+    check_raises(ValueError, lambda: asyncio.run(run_stimpl_async(compile(counting_loop(1)))))
@@ -0,0 +1,136 @@
+from stimpl.runtime import run_stimpl, EmptyState
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, run_outcome, sample_programs, variable_names
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; without it there is no batch engine to test.
+    np = None
+
+
+def batch_outcome(run_stimpl_batch, program, inputs, lanes, names, **options):
+    """
+    run_outcome for every lane of a batch run.
+    """
+    try:
+        result = run_stimpl_batch(program, inputs, lanes, **options)
+    except InterpError as e:
+        return [(type(e),)] * lanes
+    outcomes = []
+    for lane in range(lanes):
+        value, value_type, bindings = result.lane(lane)
+        outcomes.append((result.output(lane), value, value_type,
+                         [(name, bindings.get(name)) for name in sorted(names)]))
+    return outcomes
+
+
+def lane_outcomes(program, inputs, lanes, names, **options):
+    outcomes = []
+    for lane in range(lanes):
+        state = EmptyState()
+        for name, (column, column_type) in inputs.items():
+            state = state.set_value(name, column[lane], column_type)
+        outcome = run_outcome(lambda program: run_stimpl(program, state=state, **options), program, names)
+        # A batch stops at the first error any lane raises.
+        outcomes.append(outcome[1:2] if len(outcome) == 3 else outcome)
+    return outcomes
+
+
+def test_batch():
+    if np is None:
+        return
+    from stimpl.batch import run_stimpl_batch
+
+    for program in sample_programs():
+        names = variable_names(program)
+        check_equal(lane_outcomes(program, {}, 3, names),
+                    batch_outcome(run_stimpl_batch, program, {}, 3, names))
+
+    n, total, i, s = Variable("n"), Variable("total"), Variable("i"), Variable("s")
+    program = Program(
+        Assign(total, IntLiteral(0)), Assign(i, IntLiteral(0)), Assign(s, StringLiteral("")),
+        While(Lt(i, n), Sequence(
+            Assign(total, Add(total, Multiply(i, i))),
+            If(Eq(Subtract(i, Multiply(Divide(i, IntLiteral(2)), IntLiteral(2))), IntLiteral(0)),
+               Assign(s, Add(s, StringLiteral("e"))),
+               Print(i)),
+            Assign(i, Add(i, IntLiteral(1))))),
+        Print(Divide(IntLiteral(-7), Add(n, IntLiteral(4)))),
+        Print(Multiply(n, IntLiteral(2 ** 62))),
+        If(Gt(total, IntLiteral(10)), Assign(Variable("big"), BooleanLiteral(True)), Ren()),
+        Divide(FloatingPointLiteral(1.0), FloatingPointLiteral(4.0)))
+    values = [0, 1, 2, 5, -3, 7]
+    inputs = {"n": (values, INTEGER)}
+    names = variable_names(program) | {"n"}
+    check_equal(lane_outcomes(program, inputs, len(values), names),
+                batch_outcome(run_stimpl_batch, program, {"n": np.array(values)}, len(values), names))
+
+    # Only the lanes that divide by zero are named.
+    try:
+        run_stimpl_batch(Divide(IntLiteral(10), n), {"n": np.array([1, 0, 2, 0])})
+        check_equal(True, False)
+    except InterpMathError as e:
+        check_equal([1, 3], e.lanes)
+        check_equal(True, "lanes 1, 3" in str(e))
+
+    # Lanes that skipped the assignment cannot read the variable.
+    y = Variable("y")
+    try:
+        run_stimpl_batch(Program(If(Lt(n, IntLiteral(2)), Assign(y, IntLiteral(1)), Ren()), y),
+                         {"n": np.array([0, 5, 1, 9])})
+        check_equal(True, False)
+    except InterpSyntaxError as e:
+        check_equal([1, 3], e.lanes)
+
+    # Lanes that would give one variable different types.
+    check_raises(InterpTypeError, lambda: run_stimpl_batch(
+        If(Lt(n, IntLiteral(2)), Assign(y, IntLiteral(1)), Assign(y, StringLiteral("s"))),
+        {"n": np.array([0, 5])}))
+
+    # Each lane has the step budget a run of its own would have, so a lane
+    # that never stops cannot hang the batch.
+    program = Program(Assign(i, IntLiteral(0)), While(Lt(i, n), Assign(i, Add(i, IntLiteral(1)))), i)
+    result = run_stimpl_batch(program, {"n": np.array([3, 1, 0])}, max_steps=3)
+    check_equal([3, 1, 0], [result.lane(lane)[0] for lane in range(3)])
+    try:
+        run_stimpl_batch(program, {"n": np.array([3, 4, 9, 2])}, max_steps=3)
+        check_equal(True, False)
+    except InterpResourceError as e:
+        check_equal([1, 2], e.lanes)
+        check_raises(InterpResourceError, lambda: run_stimpl(
+            program, state=EmptyState().set_value("n", 4, INTEGER), max_steps=3))
+    check_raises(InterpResourceError, lambda: run_stimpl_batch(
+        While(BooleanLiteral(True), Ren()), {}, lanes=2, max_steps=100))
+    check_raises(ValueError, lambda: run_stimpl_batch(n, {"n": [1]}, max_steps=-1))
+
+    # Short-circuiting runs the right operand only in the lanes the left
+    # one leaves undecided.
+    program = Program(
+        Assign(i, IntLiteral(0)),
+        If(Or(Lt(n, IntLiteral(2)), Sequence(Print(n), Assign(i, IntLiteral(1)), Lt(n, IntLiteral(5)))),
+           Print(StringLiteral("small")), Ren()),
+        And(Gt(n, IntLiteral(3)), Sequence(Print(Divide(IntLiteral(10), Subtract(n, IntLiteral(8)))), BooleanLiteral(True))),
+        Or(Lt(n, IntLiteral(100)), While(BooleanLiteral(True), Ren())))
+    names = variable_names(program) | {"n"}
+    values = [0, 1, 3, 4, 9, 7]
+    for lanes in (values, [0, 1, 2], [8]):
+        inputs = {"n": (lanes, INTEGER)}
+        check_equal(lane_outcomes(program, inputs, len(lanes), names, short_circuit=True, max_steps=10),
+                    batch_outcome(run_stimpl_batch, program, {"n": np.array(lanes)}, len(lanes), names,
+                                  short_circuit=True, max_steps=10))
+    check_raises(InterpResourceError, lambda: run_stimpl_batch(program, {"n": np.array(values)}, max_steps=10))
+    check_raises(InterpTypeError, lambda: run_stimpl_batch(
+        Program(Print(n), And(BooleanLiteral(False), IntLiteral(1))), {"n": np.array([1])}, short_circuit=True))
+
+    # A variable named like the optimizer's temporaries is still the
+    # program's own.
+    result = run_stimpl_batch(Assign(Variable("$x"), n), {"n": np.array([4, 5])})
+    check_equal((5, INTEGER), result.lane(1)[2]["$x"])
+
+    result = run_stimpl_batch(Add(s, StringLiteral("!")), {"s": ["a", "bc"]})
+    check_equal([("a!", STRING), ("bc!", STRING)], [result.lane(lane)[:2] for lane in range(2)])
+    check_raises(ValueError, lambda: run_stimpl_batch(n, {"n": [1, 2], "m": [1]}))
+    check_raises(ValueError, lambda: run_stimpl_batch(n, {}))
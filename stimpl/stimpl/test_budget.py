@@ -0,0 +1,87 @@
+from stimpl.runtime import run_stimpl, RunOptions, EmptyState, HashTrieState, Budget
+from stimpl.compiler import compile
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, run_outcome, sample_programs
+from stimpl.test_jit import loop_programs
+
+
+def budgeted_runs(**budget):
+    return [
+        lambda program: run_stimpl(program, jit_threshold=2, **budget),
+        lambda program: run_stimpl(program, compact_every=2, **budget),
+        lambda program: run_stimpl(program, engine="iterative", **budget),
+        lambda program: run_stimpl(program, engine="closure", **budget),
+        lambda program: run_stimpl(program, engine="closure", compact_every=2, **budget),
+        lambda program: run_stimpl(program, engine="closure", frame=True, **budget),
+        lambda program: run_stimpl(program, engine="vm", **budget),
+        lambda program: run_stimpl(program, engine="vm", frame=True, **budget),
+        lambda program: run_stimpl(program, engine="python", **budget),
+    ]
+
+
+def test_budget():
+    i, j, s = Variable("i"), Variable("j"), Variable("s")
+    nested = Program(
+        Assign(i, IntLiteral(0)),
+        While(Lt(i, IntLiteral(3)), Sequence(
+            Assign(j, IntLiteral(0)),
+            While(Lt(j, IntLiteral(4)), Sequence(Print(j), Assign(j, Add(j, IntLiteral(1))))),
+            Assign(i, Add(i, IntLiteral(1))))),
+        i)
+    growing = Program(
+        Assign(s, StringLiteral("")),
+        While(BooleanLiteral(True), Assign(s, Add(s, StringLiteral("x" * 100)))))
+
+    # Every engine stops at the same step, after the same output, and
+    # with the same state size.
+    for program in sample_programs() + loop_programs() + [nested]:
+        for max_steps in [0, 1, 2, 3, 7, 14, 15, 40]:
+            for run in budgeted_runs(max_steps=max_steps):
+                check_same_behavior(run, program, lambda program: run_stimpl(program, max_steps=max_steps))
+        for max_state_bytes in [0, 100, 250, 10 ** 6]:
+            for run in budgeted_runs(max_state_bytes=max_state_bytes):
+                check_same_behavior(run, program, lambda program: run_stimpl(
+                    program, max_state_bytes=max_state_bytes))
+
+    # A step is one run of a While body.
+    check_equal((45, INTEGER), run_stimpl(counting_loop(10), max_steps=10)[:2])
+    check_raises(InterpResourceError, lambda: run_stimpl(counting_loop(10), max_steps=9))
+    check_equal(("0\n1\n2\n3\n0\n", InterpResourceError, "Ran out of steps: the budget allows 7."),
+                run_outcome(lambda program: run_stimpl(program, max_steps=7), nested, ["i", "j"]))
+    check_equal(("0\n1\n2\n3\n" * 3, 3, INTEGER),
+                run_outcome(lambda program: run_stimpl(program, max_steps=15), nested, [])[:3])
+
+    forever = While(BooleanLiteral(True), Ren())
+    for run in budgeted_runs(max_steps=1000):
+        check_raises(InterpResourceError, lambda: run(forever))
+    for run in budgeted_runs(max_state_bytes=10000):
+        check_raises(InterpResourceError, lambda: run(growing))
+    for run in budgeted_runs(max_steps=1000, max_state_bytes=10 ** 9):
+        check_raises(InterpResourceError, lambda: run(growing))
+
+    # Without loops the final state is still measured.
+    check_raises(InterpResourceError, lambda: run_stimpl(
+        Assign(s, StringLiteral("x" * 1000)), max_state_bytes=1000))
+    check_equal((None, UNIT), run_stimpl(Ren(), max_steps=0, max_state_bytes=0)[:2])
+
+    # Only the latest binding of each variable counts, however the state
+    # keeps them.
+    budget = Budget(max_state_bytes=10 ** 6)
+    one = EmptyState().set_value("s", "x" * 100, STRING)
+    size = budget.state_bytes(one)
+    check_equal(size, budget.state_bytes(one.set_value("s", "y" * 100, STRING)))
+    check_equal(size, budget.state_bytes(HashTrieState().set_value("s", "x" * 100, STRING)))
+    check_equal(size, budget.state_bytes([None, ("x" * 100, STRING)]))
+    check_equal(True, budget.state_bytes(one.set_value("t", 1, INTEGER)) > size)
+
+    # A budget belongs to one run; compiled programs can be run again.
+    compiled = compile(counting_loop(10))
+    for _ in range(2):
+        check_equal((45, INTEGER), run_stimpl(compiled, max_steps=10)[:2])
+        check_raises(InterpResourceError, lambda: run_stimpl(compiled, max_steps=9))
+
+    check_raises(ValueError, lambda: RunOptions(max_steps=-1))
+    check_raises(ValueError, lambda: RunOptions(max_state_bytes=-1))
+    check_equal(True, issubclass(InterpTimeoutError, InterpResourceError))
@@ -0,0 +1,25 @@
+import stimpl
+from stimpl.compiler import compile
+from stimpl.runtime import run_stimpl
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_same_behavior, counting_loop, sample_programs
+
+
+def test_compiled_programs():
+    for program in sample_programs():
+        check_same_behavior(lambda program: run_stimpl(compile(program)), program)
+
+    # A compiled program can be run again and again.
+    compiled = compile(counting_loop(100))
+    for _ in range(3):
+        value, value_type, _ = run_stimpl(compiled)
+        check_equal((4950, Integer()), (value, value_type))
+
+    _, _, state = run_stimpl(compiled, compact_every=8)
+    check_equal((100, Integer()), state.get_value("i"))
+    check_equal(True, state.depth() <= 3 + 2 * 8)
+
+    # The package exports the compiler without hiding the builtin compile.
+    check_equal(False, hasattr(stimpl, "compile"))
+    check_equal(True, stimpl.CompiledProgram is type(compiled))
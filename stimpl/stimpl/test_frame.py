@@ -0,0 +1,38 @@
+from stimpl.frame import resolve_slots
+from stimpl.runtime import EmptyState, run_stimpl
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+
+
+def test_frame():
+    check_equal({"i": 0, "total": 1}, resolve_slots(counting_loop(10)))
+
+    for program in sample_programs():
+        for engine in ["closure", "vm"]:
+            check_same_behavior(lambda program: run_stimpl(
+                program, engine=engine, frame=True), program)
+        check_same_behavior(lambda program: run_stimpl(
+            program, engine="closure", frame=True, checked=True), program)
+
+    # Bindings the program starts with are visible in the frame and kept
+    # in the final state.
+    state = EmptyState().set_value("total", 100, Integer()).set_value(
+        "unused", "kept", String())
+    program = Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(10)),
+              Sequence(
+            Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+            Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+        Variable("total"))
+    for engine in ["closure", "vm"]:
+        value, value_type, final_state = run_stimpl(
+            program, state=state, engine=engine, frame=True)
+        check_equal((145, Integer()), (value, value_type))
+        check_equal(("kept", String()), final_state.get_value("unused"))
+        check_equal((10, Integer()), final_state.get_value("i"))
+        check_equal((100, Integer()), state.get_value("total"))
+
+    # The tree engine has no frame mode.
+    check_raises(ValueError, lambda: run_stimpl(counting_loop(10), frame=True))
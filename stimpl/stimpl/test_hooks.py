@@ -0,0 +1,108 @@
+import contextlib
+import io
+
+from stimpl.runtime import run_stimpl, HOOKS, Hooks
+from stimpl.tracing import BatchingHook, EventBuffer, EventCounter
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+
+
+def test_hooks():
+    check_equal(False, bool(HOOKS))
+    events = []
+    with HOOKS.installed("enter", lambda node, state: events.append(type(node).__name__)):
+        check_equal(True, bool(HOOKS))
+        for program in sample_programs():
+            check_same_behavior(run_stimpl, program,
+                                lambda program: run_stimpl(program, engine="iterative"))
+    check_equal(False, bool(HOOKS))
+    check_equal(True, len(events) > 0)
+
+    x = Variable("x")
+    program = Program(Assign(x, IntLiteral(1)), Print(Add(x, IntLiteral(1))),
+                      Sequence(Divide(x, Subtract(x, IntLiteral(1)))))
+    log = []
+    hooks = [
+        ("enter", lambda node, state: log.append(("enter", type(node).__name__))),
+        ("exit", lambda node, result: log.append(("exit", type(node).__name__, result and result[0]))),
+        ("assign", lambda name, value, value_type: log.append(("assign", name, value, value_type))),
+        ("print", lambda value, value_type: log.append(("print", value, value_type))),
+        ("error", lambda node, error: log.append(("error", type(node).__name__, type(error)))),
+    ]
+    for event, callback in hooks:
+        HOOKS.add(event, callback)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_raises(InterpMathError, lambda: run_stimpl(program))
+    finally:
+        for event, callback in hooks:
+            HOOKS.remove(event, callback)
+    check_equal([
+        ("enter", "Program"),
+        ("enter", "Assign"), ("enter", "IntLiteral"), ("exit", "IntLiteral", 1),
+        ("assign", "x", 1, INTEGER), ("exit", "Assign", 1),
+        ("enter", "Print"), ("enter", "Add"),
+        ("enter", "Variable"), ("exit", "Variable", 1), ("enter", "IntLiteral"), ("exit", "IntLiteral", 1),
+        ("exit", "Add", 2), ("print", 2, INTEGER), ("exit", "Print", 2),
+        ("enter", "Sequence"), ("enter", "Divide"),
+        ("enter", "Variable"), ("exit", "Variable", 1),
+        ("enter", "Subtract"), ("enter", "Variable"), ("exit", "Variable", 1),
+        ("enter", "IntLiteral"), ("exit", "IntLiteral", 1), ("exit", "Subtract", 0),
+        # Only the node the error is raised in reports it.
+        ("error", "Divide", InterpMathError), ("exit", "Divide", None),
+        ("exit", "Sequence", None), ("exit", "Program", None),
+    ], log)
+
+    # Hooks see every iteration, even with the JIT asked for.
+    entered = []
+    with HOOKS.installed("enter", lambda node, state: entered.append(node)):
+        check_equal((45, INTEGER), run_stimpl(counting_loop(10), jit_threshold=2)[:2])
+        # Engines without nodes to report do not call hooks.
+        run_stimpl(counting_loop(10), engine="vm")
+    check_equal(10, sum(1 for node in entered if isinstance(node, Sequence)))
+
+    registry = Hooks()
+    check_raises(ValueError, lambda: registry.add("leave", print))
+    callback = registry.add("print", print)
+    check_equal((callback,), registry.callbacks("print"))
+    registry.clear()
+    check_equal(False, bool(registry))
+
+
+def test_batching_hooks():
+    batches = []
+    with EventBuffer(batches.append, max_events=4, interval=None, events=("enter",)):
+        run_stimpl(counting_loop(1))
+        check_equal([4, 4, 4, 4, 4], [len(batch) for batch in batches])
+    check_equal(22, sum(len(batch) for batch in batches))
+    check_equal(("enter", counting_loop(1)), batches[0][0])
+    check_equal(False, bool(HOOKS))
+
+    # Counts are flushed once interval has passed, as events arrive.
+    now = [0.0]
+    counts = []
+    counter = EventCounter(counts.append, interval=5.0, clock=lambda: now[0],
+                           events=("exit", "assign", "print")).install()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_stimpl(Program(Assign(Variable("x"), IntLiteral(1)), Print(Variable("x"))))
+        check_equal([], counts)
+        now[0] = 5.0
+        run_stimpl(Ren())
+        check_equal(1, len(counts))
+        check_equal({("exit", "Program"): 1, ("exit", "Assign"): 1, ("exit", "IntLiteral"): 1,
+                     ("assign", "x"): 1, ("exit", "Print"): 1, ("print", "Integer"): 1,
+                     ("exit", "Variable"): 1, ("exit", "Ren"): 1}, counts[0])
+        run_stimpl(Ren())
+    finally:
+        counter.uninstall()
+    check_equal([{("exit", "Ren"): 1}], counts[1:])
+    counter.flush()
+    check_equal(2, len(counts))
+
+    check_raises(ValueError, lambda: EventBuffer(print, max_events=0))
+    check_raises(ValueError, lambda: EventCounter(print, events=("leave",)))
+    # A hook that does not say how to record events cannot be made.
+    check_raises(TypeError, lambda: BatchingHook(print))
@@ -0,0 +1,56 @@
+import pickle
+
+from stimpl.interning import Interner
+from stimpl.runtime import run_stimpl
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_same_behavior, counting_loop, sample_programs
+
+
+def test_structural_equality():
+    check_equal(counting_loop(10), counting_loop(10))
+    check_equal(hash(counting_loop(10)), hash(counting_loop(10)))
+    check_equal(False, counting_loop(10) == counting_loop(11))
+    check_equal(False, IntLiteral(1) == BooleanLiteral(True))
+    check_equal(False, IntLiteral(1) == FloatingPointLiteral(1.0))
+    check_equal(False, FloatingPointLiteral(0.0) == FloatingPointLiteral(-0.0))
+    check_equal(False, Sequence(Ren()) == Program(Ren()))
+    check_equal(1, len({Add(Variable("x"), IntLiteral(1)),
+                        Add(Variable("x"), IntLiteral(1))}))
+    check_equal(False, hasattr(Add(Ren(), Ren()), '__dict__'))
+
+    # Neither hashing nor comparing recurses.
+    deep = [IntLiteral(0), IntLiteral(0)]
+    for index in range(2):
+        for _ in range(20000):
+            deep[index] = Add(deep[index], IntLiteral(1))
+    check_equal(deep[0], deep[1])
+
+    program = counting_loop(5)
+    check_equal(program, pickle.loads(pickle.dumps(program)))
+
+
+def test_interning():
+    interner = Interner()
+    for program in sample_programs():
+        interned = interner.intern(program)
+        check_equal(program, interned)
+        check_same_behavior(lambda program: run_stimpl(
+            interner.intern(program)), program)
+
+    first = interner.intern(counting_loop(10))
+    second = interner.intern(counting_loop(10))
+    check_equal(True, first is second)
+    check_equal(True, first in interner)
+    check_equal(False, counting_loop(10) in interner)
+
+    # Repeated subtrees are shared.
+    body = Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))
+    program = interner.intern(Sequence(body, Assign(
+        Variable("i"), Add(Variable("i"), IntLiteral(1)))))
+    check_equal(True, program.exprs[0] is program.exprs[1])
+
+    check_equal(True, interner.make(IntLiteral, 1)
+                is interner.make(IntLiteral, 1))
+    check_equal(False, interner.make(IntLiteral, 1)
+                is interner.make(BooleanLiteral, True))
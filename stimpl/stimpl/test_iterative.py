@@ -0,0 +1,35 @@
+from stimpl.iterative import evaluate_iteratively
+from stimpl.runtime import run_stimpl, HashTrieState
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_same_behavior, counting_loop, sample_programs
+
+
+def test_iterative():
+    for program in sample_programs():
+        check_same_behavior(lambda program: run_stimpl(program, engine="iterative"), program)
+        check_same_behavior(lambda program: run_stimpl(
+            program, engine="iterative", compact_every=2), program)
+
+    # Far deeper than the Python recursion limit, in both directions.
+    program = IntLiteral(0)
+    for _ in range(50000):
+        program = Add(program, IntLiteral(1))
+    check_equal(50000, run_stimpl(program, engine="iterative")[0])
+    program = IntLiteral(0)
+    for _ in range(50000):
+        program = Subtract(IntLiteral(1), program)
+    check_equal(0, run_stimpl(program, engine="iterative")[0])
+    program = Assign(Variable("x"), IntLiteral(1))
+    for _ in range(50000):
+        program = Sequence(program, Assign(Variable("x"), Add(Variable("x"), IntLiteral(1))))
+    value, value_type, state = run_stimpl(Program(program), engine="iterative")
+    check_equal((50001, INTEGER), (value, value_type))
+
+    _, _, state = run_stimpl(counting_loop(100), engine="iterative", compact_every=8)
+    check_equal((100, INTEGER), state.get_value("i"))
+    check_equal(True, state.depth() <= 3 + 2 * 8)
+
+    value, _, state = evaluate_iteratively(counting_loop(100), HashTrieState())
+    check_equal(4950, value)
+    check_equal((100, INTEGER), state.get_value("i"))
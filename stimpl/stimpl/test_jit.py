@@ -0,0 +1,99 @@
+from stimpl.jit import loop_record, loop_source
+from stimpl.runtime import run_stimpl, EmptyState, HashTrieState
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_same_behavior, counting_loop, sample_programs
+
+
+def loop_programs():
+    i, x, s, f = Variable("i"), Variable("x"), Variable("s"), Variable("f")
+    return [
+        counting_loop(20),
+        # Strings, floats, prints, branches and a nested loop.
+        Program(
+            Assign(i, IntLiteral(0)), Assign(s, StringLiteral("")), Assign(f, FloatingPointLiteral(1.0)),
+            While(Lt(i, IntLiteral(12)), Sequence(
+                If(Eq(Divide(i, IntLiteral(3)), IntLiteral(2)),
+                   Assign(s, Add(s, StringLiteral("a"))),
+                   Print(Ne(s, StringLiteral("")))),
+                Assign(f, Divide(f, FloatingPointLiteral(2.0))),
+                Assign(x, IntLiteral(0)),
+                While(Lt(x, i), Assign(x, Add(x, IntLiteral(2)))),
+                Print(Add(x, Assign(x, Add(x, IntLiteral(1))))),
+                Assign(i, Add(i, IntLiteral(1))))),
+            Print(s), f),
+        # Division by zero once the loop is hot.
+        Program(Assign(i, IntLiteral(5)),
+                While(Gte(i, IntLiteral(-3)), Sequence(
+                    Print(Divide(IntLiteral(10), i)),
+                    Assign(i, Subtract(i, IntLiteral(1)))))),
+        # A type error on a branch that is never taken: not compiled.
+        Program(Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(10)), Sequence(
+                    If(Lt(i, IntLiteral(0)), Assign(i, StringLiteral("no")), Ren()),
+                    Assign(i, Add(i, IntLiteral(1))))), i),
+        # ... and one that is, after a while.
+        Program(Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(10)), Sequence(
+                    If(Lt(i, IntLiteral(6)), Ren(), Assign(i, StringLiteral("no"))),
+                    Assign(i, Add(i, IntLiteral(1)))))),
+        # A variable first assigned inside the loop.
+        Program(Assign(i, IntLiteral(0)),
+                While(Lt(i, IntLiteral(10)), Sequence(
+                    Assign(x, Multiply(i, i)),
+                    Assign(i, Add(i, IntLiteral(1))))), x),
+        # And and Or, with effects on the right.
+        Program(Assign(i, IntLiteral(0)), Assign(x, IntLiteral(0)),
+                While(Lt(i, IntLiteral(10)), Sequence(
+                    And(Lt(i, IntLiteral(5)), Sequence(Assign(x, Add(x, i)), BooleanLiteral(True))),
+                    Or(Lt(i, IntLiteral(5)), Eq(Assign(x, Add(x, IntLiteral(100))), IntLiteral(0))),
+                    Assign(i, Add(i, IntLiteral(1))))), x),
+        # Unit comparisons and Not.
+        Program(Assign(i, IntLiteral(0)), Assign(x, Ren()),
+                While(Not(Gte(i, IntLiteral(4))), Sequence(
+                    Print(Lte(x, Ren())),
+                    Assign(i, Add(i, IntLiteral(1))))), x),
+    ]
+
+
+def test_jit():
+    for threshold in [1, 2, 5]:
+        for program in sample_programs() + loop_programs():
+            check_same_behavior(lambda program: run_stimpl(
+                program, jit_threshold=threshold), program)
+        for program in loop_programs():
+            check_same_behavior(lambda program: run_stimpl(
+                program, jit_threshold=threshold, short_circuit=True),
+                program, lambda program: run_stimpl(program, short_circuit=True))
+            check_same_behavior(lambda program: run_stimpl(
+                program, jit_threshold=threshold, compact_every=2, state=HashTrieState()), program)
+
+    # A hot loop runs as Python with no type checks.
+    loop = counting_loop(10).exprs[2]
+    state = EmptyState().set_value("i", 0, INTEGER).set_value("total", 0, INTEGER)
+    source = loop_source(loop, state)
+    check_equal(True, "while True:" in source)
+    check_equal(False, "Integer" in source)
+
+    # Code compiled for one set of types is not used for another.
+    value, value_type, state = run_stimpl(counting_loop(10), jit_threshold=1)
+    check_equal((45, INTEGER), (value, value_type))
+    program = Program(Assign(Variable("i"), FloatingPointLiteral(0.0)),
+                      Assign(Variable("total"), FloatingPointLiteral(0.0)),
+                      While(Lt(Variable("i"), FloatingPointLiteral(10.0)), Sequence(
+                          Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+                          Assign(Variable("i"), Add(Variable("i"), FloatingPointLiteral(1.0))))),
+                      Variable("total"))
+    check_equal((45.0, FLOATING_POINT), run_stimpl(program, jit_threshold=1)[:2])
+
+    # Iterations add up over the entries of a loop: an inner loop that
+    # only runs twice each time gets hot all the same.
+    i, j, n = Variable("i"), Variable("j"), Variable("nested")
+    inner = While(Lt(j, IntLiteral(2)), Sequence(Assign(n, Add(n, j)), Assign(j, Add(j, IntLiteral(1)))))
+    program = Program(Assign(i, IntLiteral(0)), Assign(n, IntLiteral(0)),
+                      While(Lt(i, IntLiteral(10)), Sequence(
+                          Assign(j, IntLiteral(0)), inner, Assign(i, Add(i, IntLiteral(1))))),
+                      n)
+    check_same_behavior(lambda program: run_stimpl(program, jit_threshold=5), program)
+    check_equal(True, any(code is not None for code in loop_record(inner).variants.values()))
+
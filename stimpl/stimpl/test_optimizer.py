@@ -0,0 +1,150 @@
+import contextlib
+import io
+
+from stimpl import serialize
+from stimpl.interning import Interner
+from stimpl.optimizer import optimize, count_nodes, hoist
+from stimpl.runtime import run_stimpl, HashTrieState, ENGINES
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.test import check_equal, check_program_raises, check_same_behavior, counting_loop, sample_programs
+
+
+def test_optimizer():
+    for program in sample_programs():
+        check_same_behavior(lambda program: run_stimpl(
+            optimize(program)[0]), program)
+
+    program = Program(
+        Assign(Variable("x"), IntLiteral(3)),
+        Ren(),
+        Multiply(Variable("x"), Add(IntLiteral(0), IntLiteral(1))),
+        If(Not(BooleanLiteral(True)),
+           Print(StringLiteral("never")),
+           Not(Not(Lt(Variable("x"), IntLiteral(2))))))
+    optimized, report = optimize(program)
+    check_equal(7, count_nodes(optimized))
+    check_equal(["fold", "simplify", "prune"],
+                [pass_report.name for pass_report in report.passes[:3]])
+    check_equal([3, 4, 5], [pass_report.removed for pass_report in report.passes[:3]])
+    check_equal(count_nodes(program) - 7, report.removed)
+    check_equal((False, Boolean()), run_stimpl(optimized)[:2])
+
+    # Only literals that are the identity itself are dropped: x - -0.0 is
+    # 0.0 when x is -0.0.
+    f = Variable("f")
+    for program in [Program(Assign(f, FloatingPointLiteral(-0.0)), Print(Subtract(f, FloatingPointLiteral(-0.0)))),
+                    Program(Assign(f, FloatingPointLiteral(-0.0)), Print(Subtract(f, FloatingPointLiteral(0.0))))]:
+        check_same_behavior(lambda program: run_stimpl(optimize(program)[0]), program)
+    check_equal(f, optimize(Program(Assign(f, FloatingPointLiteral(-0.0)),
+                                     Subtract(f, FloatingPointLiteral(0.0))))[0].exprs[1])
+    check_equal(Subtract(f, FloatingPointLiteral(-0.0)), optimize(Program(
+        Assign(f, FloatingPointLiteral(-0.0)), Subtract(f, FloatingPointLiteral(-0.0))))[0].exprs[1])
+
+    # What raises at runtime is left for the runtime to raise.
+    for program in [Divide(IntLiteral(1), IntLiteral(0)),
+                    Add(IntLiteral(1), FloatingPointLiteral(1.0)),
+                    Program(Assign(Variable("f"), FloatingPointLiteral(2.0)),
+                            Multiply(Variable("f"), IntLiteral(1)))]:
+        optimized, report = optimize(program)
+        check_equal(0, report.removed)
+        check_program_raises(InterpMathError() if isinstance(
+            program, Divide) else InterpTypeError(), optimized)
+
+
+def test_hoist():
+    x, y, i = Variable("x"), Variable("y"), Variable("i")
+    program = Program(
+        Assign(x, IntLiteral(3)),
+        Assign(y, FloatingPointLiteral(4.0)),
+        Assign(i, IntLiteral(0)),
+        While(Lt(i, Multiply(x, IntLiteral(4))), Sequence(
+            Assign(i, Add(i, Add(Multiply(x, x), IntLiteral(1)))),
+            Print(Divide(y, FloatingPointLiteral(2.0))),
+            # Not invariant: the loop assigns i.
+            Print(Multiply(i, x)))),
+        i)
+    hoisted = hoist(program)
+    loop = hoisted.exprs[3]
+    check_equal([Multiply(x, IntLiteral(4)), Add(Multiply(x, x), IntLiteral(1)),
+                 Divide(y, FloatingPointLiteral(2.0))],
+                [assign.value for assign in loop.exprs[:-1]])
+    check_equal(True, all(type(assign.variable) is Temporary for assign in loop.exprs[:-1]))
+    runs = [
+        lambda program: run_stimpl(program),
+        lambda program: run_stimpl(program, engine="iterative"),
+        lambda program: run_stimpl(program, engine="closure", checked=True, frame=True),
+        lambda program: run_stimpl(program, engine="vm", compact_every=2),
+        lambda program: run_stimpl(program, state=HashTrieState()),
+    ]
+    for run in runs:
+        check_same_behavior(lambda program: run(hoist(program)), program)
+        # The temporaries do not leak.
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, _, state = run(hoisted)
+        check_equal(False, "$" in repr(state))
+    check_same_behavior(lambda program: run_stimpl(hoist(program)), counting_loop(10))
+    # A run finds the temporaries once per program, not once per run.
+    check_equal(frozenset(assign.variable.variable_name for assign in loop.exprs[:-1]),
+                temporary_names(hoisted))
+    check_equal(True, temporary_names(hoisted) is temporary_names(hoisted))
+    check_equal(frozenset(), temporary_names(program))
+
+    # Only what hoist adds is a temporary: the program's own variables are
+    # kept whatever they are called, on every engine and after a round
+    # trip through the binary format.
+    dollar = Variable("$0")
+    program = Program(Assign(dollar, IntLiteral(3)), Assign(i, IntLiteral(0)),
+                      While(Lt(i, IntLiteral(2)), Assign(i, Add(i, Multiply(dollar, dollar)))), dollar)
+    hoisted = hoist(program)
+    check_equal(frozenset({"$1"}), temporary_names(hoisted))
+    for engine in ENGINES:
+        for run_program in [program, hoisted, serialize.loads(serialize.dumps(hoisted))]:
+            value, _, state = run_stimpl(run_program, engine=engine)
+            check_equal((3, INTEGER), state.get_value("$0"))
+            check_equal(None, state.get_value("$1"))
+
+    # Nothing that could raise is hoisted, even out of a loop that never
+    # runs: a division by a variable, a read of a variable assigned only
+    # later, or one assigned only on one branch.
+    for program in [
+        Program(Assign(x, IntLiteral(0)),
+                While(BooleanLiteral(False), Print(Divide(IntLiteral(1), x)))),
+        Program(While(BooleanLiteral(False), Print(Add(x, IntLiteral(1)))),
+                Assign(x, IntLiteral(1))),
+        Program(If(BooleanLiteral(False), Assign(x, IntLiteral(1)), Ren()),
+                While(BooleanLiteral(False), Print(Add(x, IntLiteral(1)))),
+                Assign(x, IntLiteral(1))),
+    ]:
+        check_equal(program, hoist(program))
+        check_same_behavior(lambda program: run_stimpl(optimize(program)[0]), program)
+
+    # A loop that occurs twice is only hoisted out of what is safe at
+    # both occurrences, whether it was reused or shared by interning.
+    shared = While(Lt(i, IntLiteral(0)), Print(Add(y, IntLiteral(1))))
+    program = Program(Assign(i, IntLiteral(0)), shared, Assign(y, IntLiteral(5)), shared, i)
+    interned = Interner().intern(Program(
+        Assign(i, IntLiteral(0)), While(Lt(i, IntLiteral(0)), Print(Add(y, IntLiteral(1)))),
+        Assign(y, IntLiteral(5)), While(Lt(i, IntLiteral(0)), Print(Add(y, IntLiteral(1)))), i))
+    check_equal(True, interned.exprs[1] is interned.exprs[3])
+    for program in [program, interned]:
+        check_equal((0, INTEGER), run_stimpl(hoist(program))[:2])
+        check_same_behavior(lambda program: run_stimpl(hoist(program)), program)
+        check_same_behavior(lambda program: run_stimpl(optimize(program)[0]), program)
+    both = Program(Assign(i, IntLiteral(0)), Assign(y, IntLiteral(5)), shared, shared, i)
+    check_equal(True, Add(y, IntLiteral(1)) in [assign.value for assign in hoist(both).exprs[2].exprs[:-1]])
+
+    # Inner loops hoist first; another round moves what is also
+    # invariant in the outer loop further out.
+    program = Program(
+        Assign(x, IntLiteral(2)),
+        Assign(i, IntLiteral(0)),
+        While(Lt(i, IntLiteral(3)), Sequence(
+            Assign(y, IntLiteral(0)),
+            While(Lt(y, Multiply(x, x)), Assign(y, Add(y, IntLiteral(1)))),
+            Assign(i, Add(i, IntLiteral(1))))),
+        y)
+    optimized, _ = optimize(program)
+    check_same_behavior(lambda program: run_stimpl(optimize(program)[0]), program)
+    check_equal(Multiply(x, x), optimized.exprs[2].exprs[0].value)
@@ -0,0 +1,92 @@
+import contextlib
+import io
+
+from stimpl.output import BufferedSink, ListSink, NullSink, OutputSink, StreamSink, OUTPUT, writing_to
+from stimpl.runtime import run_stimpl, ENGINES
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, sample_programs
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self) -> None:
+        super().__init__()
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, text: str) -> int:
+        self.writes.append(text)
+        return super().write(text)
+
+    def flush(self) -> None:
+        self.flushes += 1
+
+
+def printing_loop(limit):
+    i = Variable("i")
+    return Program(
+        Assign(i, IntLiteral(0)),
+        While(Lt(i, IntLiteral(limit)), Sequence(
+            Print(i),
+            Assign(i, Add(i, IntLiteral(1))))),
+        Print(Ren()))
+
+
+def test_output():
+    # Sinks change where output goes, not what it is or when it stops.
+    for engine in ENGINES:
+        for program in sample_programs():
+            check_same_behavior(lambda program: run_stimpl(program, engine=engine,
+                                                           output=BufferedSink(flush_at=4)), program)
+            check_same_behavior(lambda program: run_stimpl(program, engine=engine,
+                                                           output=StreamSink()), program)
+
+    program = Program(Print(IntLiteral(1)), Print(FloatingPointLiteral(2.5)), Print(StringLiteral("s")),
+                      Print(BooleanLiteral(False)), Print(Ren()))
+    for engine in ENGINES:
+        sink = ListSink()
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            run_stimpl(program, engine=engine, output=sink)
+        check_equal("", stdout.getvalue())
+        check_equal(["1", "2.5", "s", "False", "Unit"], sink.lines)
+        check_equal("1\n2.5\ns\nFalse\nUnit\n", sink.text())
+
+    # So does the JIT.
+    sink = ListSink()
+    run_stimpl(printing_loop(10), jit_threshold=2, output=sink)
+    check_equal([str(i) for i in range(10)] + ["Unit"], sink.lines)
+
+    # A buffered sink writes once flush_at characters are waiting, and
+    # what is left when the run ends.
+    stream = RecordingStream()
+    run_stimpl(printing_loop(10), output=BufferedSink(stream, flush_at=6))
+    check_equal(["0\n1\n2\n", "3\n4\n5\n", "6\n7\n8\n", "9\nUnit\n"], stream.writes)
+    check_equal(True, stream.flushes >= 4)
+
+    # Output printed before an error is not lost.
+    stream = RecordingStream()
+    failing = Program(Print(IntLiteral(1)), Divide(IntLiteral(1), IntLiteral(0)))
+    check_raises(InterpMathError, lambda: run_stimpl(failing, output=BufferedSink(stream)))
+    check_equal("1\n", stream.getvalue())
+
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        run_stimpl(printing_loop(3), output=NullSink())
+    check_equal("", stdout.getvalue())
+
+    # The sink is only in place for the run, and sinks nest.
+    default = OUTPUT.get()
+    outer, inner = ListSink(), ListSink()
+    with writing_to(outer):
+        run_stimpl(Print(IntLiteral(1)))
+        run_stimpl(Print(IntLiteral(2)), output=inner)
+        run_stimpl(Print(IntLiteral(3)))
+    check_equal(["1", "3"], outer.lines)
+    check_equal(["2"], inner.lines)
+    check_equal(default, OUTPUT.get())
+
+    check_raises(ValueError, lambda: BufferedSink(flush_at=0))
+    # A sink has to say what it does with a line.
+    check_raises(TypeError, OutputSink)
@@ -0,0 +1,99 @@
+import pickle
+
+from stimpl.parallel import run_parallel
+from stimpl.runtime import run_stimpl, EmptyState, HashTrieState
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, run_outcome, counting_loop, sample_programs, variable_names
+
+
+def result_outcome(result, names):
+    """
+    run_outcome of a ProgramResult.
+    """
+    if result.error is not None:
+        return (result.output, type(result.error), str(result.error))
+    return (result.output, result.value, result.type,
+            [(name, result.state.get_value(name)) for name in sorted(names)])
+
+
+def test_parallel():
+    programs = sample_programs()
+    results = list(run_parallel(programs, workers=2, chunk_size=7))
+    check_equal(list(range(len(programs))), sorted(result.index for result in results))
+    for result in results:
+        names = variable_names(programs[result.index])
+        check_equal(run_outcome(run_stimpl, programs[result.index], names),
+                    result_outcome(result, names))
+
+    results = list(run_parallel([counting_loop(10)] * 5, workers=2, engine="vm",
+                                keep_state=False, frame=True))
+    check_equal([(45, INTEGER, None)] * 5,
+                [(result.value, result.type, result.state) for result in results])
+
+    # A program that runs too long is stopped; the others are not.
+    forever = While(BooleanLiteral(True), Ren())
+    results = sorted(run_parallel([forever, counting_loop(3)], workers=1, timeout=0.2),
+                     key=lambda result: result.index)
+    check_equal(InterpTimeoutError, type(results[0].error))
+    check_equal(3, results[1].value)
+
+    check_raises(ValueError, lambda: next(run_parallel([Ren()], engine="nope")))
+    check_raises(ValueError, lambda: next(run_parallel([Ren()], chunk_size=0)))
+    check_raises(TypeError, lambda: next(run_parallel([Ren()], colour=True)))
+
+
+class Twice(Expr):
+    # A node stimpl.serialize has no tag for.
+    __slots__ = ('expr',)
+
+    def __init__(self, expr):
+        super().__init__()
+        self.expr = expr
+
+    def _fields(self):
+        return (self.expr,)
+
+
+class Annotated(Add):
+    # A subclass of a node it has a tag for, with a __dict__.
+    pass
+
+
+def test_pickling():
+    # Nodes the binary format cannot hold still pickle, and so do trees
+    # holding them.
+    for expression in [Expr(), Twice(IntLiteral(1)), Program(Assign(Variable("x"), Twice(IntLiteral(1)))),
+                       Annotated(IntLiteral(1), IntLiteral(2))]:
+        hash(expression)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            restored = pickle.loads(pickle.dumps(expression, protocol))
+            check_equal(False, hasattr(restored, '_hash'))
+            check_equal(type(expression), type(restored))
+            check_equal(expression, restored)
+    annotated = Annotated(IntLiteral(1), IntLiteral(2))
+    annotated.note = "kept"
+    check_equal("kept", pickle.loads(pickle.dumps(annotated)).note)
+
+    # Deep programs and long states pickle without recursing.
+    deep = IntLiteral(0)
+    for _ in range(20000):
+        deep = Add(deep, IntLiteral(1))
+    check_equal(deep, pickle.loads(pickle.dumps(deep)))
+
+    state = EmptyState()
+    for index in range(20000):
+        state = state.set_value("x", index, INTEGER)
+    state = state.set_value("y", "s", STRING)
+    restored = pickle.loads(pickle.dumps(state))
+    check_equal(state.depth(), restored.depth())
+    check_equal(((19999, INTEGER), ("s", STRING)), (restored.get_value("x"), restored.get_value("y")))
+    check_equal(EmptyState, type(pickle.loads(pickle.dumps(EmptyState()))))
+
+    trie = HashTrieState()
+    for index in range(500):
+        trie = trie.set_value(f"v{index}", index, INTEGER)
+    restored = pickle.loads(pickle.dumps(trie))
+    check_equal([(index, INTEGER) for index in range(500)],
+                [restored.get_value(f"v{index}") for index in range(500)])
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+import tempfile
+
+from stimpl.profiler import Profile
+from stimpl.runtime import run_stimpl
+from stimpl.compiler import compile
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+
+
+def test_profiler():
+    for program in sample_programs():
+        check_same_behavior(lambda program: run_stimpl(program, profile=Profile()), program)
+
+    profile = Profile()
+    program = counting_loop(5)
+    check_equal((10, INTEGER), run_stimpl(program, profile=profile)[:2])
+    loop = program.exprs[2]
+    by_node = {stats.node: stats for stats in profile.nodes.values()}
+    check_equal(1, by_node[loop].count)
+    check_equal(5, by_node[loop].iterations)
+    check_equal(6, by_node[loop.condition].count)
+    check_equal(5, by_node[loop.body].count)
+    check_equal(1, profile.types["While"].count)
+    check_equal(10, profile.types["Add"].count)
+    check_equal("Program#1", by_node[program].label)
+    check_equal(len(profile.nodes), len(profile.hot_spots()))
+
+    # Self times add up to the total, by node and by stack.
+    root = by_node[program]
+    check_equal(root.total_ns, sum(stats.self_ns for stats in profile.nodes.values()))
+    check_equal(root.total_ns, sum(stats.self_ns for stats in profile.types.values()))
+    stacks = [line.rsplit(" ", 1) for line in profile.collapsed().splitlines()]
+    check_equal(root.total_ns, sum(int(self_ns) for _, self_ns in stacks))
+    check_equal(True, all(stack.startswith("Program#1") for stack, _ in stacks))
+    check_equal(True, f"Program#1;{by_node[loop].label};{by_node[loop.body].label}" in dict(stacks))
+
+    # Nested activations of a type count once in its total.
+    deep = IntLiteral(0)
+    for _ in range(50):
+        deep = Add(deep, IntLiteral(1))
+    profile = Profile()
+    run_stimpl(deep, profile=profile)
+    check_equal(50, profile.types["Add"].count)
+    check_equal(profile.types["Add"].total_ns, profile.nodes[id(deep)].total_ns)
+
+    # Runs add up, and a run that raises leaves a consistent profile.
+    profile = Profile()
+    run_stimpl(counting_loop(5), profile=profile)
+    run_stimpl(counting_loop(5), profile=profile)
+    check_equal(2, profile.types["While"].count)
+    check_equal(10, sum(stats.iterations for stats in profile.nodes.values()))
+    failing = Sequence(Assign(Variable("x"), IntLiteral(1)), Divide(Variable("x"), IntLiteral(0)))
+    check_raises(InterpMathError, lambda: run_stimpl(failing, profile=profile))
+    check_equal(1, profile.types["Divide"].count)
+    check_equal(1, profile.nodes[id(failing)].count)
+    check_equal(profile.nodes[id(failing)].total_ns,
+                sum(profile.nodes[id(node)].total_ns for node in failing.exprs) + profile.nodes[id(failing)].self_ns)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "profile.folded")
+        profile.write_collapsed(path)
+        with open(path) as collapsed_file:
+            check_equal(profile.collapsed(), collapsed_file.read())
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        check_equal((10, INTEGER), run_stimpl(counting_loop(5), profile=True)[:2])
+    report = output.getvalue()
+    check_equal(True, report.startswith("70 node evaluations in "))
+    check_equal(True, "While#6 (while (Variable i < literal value: 5)" in report)
+
+    for run in [lambda: run_stimpl(counting_loop(5), engine="vm", profile=True),
+                lambda: run_stimpl(counting_loop(5), jit_threshold=2, profile=True),
+                lambda: run_stimpl(compile(counting_loop(5)), profile=True)]:
+        check_raises(ValueError, run)
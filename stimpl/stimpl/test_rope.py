@@ -0,0 +1,100 @@
+import contextlib
+import io
+import pickle
+import sys
+
+from stimpl.rope import Rope, concat, flatten, ROPE_THRESHOLD
+from stimpl.runtime import run_stimpl, ENGINES
+from stimpl.optimizer import fold
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_same_behavior, sample_programs
+
+
+def building_loop(limit, piece, prepend=False):
+    i, text = Variable("i"), Variable("text")
+    added = Add(StringLiteral(piece), text) if prepend else Add(text, StringLiteral(piece))
+    return Program(
+        Assign(i, IntLiteral(0)),
+        Assign(text, StringLiteral("")),
+        While(Lt(i, IntLiteral(limit)), Sequence(
+            Assign(text, added),
+            Assign(i, Add(i, IntLiteral(1))))),
+        text)
+
+
+def test_rope():
+    long = "a" * ROPE_THRESHOLD
+    check_equal("ab", concat("a", "b"))
+    check_equal(str, type(concat("a", "b")))
+    rope = concat(long, "b")
+    check_equal(Rope, type(rope))
+    check_equal(long + "b", str(rope))
+
+    # Ropes are values: adding to one leaves it, and anything sharing it,
+    # as it was.
+    base = concat(long, "x")
+    left, right = concat(base, "y"), concat(base, "z")
+    check_equal(long + "x", str(base))
+    check_equal(long + "xy", str(left))
+    check_equal(long + "xz", str(right))
+    check_equal(long + "xzw", str(concat(right, "w")))
+    check_equal("w" + long + "xz", str(concat("w", right)))
+    check_equal(long + "x" + long + "x", str(concat(base, base)))
+
+    # They behave like the str they stand for.
+    for other in ["", "b", long, long + "x", long + "y", concat(long, "w")]:
+        for operator in ["==", "!=", "<", "<=", ">", ">="]:
+            check_equal(eval(f"flatten(base) {operator} flatten(other)"), eval(f"base {operator} other"))
+            check_equal(eval(f"flatten(other) {operator} flatten(base)"), eval(f"other {operator} base"))
+    check_equal(False, base == 0)
+    check_equal(hash(long + "x"), hash(base))
+    check_equal(len(long) + 1, len(base))
+    check_equal(f"{long + 'x'!r}", repr(base))
+    check_equal(f"{long + 'x':>600}", f"{base:>600}")
+    check_equal(long + "x", pickle.loads(pickle.dumps(base)))
+    check_equal(str, type(pickle.loads(pickle.dumps(base))))
+    # A state budget counts a rope at least as much as its str.
+    check_equal(True, sys.getsizeof(concat(long, "x")) >= sys.getsizeof(long + "x"))
+
+    # Flattening does not recurse, however deep the rope.
+    deep = ""
+    for index in range(20000):
+        deep = concat(deep, str(index % 10) * (index % 300))
+    check_equal("".join(str(index % 10) * (index % 300) for index in range(20000)), str(deep))
+    deep = ""
+    for _ in range(20000):
+        deep = concat("xyz" * 100, deep)
+    check_equal("xyz" * 2000000, str(deep))
+
+    # Every engine builds strings as ropes and returns a flat one.
+    for engine in ENGINES:
+        for prepend in (False, True):
+            value, value_type, state = run_stimpl(building_loop(300, "abcd", prepend), engine=engine)
+            check_equal(("abcd" * 300, STRING), (value, value_type))
+            check_equal(str, type(value))
+            check_equal(("abcd" * 300, STRING), state.get_value("text"))
+        for program in sample_programs():
+            check_same_behavior(lambda program: run_stimpl(program, engine=engine), program)
+    check_equal("abcd" * 300, run_stimpl(building_loop(300, "abcd"), jit_threshold=2)[0])
+    check_equal("abcd" * 300, run_stimpl(building_loop(300, "abcd"), engine="python", checked=True)[0])
+    check_equal("abcd" * 300, run_stimpl(building_loop(300, "abcd"), engine="closure", checked=True)[0])
+
+    text = Variable("text")
+    built = building_loop(200, "ab")
+    comparisons = Program(*built.exprs[:-1],
+                          Print(text),
+                          Print(Eq(text, StringLiteral("ab" * 200))),
+                          Print(Lt(text, StringLiteral("ab" * 200 + "a"))),
+                          Print(Gt(text, StringLiteral("ac"))),
+                          Print(Ne(text, Add(text, StringLiteral("")))))
+    for engine in ENGINES:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_stimpl(comparisons, engine=engine)
+        check_equal("ab" * 200 + "\nTrue\nTrue\nFalse\nFalse\n", output.getvalue())
+
+    # Folding long literals still makes a literal.
+    folded = fold(Add(StringLiteral(long), StringLiteral("b")))
+    check_equal(StringLiteral(long + "b"), folded)
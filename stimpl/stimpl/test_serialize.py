@@ -0,0 +1,70 @@
+import contextlib
+import io
+import os
+import pickle
+import tempfile
+
+from stimpl.serialize import dumps, loads, load, save
+from stimpl.optimizer import hoist
+from stimpl.runtime import run_stimpl
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+
+
+def test_serialize():
+    for program in sample_programs():
+        check_equal(program, loads(dumps(program)))
+        check_same_behavior(lambda program: run_stimpl(loads(dumps(program))), program)
+
+    literals = Program(IntLiteral(-(2 ** 100)), IntLiteral(-1), IntLiteral(1),
+                       FloatingPointLiteral(1.0), FloatingPointLiteral(-0.0),
+                       BooleanLiteral(True), StringLiteral("xé\U0001f600"), StringLiteral(""),
+                       Sequence(), Ren())
+    check_equal(literals, loads(dumps(literals)))
+    # Repeated names and literals are pooled.
+    name = "a_rather_long_variable_name"
+    repeated = Program(*[Assign(Variable(name), StringLiteral(name * 2)) for _ in range(100)])
+    check_equal(True, len(dumps(repeated)) < 100 * len(name))
+
+    deep = IntLiteral(0)
+    for _ in range(20000):
+        deep = Add(deep, IntLiteral(1))
+    check_equal(deep, loads(dumps(deep)))
+
+    check_raises(InterpSyntaxError, lambda: loads(b"nope"))
+    check_raises(InterpSyntaxError, lambda: loads(dumps(counting_loop(3))[:-2]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.stpb")
+        x = Variable("x")
+        untaken = Sequence(Print(StringLiteral("never")), Assign(x, IntLiteral(2)))
+        program = Program(Assign(x, IntLiteral(1)),
+                          If(Lt(x, IntLiteral(0)), untaken, Sequence(Print(x))),
+                          counting_loop(4))
+        save(program, path)
+        loaded = load(path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_equal((6, INTEGER), run_stimpl(loaded)[:2])
+        # The branch that was not taken was never decoded.
+        check_equal([None, None], loaded.exprs[1].true.exprs._exprs)
+        check_equal(program, loaded)
+        check_equal(program, pickle.loads(pickle.dumps(loaded)))
+        check_equal(program, load(path, lazy=False))
+        check_same_behavior(lambda program: run_stimpl(load(path)), program)
+
+        # The optimizer's temporaries stay out of the final state without
+        # decoding the whole program to find them.
+        def run_saved(program):
+            save(program, path)
+            return run_stimpl(load(path))
+        loop = While(Lt(x, IntLiteral(5)), Assign(
+            x, Add(x, Multiply(Add(IntLiteral(1), IntLiteral(0)), IntLiteral(1)))))
+        hoisted = hoist(Program(Assign(x, IntLiteral(0)), loop))
+        check_same_behavior(run_saved, hoisted)
+        check_equal(hoisted, load(path))
+        check_equal(True, type(load(path, lazy=False).exprs[1].exprs[0].variable) is Temporary)
+
+        open(path, "wb").close()
+        check_raises(InterpSyntaxError, lambda: load(path))
@@ -0,0 +1,72 @@
+from stimpl.errors import *
+from stimpl.runtime import run_stimpl
+from stimpl.compiler import compile
+from stimpl.vm import lower, disassemble
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, run_outcome, sample_programs
+
+
+def short_circuit_runs():
+    return [
+        lambda program: run_stimpl(program, engine="iterative", short_circuit=True),
+        lambda program: run_stimpl(program, engine="closure", short_circuit=True),
+        lambda program: run_stimpl(program, engine="closure", short_circuit=True, checked=True),
+        lambda program: run_stimpl(program, engine="closure", short_circuit=True, checked=True, frame=True),
+        lambda program: run_stimpl(program, engine="vm", short_circuit=True),
+        lambda program: run_stimpl(program, engine="vm", short_circuit=True, frame=True),
+    ]
+
+
+def test_short_circuit():
+    def reference(program):
+        return run_stimpl(program, short_circuit=True)
+
+    x = Variable("x")
+    skipping = [
+        # The right operand would never finish.
+        And(BooleanLiteral(False), While(BooleanLiteral(True), Ren())),
+        Or(BooleanLiteral(True), While(BooleanLiteral(True), Ren())),
+        # ... or print and assign.
+        Program(Assign(x, IntLiteral(0)),
+                Or(Lt(x, IntLiteral(1)), Sequence(Print(StringLiteral("no")), Assign(x, IntLiteral(5)), BooleanLiteral(True))),
+                x),
+        Program(Assign(x, BooleanLiteral(True)),
+                And(x, Print(Not(x))), Or(Not(x), Print(x))),
+    ]
+    programs = sample_programs() + skipping
+    for program in programs:
+        for run in short_circuit_runs():
+            check_same_behavior(run, program, reference)
+
+    # Operands that do not decide the result are still evaluated, so
+    # short-circuiting only changes programs that skip something.
+    check_same_behavior(reference, And(BooleanLiteral(True), Print(BooleanLiteral(False))))
+    check_same_behavior(reference, Or(BooleanLiteral(False), Print(BooleanLiteral(True))))
+
+    check_equal((False, BOOLEAN), run_stimpl(skipping[0], short_circuit=True)[:2])
+    check_equal((True, BOOLEAN), run_stimpl(skipping[1], short_circuit=True)[:2])
+    check_equal((0, INTEGER), run_stimpl(skipping[2], short_circuit=True)[:2])
+
+    # A non-Boolean right operand is rejected even where it is skipped.
+    for program in [And(BooleanLiteral(False), IntLiteral(1)),
+                    Or(BooleanLiteral(True), StringLiteral("s")),
+                    Or(BooleanLiteral(True), Assign(Variable("x"), Ren()))]:
+        check_raises(InterpError, lambda: run_stimpl(program, short_circuit=True))
+        for run in short_circuit_runs():
+            check_raises(InterpError, lambda: run(program))
+
+    # One compiled program or bytecode serves both semantics.
+    compiled = compile(skipping[2])
+    bytecode = lower(skipping[2])
+    for program in (compiled, bytecode):
+        check_equal(("no\n", 5), run_outcome(run_stimpl, program, ["x"])[:2])
+        check_equal(("", 0), run_outcome(lambda program: run_stimpl(
+            program, short_circuit=True), program, ["x"])[:2])
+
+    check_equal("\n".join([
+        "     0 LOAD        0      (x)",
+        "     2 AND_THEN    8",
+        "     4 LOAD        1      (y)",
+        "     6 BINARY      4      (And)",
+    ]), disassemble(lower(And(Variable("x"), Variable("y")), short_circuit=True)))
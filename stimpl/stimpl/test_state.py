@@ -1,4 +1,6 @@
-from stimpl.runtime import EmptyState
+from stimpl.runtime import EmptyState, HashTrieState, run_stimpl
+from stimpl.expression import *
+from stimpl.hamt import HashTrie
 from stimpl.types import Boolean, Integer
 from stimpl.test import check_equal
 
@@ -12,4 +14,79 @@ def test_state_implementation():
     state4 = state3.set_value("x", 7, Integer())
     check_equal((7, Integer()),state4.get_value("x"))
     check_equal((5, Integer()), state2.get_value("x"))
-    check_equal(None,state4.get_value("y"))
\ No newline at end of file
+    check_equal(None,state4.get_value("y"))
+
+def test_hash_trie_state_implementation():
+    state = HashTrieState()
+    check_equal(None, state.get_value("x"))
+    state2 = state.set_value("x", 5, Integer())
+    check_equal((5, Integer()), state2.get_value("x"))
+    state3 = state2.set_value("k", True, Boolean())
+    check_equal((True, Boolean()), state3.get_value("k"))
+    state4 = state3.set_value("x", 7, Integer())
+    check_equal((7, Integer()), state4.get_value("x"))
+    check_equal((5, Integer()), state2.get_value("x"))
+    check_equal(None, state4.get_value("y"))
+
+    # Enough bindings to force several trie levels.
+    states = [state]
+    for i in range(2000):
+        states.append(states[-1].set_value(f"v{i}", i, Integer()))
+    for i in range(2000):
+        check_equal((i, Integer()), states[-1].get_value(f"v{i}"))
+        check_equal(None, states[i].get_value(f"v{i}"))
+    check_equal(2000, len(states[-1].trie))
+
+
+class _CollidingKey(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, _CollidingKey) and self.name == other.name
+
+
+def test_hash_trie_collisions():
+    trie = HashTrie()
+    keys = [_CollidingKey(str(i)) for i in range(10)]
+    for i, key in enumerate(keys):
+        trie = trie.set(key, i)
+    check_equal(10, len(trie))
+    for i, key in enumerate(keys):
+        check_equal(i, trie.get(key))
+    check_equal(None, trie.get(_CollidingKey("missing")))
+    check_equal(99, trie.set(keys[3], 99).get(keys[3]))
+    check_equal(3, trie.get(keys[3]))
+
+
+def test_state_compaction():
+    base = EmptyState().set_value("x", 0, Integer())
+    state = base
+    for i in range(5000):
+        state = state.set_value("i", i, Integer()).set_value("x", -i, Integer())
+    # Lookups walk the chain without recursing.
+    check_equal((0, Integer()), base.get_value("x"))
+    check_equal((4999, Integer()), state.get_value("i"))
+
+    compacted = state.compact(base)
+    check_equal(3, compacted.depth())
+    check_equal((4999, Integer()), compacted.get_value("i"))
+    check_equal((-4999, Integer()), compacted.get_value("x"))
+    check_equal((0, Integer()), base.get_value("x"))
+    check_equal(compacted, compacted.compact(base))
+
+    program = Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        Assign(Variable("total"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(5000)),
+              Sequence(
+            Assign(Variable("total"), Add(Variable("total"), Variable("i"))),
+            Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))))
+    )
+    _, _, run_state = run_stimpl(program, compact_every=64)
+    check_equal((5000, Integer()), run_state.get_value("i"))
+    check_equal((sum(range(5000)), Integer()), run_state.get_value("total"))
+    check_equal(True, run_state.depth() <= 2 + 2 * 64)
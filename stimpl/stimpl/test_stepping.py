@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import stimpl
+from stimpl.output import ListSink
+from stimpl.stepping import Execution, load, loads
+from stimpl.runtime import run_stimpl, EmptyState, HashTrieState
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+from stimpl.test_async import forever
+from stimpl.test_output import printing_loop
+from stimpl.test_rope import building_loop
+
+
+def run_restoring(program, pause_every=1, **options):
+    # Runs program a pause at a time, going through a snapshot at every
+    # pause.
+    execution = Execution(program, **options)
+    execution = loads(execution.dumps())
+    while True:
+        for _ in execution.steps(pause_every):
+            break
+        if execution.finished:
+            return execution.result
+        execution = loads(execution.dumps())
+
+
+def test_stepping():
+    for options in [{}, {"frame": True}, {"checked": True}, {"compact_every": 2},
+                    {"short_circuit": True}, {"frame": True, "short_circuit": True}]:
+        for program in sample_programs():
+            check_same_behavior(lambda program: run_restoring(program, **options), program,
+                                lambda program: run_stimpl(program, engine="vm", **options))
+            check_same_behavior(lambda program: Execution(program, **options).run(), program,
+                                lambda program: run_stimpl(program, engine="vm", **options))
+    for state in [EmptyState().set_value("i", 5, INTEGER),
+                  HashTrieState().set_value("i", 5, INTEGER).set_value("j", "s", STRING)]:
+        for frame in (False, True):
+            expected = run_stimpl(counting_loop(10), engine="vm", state=state, frame=frame)
+            actual = run_restoring(counting_loop(10), state=state, frame=frame)
+            check_equal(expected[:2], actual[:2])
+            for variable_name in ["i", "j", "total"]:
+                check_equal(expected[2].get_value(variable_name), actual[2].get_value(variable_name))
+
+    # Stopping the iteration leaves the run paused where it was.
+    execution = Execution(counting_loop(100))
+    pauses = 0
+    for paused in execution.steps(10):
+        check_equal(execution, paused)
+        pauses += 1
+        if pauses == 3:
+            break
+    check_equal(False, execution.finished)
+    check_equal(7, sum(1 for _ in execution.steps(10)))
+    check_equal(True, execution.finished)
+    check_equal((4950, INTEGER), execution.result[:2])
+    check_equal(0, sum(1 for _ in execution.steps(10)))
+    check_equal(execution.result, execution.run())
+
+    # A snapshot holds the live bindings, not the history of the state.
+    def snapshot_after(steps):
+        execution = Execution(counting_loop(100000))
+        for _ in execution.steps(steps):
+            return execution.dumps()
+    check_equal(True, len(snapshot_after(90000)) <= len(snapshot_after(10)) + 16)
+
+    # Long strings are written out flat and built on after a restore.
+    check_equal(("abcd" * 300, STRING), run_restoring(building_loop(300, "abcd"), pause_every=100)[:2])
+
+    # The budget carries over: it runs out on the same step.
+    check_equal((780, INTEGER), run_restoring(counting_loop(40), pause_every=7, max_steps=40)[:2])
+    check_raises(InterpResourceError, lambda: run_restoring(counting_loop(41), pause_every=7, max_steps=40))
+    check_raises(InterpResourceError, lambda: run_restoring(forever(), max_state_bytes=10))
+
+    # A restored run prints to its own sink, after the lines printed
+    # before the snapshot.
+    before, after = ListSink(), ListSink()
+    execution = Execution(printing_loop(10), output=before)
+    for _ in execution.steps(4):
+        break
+    loads(execution.dumps(), output=after).run()
+    check_equal([str(i) for i in range(10)] + ["Unit"], before.lines + after.lines)
+
+    # The snapshot carries on in another process.
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "run.stps")
+        execution = Execution(counting_loop(1000), compact_every=5, max_steps=1000)
+        for _ in execution.steps(300):
+            break
+        execution.save(path)
+        check_equal((499500, INTEGER), load(path).run()[:2])
+        script = ("import sys; from stimpl.stepping import load; "
+                  "value, _, state = load(sys.argv[1]).run(); print(value, state.get_value('i')[0])")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(stimpl.__file__)))
+        finished = subprocess.run([sys.executable, "-c", script, path], cwd=root,
+                                  capture_output=True, text=True, check=True)
+        check_equal("499500 1000\n", finished.stdout)
+
+    check_raises(InterpSyntaxError, lambda: loads(b"nope"))
+    check_raises(InterpSyntaxError, lambda: loads(b"STPB" + Execution(counting_loop(1)).dumps()[4:]))
+    check_raises(InterpSyntaxError, lambda: loads(Execution(counting_loop(1)).dumps()[:-4]))
+    check_raises(ValueError, lambda: list(Execution(counting_loop(1)).steps(0)))
+    check_raises(ValueError, lambda: Execution("not a program"))
+    finished = Execution(counting_loop(1))
+    finished.run()
+    check_raises(ValueError, finished.dumps)
+
+    # A run that raised cannot go on.
+    failing = Execution(Program(forever().exprs[0], Divide(IntLiteral(1), IntLiteral(0))))
+    check_raises(InterpMathError, failing.run)
+    check_raises(ValueError, failing.run)
+    check_raises(ValueError, failing.dumps)
+
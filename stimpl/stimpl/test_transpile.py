@@ -0,0 +1,76 @@
+import ast
+import os
+import tempfile
+
+from stimpl.transpile import TranspiledProgram, program_digest, transpile, transpiled, _codes
+from stimpl.runtime import run_stimpl, HashTrieState, RunOptions
+from stimpl.errors import *
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, sample_programs
+
+
+def test_transpile():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for program in sample_programs():
+            check_same_behavior(lambda program: run_stimpl(transpiled(program, cache_dir)), program)
+            check_same_behavior(lambda program: run_stimpl(
+                transpiled(program, cache_dir), checked=True), program, lambda program: run_stimpl(program, checked=True))
+            check_same_behavior(lambda program: run_stimpl(
+                transpiled(program, cache_dir), short_circuit=True), program,
+                lambda program: run_stimpl(program, short_circuit=True))
+
+        x = Variable("x")
+        program = Program(
+            Assign(x, IntLiteral(7)),
+            Print(Add(x, Assign(x, IntLiteral(1)))),
+            Print(Divide(x, IntLiteral(2))),
+            Print(Divide(FloatingPointLiteral(7.0), FloatingPointLiteral(2.0))),
+            Print(Lte(Ren(), Ren())),
+            If(Lt(x, IntLiteral(2)), Print(StringLiteral("small")), Ren()),
+            counting_loop(5))
+        check_same_behavior(lambda program: run_stimpl(transpiled(program, cache_dir)), program)
+        check_same_behavior(lambda program: run_stimpl(transpiled(program, cache_dir), state=HashTrieState()),
+                            program)
+        check_equal(True, isinstance(transpile(program), ast.Module))
+
+        # Runs of an equal program reuse the code, from memory or disk.
+        _codes.clear()
+        first = TranspiledProgram(counting_loop(10), cache_dir)
+        check_equal((45, INTEGER), run_stimpl(first)[:2])
+        check_equal(first.digest, program_digest(counting_loop(10)))
+        cached = [name for name in os.listdir(cache_dir) if name.startswith(first.digest)]
+        check_equal(1, len(cached))
+        _codes.clear()
+        check_equal((45, INTEGER), run_stimpl(TranspiledProgram(counting_loop(10), cache_dir))[:2])
+        # A damaged cache entry is translated again.
+        with open(os.path.join(cache_dir, cached[0]), "wb") as cache_file:
+            cache_file.write(b"\0")
+        _codes.clear()
+        check_equal((45, INTEGER), run_stimpl(TranspiledProgram(counting_loop(10), cache_dir))[:2])
+
+    check_equal(False, program_digest(IntLiteral(1)) == program_digest(FloatingPointLiteral(1.0)))
+    check_equal(False, program_digest(IntLiteral(1)) == program_digest(BooleanLiteral(True)))
+    check_equal(False, program_digest(Sequence(Ren())) == program_digest(Program(Ren())))
+    check_equal(False, program_digest(Add(Ren(), Sequence(Ren()))) == program_digest(Add(Sequence(Ren()), Ren())))
+    # A non-Boolean right operand is only rejected up front when
+    # short-circuiting; a checked run raises where an unchecked one does.
+    ill_typed = TranspiledProgram(And(BooleanLiteral(False), StringLiteral("s")), None)
+    check_raises(InterpTypeError, lambda: ill_typed.code(RunOptions(short_circuit=True)))
+    check_raises(InterpTypeError, lambda: run_stimpl(ill_typed, checked=True))
+
+    # Loops nested deeper than Python allows run on the closure compiler.
+    def nested_loops(depth):
+        program = Print(StringLiteral("innermost"))
+        for level in range(depth):
+            v = Variable(f"v{level}")
+            program = Sequence(Assign(v, IntLiteral(0)), While(Lt(v, IntLiteral(1)), Sequence(
+                program, Assign(v, Add(v, IntLiteral(1))))))
+        return Program(program, Variable("v0"))
+    for depth, falls_back in [(20, False), (21, True), (30, True)]:
+        program = nested_loops(depth)
+        check_equal(falls_back, TranspiledProgram(program, None).fallback is not None)
+        for options in [{}, {"checked": True}, {"short_circuit": True}, {"max_steps": 25}]:
+            check_same_behavior(lambda program: run_stimpl(TranspiledProgram(program, None), **options), program,
+                                lambda program: run_stimpl(program, **options))
+
@@ -0,0 +1,109 @@
+from stimpl.typecheck import check, DYNAMIC
+from stimpl.runtime import run_stimpl, EmptyState, HashTrieState
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.test import check_equal, check_raises, check_same_behavior, counting_loop, run_outcome, sample_programs
+
+
+def test_typecheck():
+    for program in sample_programs():
+        for engine in ["tree", "closure", "vm", "python"]:
+            check_same_behavior(lambda program: run_stimpl(
+                program, engine=engine, checked=True), program)
+
+    program = Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        Assign(Variable("label"), If(Lt(Variable("i"), IntLiteral(1)),
+                                     StringLiteral("small"), IntLiteral(1))),
+        Add(Variable("i"), IntLiteral(1)))
+    report = check(program)
+    check_equal(Integer(), report.type_of(program))
+    check_equal(Integer(), report.variable_type("i"))
+    check_equal(None, report.variable_type("label"))
+    check_equal(DYNAMIC, report.variables["label"])
+
+    # A loop that reads a variable before the assignment that types it.
+    program = Program(
+        Assign(Variable("n"), IntLiteral(0)),
+        While(Lt(Variable("n"), IntLiteral(3)),
+              Sequence(
+            If(Gt(Variable("n"), IntLiteral(0)),
+               Print(Add(Variable("last"), StringLiteral("!"))), Ren()),
+            Assign(Variable("last"), StringLiteral("x")),
+            Assign(Variable("n"), Add(Variable("n"), IntLiteral(1))))))
+    check_equal(String(), check(program).variable_type("last"))
+    check_same_behavior(lambda program: run_stimpl(
+        program, engine="closure", checked=True), program)
+
+    # The checker rejects nothing: code that never runs, or runs after
+    # another error, or assigns a variable different types on different
+    # paths, does in a checked run what it does in an unchecked one.
+    x = Variable("x")
+    for program, expected in [
+        (Program(If(BooleanLiteral(True), Assign(x, IntLiteral(1)), Assign(x, StringLiteral("s"))), x),
+         (1, INTEGER)),
+        (Program(Assign(x, IntLiteral(1)), If(BooleanLiteral(False), Assign(x, StringLiteral("s")), Ren()),
+                 Add(x, IntLiteral(1))),
+         (2, INTEGER)),
+        (If(BooleanLiteral(False), Add(IntLiteral(1), StringLiteral("a")), Ren()), (None, UNIT)),
+        (If(BooleanLiteral(False), Sequence(Not(IntLiteral(1)), Variable("never"),
+                                            While(IntLiteral(1), Ren()),
+                                            Divide(IntLiteral(1), FloatingPointLiteral(1.0))), Ren()),
+         (None, UNIT)),
+        (And(BooleanLiteral(False), Lt(IntLiteral(1), StringLiteral("a"))), InterpTypeError),
+        (Sequence(Divide(IntLiteral(1), IntLiteral(0)), Add(IntLiteral(1), StringLiteral("a"))),
+         InterpMathError),
+        (Program(Assign(x, IntLiteral(1)), Assign(x, StringLiteral("s"))), InterpTypeError),
+        (Program(Assign(x, IntLiteral(1)), Add(x, StringLiteral("s"))), InterpTypeError),
+        (If(IntLiteral(1), Ren(), Ren()), InterpTypeError),
+    ]:
+        check_equal(True, len(check(program).errors) > 0)
+        if isinstance(expected, tuple):
+            check_equal(expected, run_stimpl(program)[:2])
+        else:
+            check_raises(expected, lambda: run_stimpl(program))
+        for engine in ["tree", "closure", "vm", "python"]:
+            check_same_behavior(lambda program: run_stimpl(program, engine=engine, checked=True), program)
+        check_same_behavior(lambda program: run_stimpl(program, engine="closure", checked=True, frame=True),
+                            program)
+    check_equal(DYNAMIC, check(Program(
+        If(BooleanLiteral(True), Assign(x, IntLiteral(1)), Assign(x, StringLiteral("s"))), x)).variables["x"])
+
+    # So does a checked run from a state of its own, whether or not the
+    # state binds a variable to the type the checker inferred for it.
+    y = Variable("y")
+    for program in [Program(Assign(x, IntLiteral(1)), x),
+                    Program(Assign(y, Add(x, IntLiteral(1))), Assign(x, IntLiteral(2)), y)]:
+        report = check(program)
+        for state, fits in [(EmptyState().set_value("x", "s", STRING), False),
+                            (HashTrieState().set_value("x", "s", STRING), False),
+                            (EmptyState().set_value("x", 5, INTEGER), True),
+                            (EmptyState().set_value("z", "s", STRING), True)]:
+            check_equal(fits, report.fits(state))
+            for engine in ["tree", "closure", "vm", "python"]:
+                check_same_behavior(lambda program: run_stimpl(program, engine=engine, checked=True, state=state),
+                                    program, lambda program: run_stimpl(program, state=state))
+            check_same_behavior(lambda program: run_stimpl(program, engine="closure", checked=True, frame=True,
+                                                           state=state),
+                                program, lambda program: run_stimpl(program, state=state))
+
+    # Short-circuiting rejects a non-Boolean right operand of And or Or
+    # before the program runs, since skipping it would hide the error;
+    # anything else ill-typed raises where it runs, as without it.
+    program = Program(Print(IntLiteral(1)), If(BooleanLiteral(False), And(BooleanLiteral(True), IntLiteral(1)), Ren()))
+    check_raises(InterpTypeError, check(program).verify)
+    for engine in ["tree", "closure", "vm", "python"]:
+        check_equal(("", InterpTypeError), run_outcome(
+            lambda program: run_stimpl(program, engine=engine, short_circuit=True), program, [])[:2])
+    for program in [Program(Print(IntLiteral(1)), If(BooleanLiteral(False), Add(IntLiteral(1), StringLiteral("a")), Ren())),
+                    Program(Print(IntLiteral(1)), Add(IntLiteral(1), StringLiteral("a"))),
+                    Or(BooleanLiteral(True), Variable("never")),
+                    And(Variable("never"), BooleanLiteral(True))]:
+        check_equal(True, len(check(program).errors) > 0)
+        check(program).verify()
+        for engine in ["tree", "closure", "vm", "python"]:
+            check_same_behavior(lambda program: run_stimpl(program, engine=engine, short_circuit=True), program,
+                                lambda program: run_stimpl(program, engine="iterative", short_circuit=True))
+    check_equal((True, BOOLEAN), run_stimpl(Or(BooleanLiteral(True), Variable("never")), short_circuit=True)[:2])
+    check(counting_loop(3)).verify()
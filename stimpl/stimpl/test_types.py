@@ -0,0 +1,26 @@
+import copy
+import sys
+import pickle
+
+import stimpl
+import stimpl.types
+
+from stimpl.types import *
+from stimpl.test import check_equal
+
+
+def test_types():
+    for type_class, instance in ((Unit, UNIT), (Integer, INTEGER), (FloatingPoint, FLOATING_POINT),
+                                 (String, STRING), (Boolean, BOOLEAN)):
+        check_equal(True, type_class() is instance)
+        check_equal(True, pickle.loads(pickle.dumps(instance)) is instance)
+        check_equal(True, copy.deepcopy(instance) is instance)
+        check_equal(False, hasattr(instance, '__dict__'))
+    check_equal(False, INTEGER == FLOATING_POINT)
+    check_equal(True, INTEGER != BOOLEAN)
+    check_equal(2, len({INTEGER, Integer(), STRING}))
+    check_equal("String", {STRING: "String"}[String()])
+
+    # The package's star imports do not put a standard library module
+    # in the place of this one.
+    check_equal(True, stimpl.types is sys.modules["stimpl.types"])
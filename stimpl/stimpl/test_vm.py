@@ -0,0 +1,49 @@
+import stimpl
+from stimpl.vm import lower, disassemble
+from stimpl.runtime import run_stimpl
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.test import check_equal, check_same_behavior, counting_loop, sample_programs
+
+
+def test_vm():
+    for program in sample_programs():
+        check_same_behavior(lambda program: run_stimpl(program, engine="vm"), program)
+        check_same_behavior(lambda program: run_stimpl(program, engine="closure"), program)
+
+    # Constants that Python considers equal are still different literals.
+    program = Program(Print(FloatingPointLiteral(-0.0)), Print(FloatingPointLiteral(0.0)),
+                      Print(IntLiteral(1)), Print(BooleanLiteral(True)), Print(FloatingPointLiteral(1.0)))
+    check_equal(5, len(lower(program).constants))
+    check_same_behavior(lambda program: run_stimpl(program, engine="vm"), program)
+
+    # Far deeper than the Python recursion limit.
+    program = IntLiteral(0)
+    for _ in range(50000):
+        program = Add(program, IntLiteral(1))
+    value, value_type, _ = run_stimpl(program, engine="vm")
+    check_equal((50000, Integer()), (value, value_type))
+
+    bytecode = lower(counting_loop(100))
+    value, value_type, _ = run_stimpl(bytecode)
+    check_equal((4950, Integer()), (value, value_type))
+    _, _, state = run_stimpl(bytecode, compact_every=8)
+    check_equal((100, Integer()), state.get_value("i"))
+    check_equal(True, state.depth() <= 3 + 2 * 8)
+
+    check_equal("\n".join([
+        "     0 CONST       0      (1, Integer)",
+        "     2 STORE       0      (x)",
+        "     4 POP",
+        "     6 LOAD        0      (x)",
+        "     8 IF_FALSE    14",
+        "    10 CONST       1      ('yes', String)",
+        "    12 JUMP        16",
+        "    14 CONST       2      ('no', String)",
+    ]), disassemble(lower(Program(
+        Assign(Variable("x"), IntLiteral(1)),
+        If(Variable("x"), StringLiteral("yes"), StringLiteral("no"))))))
+
+    # The package exports the vm's API, not its opcodes.
+    check_equal(True, stimpl.lower is lower)
+    check_equal(False, hasattr(stimpl, "CONST") or hasattr(stimpl, "OPCODE_NAMES"))
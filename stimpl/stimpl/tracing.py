@@ -0,0 +1,165 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.runtime import State, Hooks, HOOKS, HOOK_EVENTS
+
+"""
+Batching helpers for the evaluation hooks (see runtime.Hooks).
+
+A metrics system rarely wants a call per node. An EventBuffer keeps the
+events it is installed for in memory and hands them to its sink as a
+list; an EventCounter keeps only how many of each event happened to
+each node type and hands its sink the counts. Either flushes when it
+has max_events events waiting, when interval seconds have passed since
+it last flushed (noticed as events arrive), when flush() is called and
+when it is uninstalled -- which a with block does on the way out:
+
+    with EventCounter(send_to_metrics, interval=10.0):
+        run_stimpl(program)
+"""
+
+DEFAULT_MAX_EVENTS = 10000
+DEFAULT_INTERVAL = 1.0
+
+
+class BatchingHook(ABC):
+    """
+    What EventBuffer and EventCounter share: installing themselves as
+    hooks and deciding when to flush. Subclasses record events with
+    record() and say what a flush hands the sink with take().
+    """
+
+    def __init__(self, sink: Callable[[Any], None], max_events: int = DEFAULT_MAX_EVENTS,
+                 interval: Optional[float] = DEFAULT_INTERVAL, events: Tuple[str, ...] = HOOK_EVENTS,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if max_events < 1:
+            raise ValueError("max_events must be a positive integer.")
+        if interval is not None and interval <= 0:
+            raise ValueError("interval must be positive.")
+        for event in events:
+            if event not in HOOK_EVENTS:
+                raise ValueError(f"Unknown hook event {event!r}; expected one of {HOOK_EVENTS}.")
+        self.sink = sink
+        self.max_events = max_events
+        self.interval = interval
+        self.events = events
+        self.clock = clock
+        self.pending = 0
+        self.flushed_at = clock()
+        self._installed: List[Tuple[Hooks, str, Callable]] = []
+
+    def install(self, hooks: Hooks = HOOKS) -> 'BatchingHook':
+        callbacks = {"enter": self.on_enter, "exit": self.on_exit, "assign": self.on_assign,
+                     "print": self.on_print, "error": self.on_error}
+        for event in self.events:
+            self._installed.append((hooks, event, hooks.add(event, callbacks[event])))
+        return self
+
+    def uninstall(self) -> None:
+        for hooks, event, callback in self._installed:
+            hooks.remove(event, callback)
+        self._installed = []
+        self.flush()
+
+    @abstractmethod
+    def record(self, event: str, subject: Any) -> None:
+        """
+        Notes one event about subject, then calls _recorded().
+        """
+
+    @abstractmethod
+    def take(self) -> Any:
+        """
+        What the events noted since the last flush amount to, forgetting
+        them.
+        """
+
+    def flush(self) -> None:
+        """
+        Hands the sink whatever is waiting, if anything is.
+        """
+        self.flushed_at = self.clock()
+        if self.pending:
+            self.pending = 0
+            self.sink(self.take())
+
+    def _recorded(self) -> None:
+        self.pending += 1
+        if self.pending >= self.max_events or \
+                (self.interval is not None and self.clock() - self.flushed_at >= self.interval):
+            self.flush()
+
+    def on_enter(self, node: Expr, state: State) -> None:
+        self.record("enter", node)
+
+    def on_exit(self, node: Expr, result: Optional[Tuple[Any, Type, State]]) -> None:
+        self.record("exit", node)
+
+    def on_assign(self, variable_name: str, value: Any, value_type: Type) -> None:
+        self.record("assign", (variable_name, value, value_type))
+
+    def on_print(self, value: Any, value_type: Type) -> None:
+        self.record("print", (value, value_type))
+
+    def on_error(self, node: Expr, error: Exception) -> None:
+        self.record("error", (node, error))
+
+    def __enter__(self) -> 'BatchingHook':
+        return self.install()
+
+    def __exit__(self, *exc_info) -> None:
+        self.uninstall()
+
+
+class EventBuffer(BatchingHook):
+    """
+    Hands the sink lists of (event, subject) pairs in the order they
+    happened. The subject is the node for enter and exit, (name, value,
+    type) for assign, (value, type) for print and (node, error) for
+    error.
+    """
+
+    def __init__(self, sink: Callable[[List[Tuple[str, Any]]], None], **options: Any) -> None:
+        super().__init__(sink, **options)
+        self.buffer: List[Tuple[str, Any]] = []
+
+    def record(self, event: str, subject: Any) -> None:
+        self.buffer.append((event, subject))
+        self._recorded()
+
+    def take(self) -> List[Tuple[str, Any]]:
+        events, self.buffer = self.buffer, []
+        return events
+
+
+class EventCounter(BatchingHook):
+    """
+    Hands the sink a dict counting the events since the last flush by
+    (event, kind): the node type for enter, exit and error, the variable
+    name for assign and the value type for print.
+    """
+
+    def __init__(self, sink: Callable[[Dict[Tuple[str, str], int]], None], **options: Any) -> None:
+        super().__init__(sink, **options)
+        self.counts: Dict[Tuple[str, str], int] = {}
+
+    def record(self, event: str, subject: Any) -> None:
+        match event:
+            case "enter" | "exit":
+                kind = type(subject).__name__
+            case "assign":
+                kind = subject[0]
+            case "print":
+                kind = str(subject[1])
+            case _:
+                kind = type(subject[0]).__name__
+        key = (event, kind)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self._recorded()
+
+    def take(self) -> Dict[Tuple[str, str], int]:
+        counts, self.counts = self.counts, {}
+        return counts
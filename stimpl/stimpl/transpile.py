@@ -0,0 +1,573 @@
+import ast
+import copy
+import hashlib
+import marshal
+import os
+import sys
+from itertools import repeat
+from operator import length_hint
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.runtime import State, EmptyState, RunOptions, DEFAULT_OPTIONS
+from stimpl.typecheck import TypeReport, check
+from stimpl.frame import resolve_slots, store_frame
+from stimpl.compiler import CompiledProgram
+from stimpl.rope import concat
+
+"""
+STIMPL to Python.
+
+transpile() turns a whole program into a Python ast.Module defining
+
+    def run(state, budget):
+        ...
+        return (value, type, final_state)
+
+Every variable becomes a Python local holding its (value, type) binding,
+exactly like a frame slot (see stimpl.frame), and every operator becomes
+a statement. Operators check their operand types at run time through
+the same BinaryOperation rules every other engine uses, so Integer
+division floors, dividing by zero raises InterpMathError, Units compare
+the way the tree walker compares them, and every type error is raised
+where the tree walker raises it. With the checked option the program is
+type checked first and proved operators become plain Python operators.
+A run with a budget (see stimpl.runtime.Budget) gets code whose loops
+charge it, measuring a frame of the locals when the state size is
+budgeted; budget is None otherwise.
+
+TranspiledProgram compiles the module to a code object once. Code
+objects are cached in memory and on disk under the program's
+structural digest, so running the same program again -- in this process
+or a later one -- neither walks the tree nor translates it.
+
+Translation recurses on the depth of the program, like the closure
+compiler. Every While becomes one Python loop and Python allows at most
+20 statically nested loops, so a program with deeper While nesting
+cannot be transpiled; TranspiledProgram runs it on the closure compiler
+instead.
+"""
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "STIMPL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "stimpl"))
+
+# Python's limit on statically nested blocks, which loops are.
+_MAX_NESTED_LOOPS = 20
+
+# Bumped whenever the generated code changes, so stale cache entries are
+# never loaded.
+_FORMAT = 3
+
+
+def program_digest(program: Expr) -> str:
+    """
+    A hex digest of program's structure that is the same in every
+    process: equal programs (in the sense of Expr.__eq__) and only equal
+    programs share it.
+    """
+    digest = hashlib.sha256()
+    pending = [program]
+    while pending:
+        expression = pending.pop()
+        fields = expression._fields()
+        digest.update(f"{type(expression).__name__}/{len(fields)}(".encode())
+        for field in fields:
+            if not isinstance(field, Expr):
+                # The same distinctions literal_key makes.
+                text = field.hex() if isinstance(field, float) else repr(field)
+                digest.update(f"{type(field).__name__}:{len(text)}:{text}".encode())
+        pending.extend(reversed([field for field in fields if isinstance(field, Expr)]))
+    return digest.hexdigest()
+
+
+def _loop_depth(program: Expr) -> int:
+    """
+    The largest number of While loops nested in one another in program.
+    """
+    deepest = 0
+    pending = [(program, 0)]
+    while pending:
+        expression, depth = pending.pop()
+        if isinstance(expression, While):
+            depth += 1
+            deepest = max(deepest, depth)
+        pending.extend((child, depth) for child in children(expression))
+    return deepest
+
+
+class TranspiledProgram(object):
+    """
+    A program transpiled to Python. One code object is made (or loaded
+    from the cache) per combination of the checked and short_circuit
+    options and of what the budget limits; the other options do not
+    apply to it, since variables live in Python locals rather than a
+    State. A program whose loops nest too deeply for Python runs on the
+    closure compiler (see stimpl.compiler) with the same options.
+    """
+
+    def __init__(self, program: Expr, cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> None:
+        self.program = program
+        self.cache_dir = cache_dir
+        self.digest = program_digest(program)
+        self.temporaries = temporary_names(program)
+        # Only made when a checked run starts from bindings of its own.
+        self.type_report: Optional[TypeReport] = None
+        self._functions: Dict[tuple, Callable[[State], Tuple[Any, Type, State]]] = {}
+        self.fallback: Optional[CompiledProgram] = None
+        if _loop_depth(program) > _MAX_NESTED_LOOPS:
+            self.fallback = CompiledProgram(program)
+
+    def code(self, options: RunOptions = DEFAULT_OPTIONS) -> CodeType:
+        """
+        The code object of the module for options.
+        """
+        key = f"{self.digest}-{int(options.checked)}{int(options.short_circuit)}{_budgeting(options)}-{_FORMAT}"
+        code = _codes.get(key)
+        if code is None:
+            path = None
+            if self.cache_dir is not None:
+                path = os.path.join(
+                    self.cache_dir, f"{key}.{sys.implementation.cache_tag}.stimplc")
+                code = _load(path)
+            if code is None:
+                # A cached program passed the type check when it was
+                # transpiled; this one has to pass it now.
+                module = transpile(self.program, options.checked, options.short_circuit,
+                                   _budgeting(options))
+                code = compile(module, f"<stimpl {self.digest[:12]}>", "exec")
+                if path is not None:
+                    _store(path, code)
+            _codes[key] = code
+        return code
+
+    def execute(self, state: State, options: RunOptions = DEFAULT_OPTIONS) -> Tuple[Any, Type, State]:
+        if self.fallback is not None:
+            return self.fallback.execute(state, options)
+        if options.checked and type(state) is not EmptyState:
+            if self.type_report is None:
+                self.type_report = check(self.program)
+            if not self.type_report.fits(state):
+                # What the checker proved does not hold from this state.
+                options = copy.copy(options)
+                options.checked = False
+        key = (options.checked, options.short_circuit, _budgeting(options))
+        function = self._functions.get(key)
+        if function is None:
+            namespace = _namespace()
+            exec(self.code(options), namespace)
+            function = self._functions[key] = namespace["run"]
+        return function(state, options.budget)
+
+    def source(self, options: RunOptions = DEFAULT_OPTIONS) -> str:
+        return ast.unparse(transpile(self.program, options.checked, options.short_circuit,
+                                     _budgeting(options)))
+
+    def __repr__(self) -> str:
+        return f"transpiled {self.program}"
+
+
+# Code objects by cache key, and transpiled programs by program.
+_codes: Dict[str, CodeType] = {}
+_programs: Dict[Expr, TranspiledProgram] = {}
+_MAX_PROGRAMS = 256
+
+
+def transpiled(program: Expr, cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> TranspiledProgram:
+    """
+    The TranspiledProgram for program, shared by every run of an equal
+    program in this process.
+    """
+    transpiled_program = _programs.get(program)
+    if transpiled_program is None or transpiled_program.cache_dir != cache_dir:
+        if len(_programs) >= _MAX_PROGRAMS:
+            _programs.clear()
+        transpiled_program = _programs[program] = TranspiledProgram(
+            program, cache_dir)
+    return transpiled_program
+
+
+def _budgeting(options: RunOptions) -> int:
+    # 0: no budget; 1: steps only; 2: the state size too.
+    budget = options.budget
+    if budget is None:
+        return 0
+    return 1 if budget.max_state_bytes is None else 2
+
+
+def _load(path: str) -> Optional[CodeType]:
+    try:
+        with open(path, "rb") as cache_file:
+            return marshal.load(cache_file)
+    except (OSError, EOFError, ValueError, TypeError):
+        # Missing, unreadable or truncated: translate again.
+        return None
+
+
+def _store(path: str, code: CodeType) -> None:
+    # Written under a private name and renamed, so a concurrent reader
+    # never sees half a file. The cache is only an optimisation.
+    partial = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(partial, "wb") as cache_file:
+            marshal.dump(code, cache_file)
+        os.replace(partial, path)
+    except OSError:
+        pass
+
+
+def _namespace() -> Dict[str, Any]:
+    namespace = {
+        "UNIT": UNIT, "INTEGER": INTEGER, "FLOATING_POINT": FLOATING_POINT,
+        "STRING": STRING, "BOOLEAN": BOOLEAN,
+        "InterpMathError": InterpMathError, "InterpSyntaxError": InterpSyntaxError,
+        "assignment_error": assignment_error, "unassigned_error": unassigned_error,
+        "condition_error": condition_error, "not_value": not_value,
+        "print_value": print_value, "store_frame": store_frame, "concat": concat,
+        "repeat": repeat, "length_hint": length_hint,
+    }
+    for operation_class, operation in BINARY_OPERATIONS.items():
+        namespace[f"apply_{operation_class.__name__}"] = operation.apply
+    return namespace
+
+
+def transpile(program: Expr, checked: bool = False, short_circuit: bool = False,
+              budgeting: int = 0) -> ast.Module:
+    """
+    Translates program into a Python module defining run(state, budget).
+    budgeting is 0 for code that ignores the budget, 1 for code that
+    charges it steps and 2 for code that also has it measure the state.
+    """
+    types = check(program) if checked or short_circuit else None
+    if short_circuit:
+        types.verify()
+    return _Transpiler(program, types if checked else None, short_circuit, budgeting).module()
+
+
+def _name(name: str) -> ast.Name:
+    return ast.Name(id=name, ctx=ast.Load())
+
+
+def _store_name(name: str) -> ast.Name:
+    return ast.Name(id=name, ctx=ast.Store())
+
+
+def _budget_steps(ctx: ast.expr_context) -> ast.Attribute:
+    return ast.Attribute(value=_name("budget"), attr="steps", ctx=ctx)
+
+
+def _item(name: str, index: int) -> ast.Subscript:
+    return ast.Subscript(value=_name(name), slice=ast.Constant(index), ctx=ast.Load())
+
+
+def _call(function: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(func=_name(function), args=list(args), keywords=[])
+
+
+def _method(name: str, method: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(func=ast.Attribute(value=_name(name), attr=method, ctx=ast.Load()),
+                    args=list(args), keywords=[])
+
+
+def _is(left: ast.expr, right: ast.expr, negate: bool = False) -> ast.Compare:
+    return ast.Compare(left=left, ops=[ast.IsNot() if negate else ast.Is()], comparators=[right])
+
+
+def _raise(error: ast.expr) -> ast.Raise:
+    return ast.Raise(exc=error, cause=None)
+
+
+_TYPE_NAMES = {Unit: "UNIT", Integer: "INTEGER", FloatingPoint: "FLOATING_POINT",
+               String: "STRING", Boolean: "BOOLEAN"}
+
+_OPERATORS = {
+    Add: ast.Add, Subtract: ast.Sub, Multiply: ast.Mult,
+}
+_COMPARISONS = {
+    Lt: ast.Lt, Lte: ast.LtE, Gt: ast.Gt, Gte: ast.GtE, Eq: ast.Eq, Ne: ast.NotEq,
+}
+
+
+# A translated expression: Python expressions for its value and its type,
+# and its static type if the checker proved one. Both expressions are
+# free of effects and cannot raise.
+Translation = Tuple[ast.expr, ast.expr, Optional[Type]]
+
+
+class _Transpiler(object):
+    def __init__(self, program: Expr, types: Optional[TypeReport], short_circuit: bool,
+                 budgeting: int = 0) -> None:
+        self.program = program
+        self.types = types
+        self.short_circuit = short_circuit
+        self.budgeting = budgeting
+        # While loops translated so far.
+        self.loops = 0
+        self.slots = resolve_slots(program)
+        self.body: List[ast.stmt] = []
+        self.temporaries = 0
+
+    def module(self) -> ast.Module:
+        body: List[ast.stmt] = []
+        for variable_name, slot in self.slots.items():
+            body.append(ast.Assign(targets=[_store_name(f"b{slot}")],
+                                   value=ast.Call(func=ast.Attribute(value=_name("state"), attr="get_value",
+                                                                     ctx=ast.Load()),
+                                                  args=[ast.Constant(variable_name)], keywords=[])))
+        if self.budgeting == 1:
+            body.append(ast.Assign(targets=[_store_name("steps")], value=_budget_steps(ast.Load())))
+        self.body = body
+        value, value_type, _ = self.expression(self.program)
+        if self.budgeting == 1:
+            body.append(ast.Assign(targets=[_budget_steps(ast.Store())], value=_name("steps")))
+        frame = ast.List(elts=[_name(f"b{slot}") for slot in self.slots.values()], ctx=ast.Load())
+        slots = ast.Dict(keys=[ast.Constant(name) for name in self.slots],
+                         values=[ast.Constant(slot) for slot in self.slots.values()])
+        body.append(ast.Return(value=ast.Tuple(
+            elts=[value, value_type, _call("store_frame", slots, frame, _name("state"))], ctx=ast.Load())))
+        function = ast.FunctionDef(name="run", args=ast.arguments(
+            posonlyargs=[], args=[ast.arg(arg="state"), ast.arg(arg="budget")], kwonlyargs=[], kw_defaults=[], defaults=[]),
+            body=body, decorator_list=[], returns=None)
+        return ast.fix_missing_locations(ast.Module(body=[function], type_ignores=[]))
+
+    def emit(self, statement: ast.stmt) -> None:
+        self.body.append(statement)
+
+    def loop(self, test: str, body: List[ast.stmt], innermost: bool) -> ast.stmt:
+        # Every iteration is a step. Steps alone are counted in the steps
+        # local: a loop with no loop inside takes them from an
+        # itertools.repeat, which allocates nothing per iteration, and
+        # what is left of it is its length_hint; the others count by
+        # hand, since their inner loops count on the same local.
+        # Measuring the state takes a frame of the locals.
+        if self.budgeting == 1 and innermost:
+            body = body + [ast.If(test=ast.UnaryOp(op=ast.Not(), operand=_name(test)),
+                                  body=[ast.Break()], orelse=[])]
+            return ast.If(test=_name(test), body=[
+                ast.Assign(targets=[_store_name("ticks")],
+                           value=_call("repeat", ast.Constant(None), _name("steps"))),
+                ast.For(target=_store_name("_"), iter=_name("ticks"), body=body,
+                        orelse=[_raise(_method("budget", "out_of_steps"))]),
+                ast.Assign(targets=[_store_name("steps")], value=_call("length_hint", _name("ticks")))],
+                orelse=[])
+        if self.budgeting == 1:
+            body = [ast.If(test=ast.UnaryOp(op=ast.Not(), operand=_name("steps")),
+                           body=[_raise(_method("budget", "out_of_steps"))], orelse=[]),
+                    ast.AugAssign(target=_store_name("steps"), op=ast.Sub(), value=ast.Constant(1))] + body
+        elif self.budgeting == 2:
+            frame = ast.List(elts=[_name(f"b{slot}") for slot in self.slots.values()], ctx=ast.Load())
+            body = [ast.Expr(value=_method("budget", "step", frame))] + body
+        return ast.While(test=_name(test), body=body, orelse=[])
+
+    def temporary(self) -> str:
+        self.temporaries += 1
+        return f"t{self.temporaries}"
+
+    def assign(self, value: ast.expr) -> str:
+        temporary = self.temporary()
+        self.emit(ast.Assign(targets=[_store_name(temporary)], value=value))
+        return temporary
+
+    def block(self, translate: Callable[[], Any]) -> Tuple[List[ast.stmt], Any]:
+        # Runs translate with statements going to a fresh block.
+        outer = self.body
+        self.body = []
+        try:
+            result = translate()
+            return (self.body or [ast.Pass()], result)
+        finally:
+            self.body = outer
+
+    def static_type(self, expression: Expr) -> Optional[Type]:
+        return None if self.types is None else self.types.type_of(expression)
+
+    def pair(self, value: ast.expr) -> Translation:
+        # A (value, type) tuple computed at run time.
+        temporary = self.assign(value)
+        return (_item(temporary, 0), _item(temporary, 1), None)
+
+    def expression(self, expression: Expr) -> Translation:
+        match expression:
+            case Ren():
+                return (ast.Constant(None), _name("UNIT"), UNIT)
+
+            case IntLiteral(literal=l):
+                return (ast.Constant(l), _name("INTEGER"), INTEGER)
+
+            case FloatingPointLiteral(literal=l):
+                return (ast.Constant(l), _name("FLOATING_POINT"), FLOATING_POINT)
+
+            case StringLiteral(literal=l):
+                return (ast.Constant(l), _name("STRING"), STRING)
+
+            case BooleanLiteral(literal=l):
+                return (ast.Constant(l), _name("BOOLEAN"), BOOLEAN)
+
+            case Print(to_print=to_print):
+                value, value_type, static = self.expression(to_print)
+                self.emit(ast.Expr(value=_call("print_value", value, value_type)))
+                return (value, value_type, static)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                result = (ast.Constant(None), _name("UNIT"), UNIT)
+                for expr in exprs:
+                    result = self.expression(expr)
+                return result
+
+            case Variable(variable_name=variable_name):
+                binding = f"b{self.slots[variable_name]}"
+                self.emit(ast.If(test=_is(_name(binding), ast.Constant(None)), body=[
+                    _raise(_call("unassigned_error", ast.Constant(variable_name)))], orelse=[]))
+                static = self.static_type(expression)
+                value_type = _item(binding, 1) if static is None else _name(
+                    _TYPE_NAMES[type(static)])
+                return (_item(binding, 0), value_type, static)
+
+            case Assign(variable=variable, value=value):
+                value_code, value_type, static = self.expression(value)
+                variable_name = variable.variable_name
+                binding = f"b{self.slots[variable_name]}"
+                proved = self.types is not None and self.types.variable_type(
+                    variable_name) is not None
+                if not proved:
+                    self.emit(ast.If(test=ast.BoolOp(op=ast.And(), values=[
+                        _is(_name(binding), ast.Constant(None), negate=True),
+                        _is(_item(binding, 1), value_type, negate=True)]),
+                        body=[_raise(_call("assignment_error", value_type, _item(binding, 1)))],
+                        orelse=[]))
+                self.emit(ast.Assign(targets=[_store_name(binding)],
+                                     value=ast.Tuple(elts=[value_code, value_type], ctx=ast.Load())))
+                return (_item(binding, 0), _item(binding, 1), static)
+
+            case And(left=left, right=right) | Or(left=left, right=right) if self.short_circuit:
+                return self.short_circuit_operation(expression, left, right)
+
+            case BinaryOperator(left=left, right=right) if type(expression) in BINARY_OPERATIONS:
+                operation = BINARY_OPERATIONS[type(expression)]
+                (left_code, left_type, left_static), (right_code, right_type, right_static) = \
+                    self.operands(left, right)
+                if not operation.proves(left_static, right_static):
+                    return self.pair(_call(f"apply_{type(expression).__name__}",
+                                           left_code, left_type, right_code, right_type))
+                result_type = operation.result_type(left_static)
+                type_code = _name(_TYPE_NAMES[type(result_type)])
+                if operation.is_comparison and left_static is UNIT:
+                    return (ast.Constant(operation.unit_result), type_code, result_type)
+                match expression:
+                    case Divide():
+                        divisor = self.assign(right_code)
+                        self.emit(ast.If(test=ast.Compare(left=_name(divisor), ops=[ast.Eq()],
+                                                          comparators=[ast.Constant(0)]),
+                                         body=[_raise(_call("InterpMathError", ast.Constant("Division by zero.")))],
+                                         orelse=[]))
+                        operator = ast.FloorDiv() if left_static is INTEGER else ast.Div()
+                        value = ast.BinOp(left=left_code, op=operator, right=_name(divisor))
+                    case And() | Or():
+                        value = ast.BoolOp(op=ast.And() if isinstance(expression, And) else ast.Or(),
+                                           values=[left_code, right_code])
+                    case Add() if left_static is STRING:
+                        value = _call("concat", left_code, right_code)
+                    case _ if type(expression) in _COMPARISONS:
+                        value = ast.Compare(left=left_code, ops=[_COMPARISONS[type(expression)]()],
+                                            comparators=[right_code])
+                    case _:
+                        value = ast.BinOp(left=left_code, op=_OPERATORS[type(expression)](),
+                                          right=right_code)
+                return (_name(self.assign(value)), type_code, result_type)
+
+            case Not(expr=expr):
+                value, value_type, static = self.expression(expr)
+                if static is not BOOLEAN:
+                    return self.pair(_call("not_value", value, value_type))
+                return (_name(self.assign(ast.UnaryOp(op=ast.Not(), operand=value))), value_type, static)
+
+            case If(condition=condition, true=true, false=false):
+                condition_code = self.condition(condition, "if")
+                value, value_type = self.temporary(), self.temporary()
+
+                def branch(branch_expression):
+                    branch_value, branch_type, static = self.expression(branch_expression)
+                    self.emit(ast.Assign(targets=[ast.Tuple(elts=[_store_name(value), _store_name(value_type)],
+                                                            ctx=ast.Store())],
+                                         value=ast.Tuple(elts=[branch_value, branch_type], ctx=ast.Load())))
+                    return static
+
+                true_body, true_static = self.block(lambda: branch(true))
+                false_body, false_static = self.block(lambda: branch(false))
+                self.emit(ast.If(test=condition_code, body=true_body, orelse=false_body))
+                static = true_static if true_static is false_static else None
+                return (_name(value), _name(value_type), static)
+
+            case While(condition=condition, body=body):
+                test = self.temporary()
+                self.emit(ast.Assign(targets=[_store_name(test)], value=self.condition(condition, "while")))
+
+                loops = self.loops
+
+                def iteration():
+                    self.expression(body)
+                    # Later tests are not type checked, like in the tree
+                    # walker.
+                    condition_code, _, _ = self.expression(condition)
+                    self.emit(ast.Assign(targets=[_store_name(test)], value=condition_code))
+
+                loop_body, _ = self.block(iteration)
+                innermost = self.loops == loops
+                self.loops += 1
+                self.emit(self.loop(test, loop_body, innermost))
+                return (ast.Constant(False), _name("BOOLEAN"), BOOLEAN)
+
+            case _:
+                self.emit(_raise(_call("InterpSyntaxError", ast.Constant("Unhandled!"))))
+                return (ast.Constant(None), _name("UNIT"), UNIT)
+
+    def operands(self, left: Expr, right: Expr) -> Tuple[Translation, Translation]:
+        left_code, left_type, left_static = self.expression(left)
+        mark = len(self.body)
+        right_translation = self.expression(right)
+        if len(self.body) > mark:
+            # The right operand's statements could change what the left
+            # operand's expressions read, so take their values first.
+            saved = self.temporary()
+            self.body.insert(mark, ast.Assign(targets=[_store_name(saved)], value=ast.Tuple(
+                elts=[left_code, left_type], ctx=ast.Load())))
+            left_code, left_type = _item(saved, 0), _item(saved, 1)
+        return ((left_code, left_type, left_static), right_translation)
+
+    def condition(self, condition: Expr, construct: str) -> ast.expr:
+        value, value_type, static = self.expression(condition)
+        if static is not BOOLEAN:
+            self.emit(ast.If(test=_is(value_type, _name("BOOLEAN"), negate=True),
+                             body=[_raise(_call("condition_error", ast.Constant(construct)))], orelse=[]))
+        return value
+
+    def short_circuit_operation(self, expression: Expr, left: Expr, right: Expr) -> Translation:
+        operation_name = f"apply_{type(expression).__name__}"
+        # The left value that decides the operator by itself.
+        decisive = isinstance(expression, Or)
+        left_code, left_type, left_static = self.expression(left)
+        result = self.assign(ast.Tuple(elts=[left_code, left_type], ctx=ast.Load()))
+        left_code, left_type = _item(result, 0), _item(result, 1)
+
+        def evaluate_right():
+            right_code, right_type, right_static = self.expression(right)
+            if left_static is BOOLEAN and right_static is BOOLEAN:
+                self.emit(ast.Assign(targets=[_store_name(result)], value=ast.Tuple(
+                    elts=[right_code, right_type], ctx=ast.Load())))
+            else:
+                self.emit(ast.Assign(targets=[_store_name(result)], value=_call(
+                    operation_name, left_code, left_type, right_code, right_type)))
+            return right_static
+
+        right_body, right_static = self.block(evaluate_right)
+        decided = ast.Compare(left=_call("bool", left_code), ops=[ast.Is()],
+                              comparators=[ast.Constant(decisive)])
+        if left_static is not BOOLEAN:
+            decided = ast.BoolOp(op=ast.And(), values=[_is(left_type, _name("BOOLEAN")), decided])
+        self.emit(ast.If(test=ast.UnaryOp(op=ast.Not(), operand=decided), body=right_body, orelse=[]))
+        static = BOOLEAN if left_static is BOOLEAN and right_static is BOOLEAN else None
+        return (left_code, left_type, static)
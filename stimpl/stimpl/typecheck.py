@@ -0,0 +1,250 @@
+from typing import Any, Dict, List, Optional
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+
+"""
+Static type checking.
+
+check() infers the type of every node of a program before it runs. A
+variable has one type for the whole program (its first assignment fixes
+it), so a node's type does not depend on where it is reached from.
+
+A few nodes have no single static type -- an If whose branches have
+different types, a variable assigned values of different types, or
+anything computed from one. Those are reported as dynamic and the
+runtime keeps checking them.
+
+An operation whose operand types the checker can pin down and which
+would raise an InterpError is not rejected up front: it may be in code
+that never runs, or come after another error. It is reported as dynamic
+too, so it raises at run time exactly where an unchecked run raises, and
+the errors are listed in the report. So checking a program never changes
+what it does; it only tells the engines which checks they may leave out.
+The one exception is the short_circuit option (see TypeReport.verify).
+"""
+
+__all__ = ['DYNAMIC', 'TypeReport', 'check']
+
+
+class _Dynamic(object):
+    def __repr__(self):
+        return "Dynamic"
+
+
+# The type of a node whose type is only known at runtime.
+DYNAMIC = _Dynamic()
+
+
+class TypeReport(object):
+    def __init__(self, program: Expr, types: Dict[int, Any], variables: Dict[str, Any],
+                 errors: List[InterpError], operand_errors: List[InterpError]) -> None:
+        # Keeping the program alive keeps the node ids in types valid.
+        self.program = program
+        self.types = types
+        self.variables = variables
+        # What the ill-typed nodes may raise, in the order they were found.
+        self.errors = errors
+        # What each And and Or whose right operand is not Boolean raises
+        # when the right operand runs, in evaluation order.
+        self.operand_errors = operand_errors
+
+    def type_of(self, expression: Expr) -> Optional[Type]:
+        """
+        The static type of expression, or None if it is only known at
+        runtime.
+        """
+        expression_type = self.types.get(id(expression))
+        return expression_type if isinstance(expression_type, Type) else None
+
+    def variable_type(self, variable_name: str) -> Optional[Type]:
+        variable_type = self.variables.get(variable_name)
+        return variable_type if isinstance(variable_type, Type) else None
+
+    def fits(self, state: Any) -> bool:
+        """
+        Whether the report holds for a run that starts from state rather
+        than from an empty one: state binds no variable the program uses
+        to another type than the checker inferred for it.
+        """
+        for variable_name, variable_type in self.variables.items():
+            if isinstance(variable_type, Type):
+                binding = state.get_value(variable_name)
+                if binding is not None and type(binding[1]) is not type(variable_type):
+                    return False
+        return True
+
+    def verify(self) -> None:
+        """
+        Rejects a program that short-circuiting would change the errors
+        of: raises the error of the first And or Or whose right operand
+        is not Boolean, since skipping the operand would hide it. Other
+        ill-typed nodes raise when they run, as without the option.
+        """
+        if self.operand_errors:
+            raise self.operand_errors[0]
+
+
+def check(program: Expr) -> TypeReport:
+    """
+    Type checks program without running it.
+    """
+    checker = _Checker()
+    # Every pass can only learn more variable types, so this terminates;
+    # it takes more than one pass when a loop reads a variable before
+    # the assignment that types it.
+    checker.infer(program)
+    while checker.changed:
+        checker.changed = False
+        checker.infer(program)
+    checker.final = True
+    checker.infer(program)
+    return TypeReport(program, checker.types, checker.variables, list(checker.errors.values()),
+                      list(checker.operand_errors.values()))
+
+
+def _join(left: Any, right: Any) -> Any:
+    if left is None:
+        return right
+    if right is None or type(left) is type(right):
+        return left
+    return DYNAMIC
+
+
+class _Checker(object):
+    """
+    Abstract types are a Type, DYNAMIC, or None for "does not produce a
+    value (yet)": a read of a variable whose type is still unknown, or
+    anything computed from one.
+    """
+
+    def __init__(self) -> None:
+        self.types: Dict[int, Any] = {}
+        self.variables: Dict[str, Any] = {}
+        # The error of each ill-typed node, kept from the pass that first
+        # found it.
+        self.errors: Dict[int, InterpError] = {}
+        # The same for the And and Or nodes whose right operand is not
+        # Boolean, found in the final pass.
+        self.operand_errors: Dict[int, InterpError] = {}
+        self.changed = False
+        self.final = False
+
+    def infer(self, expression: Expr) -> Any:
+        expression_type = self._infer(expression)
+        self.types[id(expression)] = expression_type
+        return expression_type
+
+    def fail(self, expression: Expr, error: InterpError, result: Any = DYNAMIC) -> Any:
+        # expression may raise error when it runs (an assignment only
+        # does on some paths); leave it to the runtime to find out.
+        self.errors.setdefault(id(expression), error)
+        return result
+
+    def _infer(self, expression: Expr) -> Any:
+        match expression:
+            case Ren():
+                return UNIT
+
+            case IntLiteral():
+                return INTEGER
+
+            case FloatingPointLiteral():
+                return FLOATING_POINT
+
+            case StringLiteral():
+                return STRING
+
+            case BooleanLiteral():
+                return BOOLEAN
+
+            case Print(to_print=to_print):
+                return self.infer(to_print)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                result_type = UNIT
+                for expr in exprs:
+                    result_type = self.infer(expr)
+                return result_type
+
+            case Variable(variable_name=variable_name):
+                variable_type = self.variables.get(variable_name)
+                if variable_type is None and self.final:
+                    # Nothing that runs can ever give it a value.
+                    return self.fail(expression, unassigned_error(variable_name), None)
+                return variable_type
+
+            case Assign(variable=variable, value=value):
+                value_type = self.infer(value)
+                variable_name = variable.variable_name
+                variable_type = self.variables.get(variable_name)
+                if value_type is None or variable_type is DYNAMIC:
+                    return value_type
+                if type(value_type) is not type(variable_type) and variable_type is not None \
+                        and value_type is not DYNAMIC:
+                    # Assignments of different types: only the runtime
+                    # knows which comes first, or whether both run.
+                    self.fail(expression, assignment_error(value_type, variable_type))
+                    value_type = DYNAMIC
+                if variable_type is not value_type:
+                    self.variables[variable_name] = value_type
+                    self.changed = True
+                return value_type
+
+            case BinaryOperator(left=left, right=right) if type(expression) in BINARY_OPERATIONS:
+                operation = BINARY_OPERATIONS[type(expression)]
+                left_type = self.infer(left)
+                right_type = self.infer(right)
+                if self.final and type(expression) in (And, Or) and isinstance(right_type, Type) \
+                        and type(right_type) is not Boolean:
+                    self.operand_errors[id(expression)] = \
+                        operation.unsupported_error(right_type) if left_type is right_type \
+                        else operation.mismatch_error(left_type if isinstance(left_type, Type) else BOOLEAN,
+                                                      right_type)
+                if left_type is None or right_type is None:
+                    return None
+                if left_type is DYNAMIC or right_type is DYNAMIC:
+                    if operation.is_comparison or type(expression) in (And, Or):
+                        return BOOLEAN
+                    return right_type if left_type is DYNAMIC else left_type
+                if type(left_type) is not type(right_type):
+                    return self.fail(expression, operation.mismatch_error(left_type, right_type))
+                if operation.is_comparison and type(left_type) is Unit:
+                    return BOOLEAN
+                if type(left_type) not in operation.types:
+                    if type(expression) is Divide and type(left_type) is Boolean:
+                        # Dividing by False is a math error, not a type
+                        # error, and only the runtime knows which it is.
+                        return DYNAMIC
+                    return self.fail(expression, operation.unsupported_error(left_type))
+                return operation.result_type(left_type)
+
+            case Not(expr=expr):
+                value_type = self.infer(expr)
+                if value_type is None:
+                    return None
+                if value_type is not DYNAMIC and type(value_type) is not Boolean:
+                    return self.fail(expression, InterpTypeError(
+                        "Cannot perform logical not on non-boolean operand."))
+                return BOOLEAN
+
+            case If(condition=condition, true=true, false=false):
+                condition_type = self.infer(condition)
+                result_type = _join(self.infer(true), self.infer(false))
+                if isinstance(condition_type, Type) and type(condition_type) is not Boolean:
+                    return self.fail(expression, condition_error("if"))
+                return result_type if condition_type is not None else None
+
+            case While(condition=condition, body=body):
+                condition_type = self.infer(condition)
+                self.infer(body)
+                if isinstance(condition_type, Type) and type(condition_type) is not Boolean:
+                    return self.fail(expression, condition_error("while"))
+                return BOOLEAN if condition_type is not None else None
+
+            case _:
+                if self.final:
+                    return self.fail(expression, InterpSyntaxError("Unhandled!"), None)
+                return None
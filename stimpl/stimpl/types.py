@@ -1,83 +1,65 @@
 """
 Types
+
+Every type is a singleton: Integer() always returns the same object, so
+two types are equal exactly when they are identical, comparing them is a
+pointer comparison, and they hash (by identity) like any other object.
+The module constants below name the instances.
 """
 
 
 class Type(object):
-    def __init__(self):
-        pass
+    __slots__ = ()
+
+    def __new__(cls):
+        instance = cls.__dict__.get("_instance")
+        if instance is None:
+            instance = super().__new__(cls)
+            cls._instance = instance
+        return instance
+
+    def __reduce__(self):
+        # Unpickling goes back through __new__, so it finds the singleton.
+        return (type(self), ())
 
 
 class Unit(Type):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return "Unit"
 
-    def __eq__(self, other):
-        match other:
-            case Unit():
-                return True
-            case _:
-                return False
-
 
 class Integer(Type):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return "Integer"
 
-    def __eq__(self, other):
-        match other:
-            case Integer():
-                return True
-            case _:
-                return False
-
 
 class FloatingPoint(Type):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return "FloatingPoint"
 
-    def __eq__(self, other):
-        match other:
-            case FloatingPoint():
-                return True
-            case _:
-                return False
-
 
 class String(Type):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return "String"
 
-    def __eq__(self, other):
-        match other:
-            case String():
-                return True
-            case _:
-                return False
-
 
 class Boolean(Type):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
     def __repr__(self):
         return "Boolean"
 
-    def __eq__(self, other):
-        match other:
-            case Boolean():
-                return True
-            case _:
-                return False
+
+UNIT = Unit()
+INTEGER = Integer()
+FLOATING_POINT = FloatingPoint()
+STRING = String()
+BOOLEAN = Boolean()
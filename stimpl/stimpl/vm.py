@@ -0,0 +1,462 @@
+from array import array
+from typing import Any, Generator, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.operations import *
+from stimpl.runtime import State, RunOptions, DEFAULT_OPTIONS, Budget
+from stimpl.typecheck import check
+from stimpl.frame import load_frame, store_frame
+
+"""
+Bytecode virtual machine.
+
+lower() flattens a program into an instruction stream: an array of
+(opcode, argument) integer pairs plus a pool of constants and a pool of
+variable names. Bytecode.execute runs that stream in a single dispatch
+loop over an explicit value stack, so neither lowering nor execution
+recurses in Python and arbitrarily deep programs run.
+
+The name pool doubles as a slot map: with the frame option, LOAD and
+STORE become LOAD_FAST and STORE_FAST on a flat frame (see stimpl.frame).
+With the short_circuit option the program is lowered again with an
+AND_THEN or OR_ELSE jump between the operands of every And and Or.
+"""
+
+__all__ = ['Bytecode', 'Continuation', 'lower', 'disassemble']
+
+# Opcodes.
+CONST = 0              # push constants[arg]
+LOAD = 1               # push the binding of names[arg]
+STORE = 2              # assign the top of the stack to names[arg]
+POP = 3                # drop the top of the stack
+PRINT = 4              # print the top of the stack, leaving it there
+BINARY = 5             # pop right and left, push OPERATIONS[arg](left, right)
+NOT = 6                # negate the top of the stack
+JUMP = 7               # continue at arg
+IF_FALSE = 8           # pop a Boolean condition; jump to arg if it is false
+WHILE_ENTER = 9        # pop a Boolean loop condition; jump to arg if it is false
+WHILE_BACK = 10        # pop the loop condition; jump to arg if it is true
+UNHANDLED = 11         # raise for an expression that cannot be evaluated
+LOAD_FAST = 12         # push frame slot arg
+STORE_FAST = 13        # assign the top of the stack to frame slot arg
+AND_THEN = 14          # jump to arg, keeping it, if the top is Boolean False
+OR_ELSE = 15           # jump to arg, keeping it, if the top is Boolean True
+
+OPCODE_NAMES = ["CONST", "LOAD", "STORE", "POP", "PRINT", "BINARY", "NOT",
+                "JUMP", "IF_FALSE", "WHILE_ENTER", "WHILE_BACK", "UNHANDLED",
+                "LOAD_FAST", "STORE_FAST", "AND_THEN", "OR_ELSE"]
+
+OPERATIONS = [Add, Subtract, Multiply, Divide, And,
+              Or, Lt, Lte, Gt, Gte, Eq, Ne]
+_OPERATION_INDEX = {operator: index for index,
+                    operator in enumerate(OPERATIONS)}
+
+
+class Bytecode(object):
+    def __init__(self, program: Expr, code: array, constants: List[Tuple[Any, Type]], names: List[str],
+                 short_circuit: bool = False) -> None:
+        self.program = program
+        self.code = code
+        self.constants = constants
+        self.names = names
+        self.short_circuit = short_circuit
+        self.temporaries = temporary_names(program)
+        self.type_report = None
+        # Code for other options, by (short_circuit, frame).
+        self._codes = {(short_circuit, False): code}
+
+    def execute(self, state: State, options: RunOptions = DEFAULT_OPTIONS) -> Tuple[Any, Type, State]:
+        # Without pause_every the steps never pause: the first next()
+        # runs the whole program.
+        try:
+            next(self.steps(state, options))
+        except StopIteration as finished:
+            return finished.value
+        raise AssertionError("A run without pause_every paused.")
+
+    def steps(self, state: State, options: RunOptions = DEFAULT_OPTIONS, pause_every: Optional[int] = None,
+              resume: Optional['Continuation'] = None) -> Generator['Continuation', None, Tuple[Any, Type, State]]:
+        """
+        Runs the program as a generator that pauses after every
+        pause_every steps -- While iterations, as a Budget counts them --
+        yielding where it paused, and returns the program's value, type
+        and final state. With resume, the run carries on from a
+        continuation instead of starting (state is then ignored).
+        """
+        if options.short_circuit:
+            # The VM keeps its own type checks; it only needs the verdict.
+            if self.type_report is None:
+                self.type_report = check(self.program)
+            self.type_report.verify()
+
+        code = self.variant_code(options)
+        constants = self.constants
+        names = self.names
+        operations = [BINARY_OPERATIONS[operator] for operator in OPERATIONS]
+        compact_every = options.compact_every
+        budget = options.budget
+        if pause_every is not None:
+            # Pauses come where steps are charged, so the loop only ever
+            # checks for one of them.
+            budget = _Pacer(pause_every, budget)
+
+        # (state at loop entry, iterations) for every While being run,
+        # only tracked when compacting.
+        loops = []
+        stack = []
+        pc = 0
+        initial_state = None
+        if resume is not None:
+            pc, stack, state, loops, initial_state = \
+                resume.pc, resume.stack, resume.state, resume.loops, resume.base
+
+        if options.frame:
+            slots = {variable_name: slot for slot,
+                     variable_name in enumerate(names)}
+            if resume is None:
+                initial_state = state
+                state = load_frame(slots, state)
+            compact_every = None
+
+        push = stack.append
+        pop = stack.pop
+
+        end = len(code)
+        while pc < end:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+
+            if op == LOAD:
+                value = state.get_value(names[arg])
+                if value is None:
+                    raise unassigned_error(names[arg])
+                push(value)
+            elif op == LOAD_FAST:
+                value = state[arg]
+                if value is None:
+                    raise unassigned_error(names[arg])
+                push(value)
+            elif op == CONST:
+                push(constants[arg])
+            elif op == BINARY:
+                right_value, right_type = pop()
+                left_value, left_type = pop()
+                push(operations[arg].apply(left_value,
+                     left_type, right_value, right_type))
+            elif op == STORE:
+                value, value_type = stack[-1]
+                variable_name = names[arg]
+                existing = state.get_value(variable_name)
+                if existing is not None and type(existing[1]) is not type(value_type):
+                    raise assignment_error(value_type, existing[1])
+                state = state.set_value(variable_name, value, value_type)
+            elif op == STORE_FAST:
+                binding = stack[-1]
+                existing = state[arg]
+                if existing is not None and type(existing[1]) is not type(binding[1]):
+                    raise assignment_error(binding[1], existing[1])
+                state[arg] = binding
+            elif op == POP:
+                pop()
+            elif op == WHILE_BACK:
+                if pop()[0]:
+                    pc = arg
+                    if compact_every:
+                        loop_state, iterations = loops[-1]
+                        iterations += 1
+                        if iterations % compact_every == 0:
+                            state = state.compact(loop_state)
+                        loops[-1] = (loop_state, iterations)
+                    # The run pauses between instructions, with nothing
+                    # left to do for this one.
+                    if budget is not None and budget.step(state):
+                        yield Continuation(pc, stack, state, loops, initial_state)
+                else:
+                    if compact_every:
+                        loops.pop()
+                    push((False, BOOLEAN))
+            elif op == IF_FALSE:
+                value, value_type = pop()
+                if type(value_type) is not Boolean:
+                    raise condition_error("if")
+                if not value:
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == WHILE_ENTER:
+                value, value_type = pop()
+                if type(value_type) is not Boolean:
+                    raise condition_error("while")
+                if value:
+                    if compact_every:
+                        loops.append((state, 0))
+                    if budget is not None and budget.step(state):
+                        yield Continuation(pc, stack, state, loops, initial_state)
+                else:
+                    push((False, BOOLEAN))
+                    pc = arg
+            elif op == NOT:
+                push(not_value(*pop()))
+            elif op == PRINT:
+                print_value(*stack[-1])
+            elif op == AND_THEN:
+                value, value_type = stack[-1]
+                if value_type is BOOLEAN and not value:
+                    pc = arg
+            elif op == OR_ELSE:
+                value, value_type = stack[-1]
+                if value_type is BOOLEAN and value:
+                    pc = arg
+            elif op == UNHANDLED:
+                raise InterpSyntaxError("Unhandled!")
+
+        value, value_type = pop()
+        if options.frame:
+            state = store_frame(slots, state, initial_state)
+        return (value, value_type, state)
+
+    def variant_code(self, options: RunOptions) -> array:
+        """
+        The code to run with options, lowered or rewritten on first use.
+        """
+        key = (options.short_circuit, options.frame)
+        code = self._codes.get(key)
+        if code is None:
+            if options.frame:
+                code = _frame_code(self.variant_code(
+                    RunOptions(short_circuit=options.short_circuit)))
+            else:
+                # Lowering is deterministic, so the pools come out the same.
+                code = lower(self.program, options.short_circuit).code
+            self._codes[key] = code
+        return code
+
+    def frame_code(self) -> array:
+        """
+        The code with every variable access turned into a frame access.
+        """
+        return self.variant_code(RunOptions(short_circuit=self.short_circuit, frame=True))
+
+    def __repr__(self) -> str:
+        return disassemble(self)
+
+
+class Continuation(object):
+    """
+    Where a paused run of bytecode is: the next instruction, the value
+    stack, the state (with the frame option, a frame, and base is the
+    State it was loaded from) and, when compacting, the state each While
+    being run was entered in and its iterations so far. It refers to the
+    run's own objects, so it only describes the run while it is paused.
+    """
+
+    def __init__(self, pc: int, stack: List[Tuple[Any, Type]], state: Any,
+                 loops: List[Tuple[Any, int]], base: Optional[State] = None) -> None:
+        self.pc = pc
+        self.stack = stack
+        self.state = state
+        self.loops = loops
+        self.base = base
+
+
+class _Pacer(object):
+    """
+    The budget of a run that pauses: charges the run's own budget, if it
+    has one, and says when pause_every more steps have been taken.
+    """
+
+    def __init__(self, pause_every: int, budget: Optional[Budget]) -> None:
+        self.pause_every = pause_every
+        self.left = pause_every
+        self.budget = budget
+
+    def step(self, state: Any) -> bool:
+        if self.budget is not None:
+            self.budget.step(state)
+        self.left -= 1
+        if self.left:
+            return False
+        self.left = self.pause_every
+        return True
+
+
+def _frame_code(code: array) -> array:
+    code = array('i', code)
+    for pc in range(0, len(code), 2):
+        if code[pc] == LOAD:
+            code[pc] = LOAD_FAST
+        elif code[pc] == STORE:
+            code[pc] = STORE_FAST
+    return code
+
+
+def lower(program: Expr, short_circuit: bool = False) -> Bytecode:
+    """
+    Translates program into bytecode without recursing on its depth.
+    """
+    code = array('i')
+    constants: List[Tuple[Any, Type]] = []
+    constant_index = {}
+    names: List[str] = []
+    name_index = {}
+
+    def emit(op, arg=0):
+        code.append(op)
+        code.append(arg)
+        return len(code) - 1
+
+    def constant(value, value_type):
+        # Pool by what makes two literals the same: 1 == 1.0 == True and
+        # 0.0 == -0.0 in Python.
+        key = (literal_key(value), type(value_type))
+        if key not in constant_index:
+            constant_index[key] = len(constants)
+            constants.append((value, value_type))
+        return constant_index[key]
+
+    def name(variable_name):
+        if variable_name not in name_index:
+            name_index[variable_name] = len(names)
+            names.append(variable_name)
+        return name_index[variable_name]
+
+    def patch(slot):
+        # Point the argument at slot to the next instruction.
+        code[slot] = len(code)
+
+    # Work items are expressions still to be lowered or callables that
+    # emit code once everything pushed after them has been lowered.
+    work = [program]
+    while work:
+        item = work.pop()
+        if callable(item):
+            item()
+            continue
+
+        match item:
+            case Ren():
+                emit(CONST, constant(None, UNIT))
+
+            case IntLiteral(literal=l):
+                emit(CONST, constant(l, INTEGER))
+
+            case FloatingPointLiteral(literal=l):
+                emit(CONST, constant(l, FLOATING_POINT))
+
+            case StringLiteral(literal=l):
+                emit(CONST, constant(l, STRING))
+
+            case BooleanLiteral(literal=l):
+                emit(CONST, constant(l, BOOLEAN))
+
+            case Print(to_print=to_print):
+                work.append(lambda: emit(PRINT))
+                work.append(to_print)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                if len(exprs) == 0:
+                    emit(CONST, constant(None, UNIT))
+                for index in reversed(range(len(exprs))):
+                    work.append(exprs[index])
+                    if index > 0:
+                        work.append(lambda: emit(POP))
+
+            case Variable(variable_name=variable_name):
+                emit(LOAD, name(variable_name))
+
+            case Assign(variable=variable, value=value):
+                index = name(variable.variable_name)
+                work.append(lambda index=index: emit(STORE, index))
+                work.append(value)
+
+            case And(left=left, right=right) | Or(left=left, right=right) if short_circuit and type(item) in _OPERATION_INDEX:
+                index = _OPERATION_INDEX[type(item)]
+                slots = {}
+
+                def decide(slots=slots, op=OR_ELSE if isinstance(item, Or) else AND_THEN):
+                    slots["decide"] = emit(op)
+
+                def apply(index=index, slots=slots):
+                    emit(BINARY, index)
+                    patch(slots["decide"])
+
+                work.append(apply)
+                work.append(right)
+                work.append(decide)
+                work.append(left)
+
+            case BinaryOperator(left=left, right=right) if type(item) in _OPERATION_INDEX:
+                index = _OPERATION_INDEX[type(item)]
+                work.append(lambda index=index: emit(BINARY, index))
+                work.append(right)
+                work.append(left)
+
+            case Not(expr=expr):
+                work.append(lambda: emit(NOT))
+                work.append(expr)
+
+            case If(condition=condition, true=true, false=false):
+                slots = {}
+
+                def branch(slots=slots):
+                    slots["if_false"] = emit(IF_FALSE)
+
+                def skip_false(slots=slots):
+                    slots["jump"] = emit(JUMP)
+                    patch(slots["if_false"])
+
+                work.append(lambda slots=slots: patch(slots["jump"]))
+                work.append(false)
+                work.append(skip_false)
+                work.append(true)
+                work.append(branch)
+                work.append(condition)
+
+            case While(condition=condition, body=body):
+                slots = {}
+
+                def enter(slots=slots):
+                    slots["enter"] = emit(WHILE_ENTER)
+                    slots["body"] = len(code)
+
+                def back(slots=slots):
+                    emit(WHILE_BACK, slots["body"])
+                    patch(slots["enter"])
+
+                work.append(back)
+                work.append(condition)
+                work.append(lambda: emit(POP))
+                work.append(body)
+                work.append(enter)
+                work.append(condition)
+
+            case _:
+                emit(UNHANDLED)
+
+    return Bytecode(program, code, constants, names, short_circuit)
+
+
+def disassemble(bytecode: Bytecode) -> str:
+    """
+    Renders bytecode one instruction per line.
+    """
+    lines = []
+    code = bytecode.code
+    for pc in range(0, len(code), 2):
+        op = code[pc]
+        arg = code[pc + 1]
+        line = f"{pc:>6} {OPCODE_NAMES[op]:<12}"
+        if op == CONST:
+            value, value_type = bytecode.constants[arg]
+            line += f"{arg:<6} ({value!r}, {value_type})"
+        elif op in (LOAD, STORE, LOAD_FAST, STORE_FAST):
+            line += f"{arg:<6} ({bytecode.names[arg]})"
+        elif op == BINARY:
+            line += f"{arg:<6} ({OPERATIONS[arg].__name__})"
+        elif op in (JUMP, IF_FALSE, WHILE_ENTER, WHILE_BACK, AND_THEN, OR_ELSE):
+            line += f"{arg}"
+        lines.append(line.rstrip())
+    return "\n".join(lines)
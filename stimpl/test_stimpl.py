@@ -1,9 +1,58 @@
 from stimpl.expression import BooleanLiteral
 from stimpl.robustness import run_stimpl_robustness_tests
 from stimpl.test import run_stimpl_sanity_tests
-from stimpl.test_state import test_state_implementation
+from stimpl.test_compiler import test_compiled_programs
+from stimpl.test_iterative import test_iterative
+from stimpl.test_vm import test_vm
+from stimpl.test_typecheck import test_typecheck
+from stimpl.test_frame import test_frame
+from stimpl.test_optimizer import test_optimizer, test_hoist
+from stimpl.test_short_circuit import test_short_circuit
+from stimpl.test_jit import test_jit
+from stimpl.test_transpile import test_transpile
+from stimpl.test_serialize import test_serialize
+from stimpl.test_batch import test_batch
+from stimpl.test_parallel import test_parallel, test_pickling
+from stimpl.test_budget import test_budget
+from stimpl.test_profiler import test_profiler
+from stimpl.test_hooks import test_hooks, test_batching_hooks
+from stimpl.test_output import test_output
+from stimpl.test_rope import test_rope
+from stimpl.test_async import test_async
+from stimpl.test_stepping import test_stepping
+from stimpl.test_interning import test_structural_equality, test_interning
+from stimpl.test_types import test_types
+from stimpl.test_state import test_state_implementation, test_hash_trie_state_implementation, test_hash_trie_collisions, test_state_compaction
 
 if __name__=='__main__':
+  test_types()
   test_state_implementation()
+  test_hash_trie_state_implementation()
+  test_hash_trie_collisions()
+  test_state_compaction()
   run_stimpl_sanity_tests()
-  run_stimpl_robustness_tests()
\ No newline at end of file
+  run_stimpl_robustness_tests()
+  test_iterative()
+  test_compiled_programs()
+  test_vm()
+  test_typecheck()
+  test_frame()
+  test_optimizer()
+  test_hoist()
+  test_short_circuit()
+  test_jit()
+  test_transpile()
+  test_serialize()
+  test_batch()
+  test_pickling()
+  test_parallel()
+  test_budget()
+  test_profiler()
+  test_hooks()
+  test_batching_hooks()
+  test_output()
+  test_rope()
+  test_async()
+  test_stepping()
+  test_structural_equality()
+  test_interning()
\ No newline at end of file